@@ -0,0 +1,51 @@
+import time
+
+from services.inference_batcher import (
+    PRIORITY_INTERACTIVE,
+    PRIORITY_STANDARD,
+    PRIORITY_STREAM,
+    Admission,
+    current_admission,
+)
+
+TIMEOUT_HEADER = b"x-request-timeout-ms"
+
+
+class AdmissionMiddleware:
+    # Plain ASGI so streaming responses pass through untouched; stamps each request before any route code runs
+    def __init__(self, app, default_deadline_ms: float, priority_lanes: bool = True):
+        self.app = app
+        self.default_deadline_ms = default_deadline_ms
+        self.priority_lanes = priority_lanes
+
+    def _budget_ms(self, scope) -> float:
+        for name, value in scope.get("headers", ()):
+            if name == TIMEOUT_HEADER:
+                try:
+                    return float(value.decode("latin-1"))
+                except ValueError:
+                    break
+        return self.default_deadline_ms
+
+    def _admission(self, scope) -> Admission:
+        if scope["type"] == "websocket":
+            # A stream has no overall budget and runs behind request traffic; each frame sets its own deadline
+            return Admission(deadline=None, priority=PRIORITY_STREAM)
+        # The clock starts on arrival, so download and decode time come out of the same budget
+        budget_ms = self._budget_ms(scope)
+        deadline = time.perf_counter() + budget_ms / 1000.0 if budget_ms > 0 else None
+        priority = PRIORITY_STANDARD
+        if self.priority_lanes and scope["path"].startswith("/verify"):
+            priority = PRIORITY_INTERACTIVE
+        return Admission(deadline=deadline, priority=priority)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        token = current_admission.set(self._admission(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_admission.reset(token)
@@ -1,22 +1,116 @@
 from __future__ import annotations
 
-from fastapi.responses import JSONResponse
+import base64
 
+import numpy as np
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
 
-def failure_to_response(payload: dict) -> JSONResponse:
+from core.metrics import metrics
+from services.inference_batcher import AdmissionRejected
+
+# Little-endian on the wire regardless of the host
+_EMBEDDING_ENCODINGS = {
+    "base64": ("<f4", "float32-le"),
+    "base64_f16": ("<f2", "float16-le"),
+}
+EMBEDDING_FORMATS = ("json", "binary", *_EMBEDDING_ENCODINGS)
+
+_CATEGORY_STATUS = {
+    "no_face": 422,
+    "multiple_faces": 422,
+    "decode_failed": 400,
+    "collection_not_found": 503,
+    "index_rebuilding": 503,
+    "payload_too_large": 413,
+    "not_found": 404,
+    "other": 400,
+}
+
+
+# Categories for failures raised as HTTPException (downloads, uploads, pool), which skip failure_to_response
+_STATUS_CATEGORY = {
+    400: "bad_request",
+    404: "not_found",
+    408: "download_timeout",
+    413: "payload_too_large",
+    422: "invalid_request",
+    503: "unavailable",
+    504: "timeout",
+}
+
+
+def failure_category(payload: dict) -> str:
     error_text = str(payload.get("error") or payload.get("message") or "").strip().lower()
 
-    if "no face detected" in error_text or "multiple faces detected" in error_text:
-        status_code = 422
-    elif "failed to decode" in error_text:
-        status_code = 400
-    elif "collection not found" in error_text:
-        status_code = 503
-    elif "payload too large" in error_text:
-        status_code = 413
-    elif "not found" in error_text:
-        status_code = 404
-    else:
-        status_code = 400
+    if "no face detected" in error_text:
+        return "no_face"
+    if "multiple faces detected" in error_text:
+        return "multiple_faces"
+    if "failed to decode" in error_text:
+        return "decode_failed"
+    if "collection not found" in error_text:
+        return "collection_not_found"
+    if "index rebuild in progress" in error_text:
+        return "index_rebuilding"
+    if "payload too large" in error_text:
+        return "payload_too_large"
+    if "not found" in error_text:
+        return "not_found"
+    return "other"
+
+
+def failure_status_code(payload: dict) -> int:
+    return _CATEGORY_STATUS[failure_category(payload)]
+
+
+def record_failure(payload: dict) -> int:
+    category = failure_category(payload)
+    metrics.inc_failure(category)
+    return _CATEGORY_STATUS[category]
 
-    return JSONResponse(status_code=status_code, content=payload)
+
+def record_http_failure(exc: HTTPException) -> None:
+    # Shed requests are already counted as overloaded / deadline_exceeded when the batcher rejects them
+    if isinstance(exc, AdmissionRejected):
+        return
+    default = "server_error" if exc.status_code >= 500 else "other"
+    metrics.inc_failure(_STATUS_CATEGORY.get(exc.status_code, default))
+
+
+def failure_to_response(payload: dict) -> JSONResponse:
+    return JSONResponse(status_code=record_failure(payload), content=payload)
+
+
+def embedding_format(requested: str | None, accept: str | None) -> str:
+    if requested:
+        if requested not in EMBEDDING_FORMATS:
+            raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(EMBEDDING_FORMATS)}")
+        return requested
+    if accept and "application/octet-stream" in accept:
+        return "binary"
+    return "json"
+
+
+def embedding_response(result: dict, output_format: str) -> Response:
+    embedding = np.ascontiguousarray(result["embedding"], dtype=np.float32)
+
+    if output_format == "binary":
+        headers = {"X-Embedding-Dtype": "float32-le", "X-Embedding-Dim": str(embedding.size)}
+        if result.get("det_score") is not None:
+            headers["X-Detection-Score"] = str(result["det_score"])
+        if result.get("bbox") is not None:
+            headers["X-Bbox"] = ",".join(str(float(value)) for value in result["bbox"])
+        return Response(embedding.astype("<f4").tobytes(), media_type="application/octet-stream", headers=headers)
+
+    payload = {key: value for key, value in result.items() if key != "embedding"}
+    if output_format == "json":
+        # orjson writes the numpy array directly, skipping the per-float Python list
+        payload["embedding"] = embedding
+    else:
+        dtype, label = _EMBEDDING_ENCODINGS[output_format]
+        payload["embedding"] = base64.b64encode(embedding.astype(dtype).tobytes()).decode("ascii")
+        payload["embedding_dtype"] = label
+        payload["embedding_dim"] = embedding.size
+    return Response(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json")
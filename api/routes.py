@@ -1,96 +1,365 @@
+import asyncio
+import json
+import os
+
 import anyio
-from fastapi import APIRouter, Form, HTTPException
-from api.responses import failure_to_response
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile, WebSocket
+from fastapi.responses import FileResponse, StreamingResponse
+from api.responses import (
+    embedding_format,
+    embedding_response,
+    failure_to_response,
+    record_failure,
+    record_http_failure,
+)
+from api.tenancy import resolve_tenant
 from core.container import container
 from core.config import settings
-from services.image_loader import download_image_from_url
+from services.image_loader import read_image_upload
+from services.milvus_db import DEFAULT_INDEX_PARAMS
 
 router = APIRouter()
 
+
+def _optional_float(value, name: str):
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid {name}")
+
+
+async def _enroll_extracted(employee_id: str, result: dict, tenant: str | None = None):
+    if not result.get("success", False):
+        return failure_to_response(result)
+
+    insert_result = await container.milvus.insert_embedding(employee_id, result["embedding"], tenant)
+
+    return {
+        "success": True,
+        "employee_id": employee_id,
+        "message": "Employee enrolled successfully",
+        "detection_score": result.get("det_score"),
+        "insert_result": insert_result
+    }
+
+
+async def _verify_extracted(extract_result: dict, threshold, tenant: str | None = None):
+    if not extract_result.get("success", False):
+        return failure_to_response(extract_result)
+
+    embedding = extract_result["embedding"]
+    threshold = threshold if threshold else settings.SIMILARITY_THRESHOLD
+
+    search_result = await container.milvus.search_similar(embedding, threshold, tenant=tenant)
+
+    if not search_result.get("success", False):
+        return failure_to_response(search_result)
+
+    if not search_result.get("matched", False):
+        return {
+            "success": True,
+            "matched": False,
+            "similarity": search_result.get("similarity", 0.0),
+            "threshold": threshold,
+            "message": "No match found"
+        }
+
+    return {
+        "success": True,
+        "matched": True,
+        "employee_id": search_result["employee_id"],
+        "similarity": search_result["similarity"],
+        "threshold": threshold,
+        "detection_score": extract_result.get("det_score")
+    }
+
+
+def _extracted_response(result: dict, output_format: str = "json"):
+    if not result.get("success", False):
+        return failure_to_response(result)
+
+    return embedding_response(result, output_format)
+
+
 @router.post("/enroll", tags=["Enroll"])
 async def enroll_employee(
     employee_id: str = Form(...),
-    image_url: str = Form(...)
+    image_url: str = Form(...),
+    tenant: str = Form(None),
 ):
     try:
-        face = container.face_service
-        db = container.milvus_db
+        tenant = resolve_tenant(tenant)
+        result = await container.pipeline.from_url(image_url)
+        return await _enroll_extracted(employee_id, result, tenant)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/enroll/image", tags=["Enroll"])
+async def enroll_employee_image(request: Request):
+    try:
+        image, fields = await read_image_upload(request, settings.MAX_IMAGE_BYTES)
+        employee_id = fields.get("employee_id")
+        if not employee_id:
+            raise HTTPException(status_code=422, detail="employee_id is required")
+        tenant = resolve_tenant(fields.get("tenant"))
 
-        bytes_img = await download_image_from_url(image_url, settings.MAX_IMAGE_BYTES)
+        result = await container.pipeline.from_bytes(image)
+        return await _enroll_extracted(employee_id, result, tenant)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        async with container.infer_semaphore:
-            result = await anyio.to_thread.run_sync(face.extract_embedding_from_bytes, bytes_img)
 
-        if not result.get("success", False):
-            return failure_to_response(result)
+@router.post("/enroll/bulk", tags=["Enroll"])
+async def bulk_enroll_employees(file: UploadFile = File(...)):
+    try:
+        manager = container.bulk_enroll
+        job_id = manager.new_job_id()
+        suffix = ".jsonl" if (file.filename or "").endswith((".jsonl", ".ndjson")) else ".csv"
+        source_path = manager.source_path(job_id, suffix)
 
-        insert_result = await anyio.to_thread.run_sync(db.insert_embedding, employee_id, result["embedding"])
+        # Persist the upload so the job can be resumed after a crash
+        with open(source_path, "wb") as fh:
+            while chunk := await file.read(1024 * 1024):
+                await anyio.to_thread.run_sync(fh.write, chunk)
 
-        return {
-            "success": True,
-            "employee_id": employee_id,
-            "message": "Employee enrolled successfully",
-            "detection_score": result.get("det_score"),
-            "insert_result": insert_result
-        }
+        job = manager.start(job_id)
+        return {"success": True, **job.progress()}
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/enroll/bulk/{job_id}", tags=["Enroll"])
+async def bulk_enroll_progress(job_id: str):
+    job = container.bulk_enroll.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Bulk job {job_id} not found")
+    return {"success": True, **job.progress()}
+
+
+@router.post("/enroll/bulk/{job_id}/resume", tags=["Enroll"])
+async def bulk_enroll_resume(job_id: str):
+    job = container.bulk_enroll.start(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Bulk job {job_id} not found")
+    return {"success": True, **job.progress()}
+
+
+@router.get("/enroll/bulk/{job_id}/errors", tags=["Enroll"])
+async def bulk_enroll_errors(job_id: str):
+    job = container.bulk_enroll.get(job_id)
+    if job is None or not os.path.exists(job.report_path):
+        raise HTTPException(status_code=404, detail=f"No error report for bulk job {job_id}")
+    return FileResponse(job.report_path, media_type="application/x-ndjson")
+
+
 @router.post("/verify", tags=["Verify"])
 async def verify_face(
     image_url: str = Form(...),
     threshold: float = Form(None),
+    tenant: str = Form(None),
 ):
     try:
-        face = container.face_service
-        db = container.milvus_db
+        tenant = resolve_tenant(tenant)
+        extract_result = await container.pipeline.from_url(image_url)
+        return await _verify_extracted(extract_result, threshold, tenant)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        bytes_img = await download_image_from_url(image_url,settings.MAX_IMAGE_BYTES)
 
-        async with container.infer_semaphore:
-            extract_result = await anyio.to_thread.run_sync(face.extract_embedding_from_bytes, bytes_img)
+@router.post("/verify/image", tags=["Verify"])
+async def verify_face_image(request: Request):
+    try:
+        image, fields = await read_image_upload(request, settings.MAX_IMAGE_BYTES)
+        threshold = _optional_float(fields.get("threshold"), "threshold")
+        tenant = resolve_tenant(fields.get("tenant"))
 
-        if not extract_result.get("success", False):
-            return failure_to_response(extract_result)
+        extract_result = await container.pipeline.from_bytes(image)
+        return await _verify_extracted(extract_result, threshold, tenant)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/verify/batch", tags=["Verify"])
+async def verify_faces_batch(
+    image_urls: list[str] = Form(...),
+    threshold: float = Form(None),
+    tenant: str = Form(None),
+):
+    try:
+        pipeline = container.pipeline
+        db = container.milvus
+        tenant = resolve_tenant(tenant)
+
+        if len(image_urls) > settings.MAX_BATCH_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Too many images in batch (max {settings.MAX_BATCH_SIZE})"
+            )
 
-        embedding = extract_result["embedding"]
         threshold = threshold if threshold else settings.SIMILARITY_THRESHOLD
+        items = [{"image_url": url} for url in image_urls]
+
+        extract_results = await pipeline.from_urls(image_urls, settings.BATCH_DOWNLOAD_CONCURRENCY)
 
-        search_result = await anyio.to_thread.run_sync(db.search_similar, embedding, threshold)
+        extracted = []
+        for item, extract_result in zip(items, extract_results):
+            if isinstance(extract_result, HTTPException):
+                record_http_failure(extract_result)
+                item.update({"success": False, "error": extract_result.detail, "status_code": extract_result.status_code})
+            elif isinstance(extract_result, Exception):
+                item.update({"success": False, "error": str(extract_result), "status_code": 500})
+            elif not extract_result.get("success", False):
+                item.update(extract_result)
+                item["status_code"] = record_failure(extract_result)
+            else:
+                item["detection_score"] = extract_result.get("det_score")
+                extracted.append((item, extract_result["embedding"]))
 
-        if not search_result.get("success", False):
-            return failure_to_response(search_result)
+        if extracted:
+            search_result = await db.search_similar_batch(
+                [embedding for _, embedding in extracted], threshold, tenant=tenant
+            )
 
-        if not search_result.get("matched", False):
-            return {
-                "success": True,
-                "matched": False,
-                "similarity": search_result.get("similarity", 0.0),
-                "threshold": threshold,
-                "message": "No match found"
-            }
+            if not search_result.get("success", False):
+                for item, _ in extracted:
+                    item.update(search_result)
+                    item["status_code"] = record_failure(search_result)
+            else:
+                for (item, _), match in zip(extracted, search_result["results"]):
+                    item.update(match)
+                    if not match.get("matched", False):
+                        item.setdefault("similarity", 0.0)
+                        item["message"] = "No match found"
 
         return {
             "success": True,
-            "matched": True,
-            "employee_id": search_result["employee_id"],
-            "similarity": search_result["similarity"],
             "threshold": threshold,
-            "detection_score": extract_result.get("det_score")
+            "results": items,
         }
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/verify/{employee_id}", tags=["Verify"])
+async def verify_claimed_identity(
+    employee_id: str,
+    image_url: str = Form(...),
+    threshold: float = Form(None),
+    tenant: str = Form(None),
+):
+    # Declared after /verify/image and /verify/batch so those literal paths still win
+    try:
+        tenant = resolve_tenant(tenant)
+        threshold = threshold if threshold else settings.SIMILARITY_THRESHOLD
+
+        extract_result = await container.pipeline.from_url(image_url)
+        if not extract_result.get("success", False):
+            return failure_to_response(extract_result)
+
+        result = await container.milvus.verify_employee(extract_result["embedding"], employee_id, threshold, tenant)
+        if not result.get("success", False):
+            return failure_to_response(result)
+
+        return {
+            "success": True,
+            "matched": result["matched"],
+            "employee_id": employee_id,
+            "similarity": result["similarity"],
+            "threshold": threshold,
+            "detection_score": extract_result.get("det_score"),
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Stands in for an oversized frame in the mailbox so it is reported without being kept in memory
+_FRAME_TOO_LARGE = object()
+
+
+@router.websocket("/ws/verify")
+async def verify_stream(websocket: WebSocket, threshold: float | None = None, tenant: str | None = None):
+    # Frames are binary JPEG/PNG messages; answers are JSON "match", "lost" and "error" events
+    if not hasattr(container.face_service, "detect_frame"):
+        await websocket.close(code=1011, reason="Stream verification requires INFERENCE_MODE=local")
+        return
+    try:
+        tenant = resolve_tenant(tenant)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+
+    await websocket.accept()
+    verifier = container.stream_verifier(threshold if threshold else settings.SIMILARITY_THRESHOLD, tenant)
+    # One-slot mailbox: a slow consumer skips to the newest frame instead of queueing stale ones
+    latest: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if data is None:
+                    continue
+                if len(data) > settings.MAX_IMAGE_BYTES:
+                    data = _FRAME_TOO_LARGE
+                if latest.full():
+                    latest.get_nowait()
+                latest.put_nowait(data)
+        finally:
+            if latest.full():
+                latest.get_nowait()
+            latest.put_nowait(None)
+
+    async def send(events: list[dict]) -> bool:
+        try:
+            for event in events:
+                await websocket.send_json(event)
+        except Exception:
+            # A closed socket fails sends with WebSocketDisconnect, RuntimeError or a transport error alike
+            return False
+        return True
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            data = await latest.get()
+            if data is None:
+                break
+            if data is _FRAME_TOO_LARGE:
+                events = [{"event": "error", "error": "Frame too large"}]
+            elif not data:
+                events = [{"event": "error", "error": "Empty frame"}]
+            else:
+                events = await verifier.process_frame(data)
+            if not await send(events):
+                break
+    finally:
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
+
+
 @router.delete("/delete/{employee_id}", tags=["Delete"])
-async def delete_employee(employee_id: str):
+async def delete_employee(employee_id: str, tenant: str | None = None):
     try:
-        db = container.milvus_db
-        delete_result = await anyio.to_thread.run_sync(db.delete_by_employee_id, employee_id)
+        db = container.milvus
+        delete_result = await db.delete_by_employee_id(employee_id, resolve_tenant(tenant))
 
         if not delete_result.get("success", False):  
             return failure_to_response(delete_result)
@@ -109,29 +378,108 @@ async def delete_employee(employee_id: str):
 
 
 @router.post("/extract/embedding", tags=["Extract"])
-async def extract_embedding(image_url: str = Form(...)):
+async def extract_embedding(
+    request: Request,
+    image_url: str = Form(...),
+    output_format: str = Form(None, alias="format"),
+):
     try:
-        face = container.face_service
-        bytes_img = await download_image_from_url(image_url, settings.MAX_IMAGE_BYTES)
-
-        async with container.infer_semaphore:
-            result = face.extract_embedding_from_bytes(bytes_img)
+        output_format = embedding_format(output_format, request.headers.get("Accept"))
+        result = await container.pipeline.from_url(image_url)
+        return _extracted_response(result, output_format)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if not result.get("success", False):
-            return failure_to_response(result)
 
-        # Convert numpy to list
-        result["embedding"] = result["embedding"].tolist()
-        return result
+@router.post("/extract/embedding/image", tags=["Extract"])
+async def extract_embedding_image(request: Request):
+    try:
+        image, fields = await read_image_upload(request, settings.MAX_IMAGE_BYTES)
+        output_format = embedding_format(fields.get("format"), request.headers.get("Accept"))
+        result = await container.pipeline.from_bytes(image)
+        return _extracted_response(result, output_format)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/employees", tags=["List"])
-async def list_employees():
-    db = container.milvus_db
-    result = await anyio.to_thread.run_sync(db.list_employee_ids)
+async def list_employees(
+    cursor: str | None = None,
+    limit: int | None = None,
+    counts: bool = False,
+    stream: bool = False,
+    tenant: str | None = None,
+):
+    tenant = resolve_tenant(tenant)
+    limit = limit or settings.EMPLOYEES_PAGE_SIZE
+    if not 0 < limit <= settings.EMPLOYEES_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {settings.EMPLOYEES_MAX_PAGE_SIZE}")
+
+    db = container.milvus
+    if stream:
+        return StreamingResponse(
+            _employee_lines(db, limit, counts, cursor, tenant), media_type="application/x-ndjson"
+        )
+
+    result = await db.list_employee_ids(cursor, limit, counts, tenant)
+    if not result.get("success", False):
+        return failure_to_response(result)
+    return result
+
+
+async def _employee_lines(db, page_size: int, counts: bool, cursor: str | None, tenant: str | None):
+    async for page in db.iter_employee_pages(page_size, counts, cursor, tenant):
+        if not page.get("success", False):
+            # Headers are already sent, so a failure can only be reported in-band
+            yield json.dumps({"success": False, "error": page.get("error")}) + "\n"
+            return
+        vector_counts = page.get("vector_counts", {})
+        for employee_id in page["employee_ids"]:
+            line = {"employee_id": employee_id}
+            if counts:
+                line["vector_count"] = vector_counts[employee_id]
+            yield json.dumps(line) + "\n"
+
+
+@router.get("/cache/stats", tags=["Cache"])
+async def embedding_cache_stats():
+    cache = container.embedding_cache
+    downloads = container.fetcher.stats()
+    vector_cache = container.vector_cache
+    extra = {
+        "downloads": downloads,
+        "employee_vectors": vector_cache.stats() if vector_cache is not None else None,
+        "write_buffer": container.write_buffer.stats() if container.write_buffer is not None else None,
+    }
+    if cache is None:
+        return {"success": True, "enabled": False, **extra}
+    return {"success": True, "enabled": True, **cache.stats(), **extra}
+
+
+@router.get("/index/status", tags=["Index"])
+async def index_status():
+    result = await container.milvus.index_status()
+    if not result.get("success", False):
+        return failure_to_response(result)
+    return result
+
+
+@router.post("/index/rebuild", tags=["Index"])
+async def rebuild_index(index_type: str = Form(None), params: str = Form(None)):
+    # Without an explicit index_type the size-appropriate configured index is built
+    if index_type is not None and index_type not in DEFAULT_INDEX_PARAMS:
+        raise HTTPException(status_code=422, detail=f"Unsupported index_type {index_type}")
+    try:
+        parsed_params = json.loads(params) if params else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid params")
+    if parsed_params is not None and not isinstance(parsed_params, dict):
+        raise HTTPException(status_code=422, detail="Invalid params")
+
+    result = await container.milvus.rebuild_index(index_type, parsed_params)
     if not result.get("success", False):
         return failure_to_response(result)
     return result
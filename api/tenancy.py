@@ -0,0 +1,14 @@
+from fastapi import HTTPException
+
+from core.config import settings
+
+
+def resolve_tenant(value):
+    # With multi-tenancy every gallery operation is scoped, so a missing tenant must not fall back to all of them
+    if not settings.MULTI_TENANT:
+        if value:
+            raise HTTPException(status_code=422, detail="tenant given but MULTI_TENANT is disabled")
+        return None
+    if not value:
+        raise HTTPException(status_code=400, detail="tenant is required")
+    return value
@@ -1,16 +1,37 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import PlainTextResponse
 
+from api.admission import AdmissionMiddleware
+from api.responses import record_http_failure
 from api.routes import router
+from core.config import settings
 from core.container import container
+from core.metrics import metrics
 
 
 def create_app():
     app = FastAPI(title="Face Recognition API")
     app.include_router(router)
+    app.add_middleware(
+        AdmissionMiddleware,
+        default_deadline_ms=settings.INFER_DEFAULT_DEADLINE_MS,
+        priority_lanes=settings.INFER_PRIORITY_LANES,
+    )
+
+    @app.exception_handler(HTTPException)
+    async def count_http_failure(request, exc: HTTPException):
+        record_http_failure(exc)
+        return await http_exception_handler(request, exc)
 
     @app.on_event("startup")
     async def startup_event():
         container.startup()
+        await container.start_async()
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await container.shutdown()
 
     @app.get("/health")
     async def health():
@@ -24,4 +45,8 @@ def create_app():
             "milvus": milvus_health,
         }
 
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
     return app
@@ -0,0 +1,240 @@
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from services.async_milvus_db import AsyncMilvusDB
+from services.milvus_db import MilvusDB, employee_page, index_spec, parse_cursor
+
+
+class InMemoryMilvusDB:
+    def __init__(self, dim: int = 512, latency_ms: float = 0.0, alias: str = "default", multi_tenant: bool = False):
+        self.alias = alias
+        self.multi_tenant = multi_tenant
+        self.template_mode = False
+        self.templates_created = False
+        self.template_repair = False
+        self.max_exemplars = 0
+        self.inline_reconnect = True
+        self.collection_name = "face_embeddings"
+        self.templates_name = f"{self.collection_name}_templates"
+        self.num_partitions = 0
+        self.dim = dim
+        self.host = None
+        self.port = None
+        self.connected = False
+        self.gallery = None
+        self.vector_cache = None
+        self.options = {}
+        # Brute force over every row, i.e. what a FLAT index does
+        self.index = index_spec("FLAT")
+        self.index_tiers = []
+        self.active_index = self.index
+        self.rebuilding = False
+        self._latency_s = latency_ms / 1000.0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._rows: dict[int, tuple[str, np.ndarray, str | None]] = {}
+
+    def _rpc(self) -> None:
+        # Emulates the network round trip of a remote Milvus
+        if self._latency_s:
+            time.sleep(self._latency_s)
+
+    def attach_gallery(self, gallery) -> None:
+        self.gallery = gallery
+
+    def attach_vector_cache(self, vector_cache) -> None:
+        self.vector_cache = vector_cache
+
+    def connect(self, host, port, retries: int = 3, delay: float = 2.0):
+        self.host = host
+        self.port = port
+        self.connected = True
+        return True
+
+    def reconnect(self) -> bool:
+        self.connected = True
+        return True
+
+    def create_collection(self):
+        return self
+
+    def get_collection(self):
+        return self
+
+    def _visible(self, tenant) -> list[tuple[int, tuple]]:
+        with self._lock:
+            return [(pk, row) for pk, row in self._rows.items() if tenant is None or row[2] == tenant]
+
+    def insert_embedding(self, employee_id, embedding, tenant=None):
+        return self.insert_embeddings([employee_id], [embedding], tenants=[tenant])
+
+    def insert_embeddings(self, employee_ids, embeddings, flush: bool = True, tenants=None):
+        if self.multi_tenant and (tenants is None or not all(tenants)):
+            return {"success": False, "error": "Tenant is required"}
+
+        self._rpc()
+        tenants = list(tenants) if tenants is not None else [None] * len(employee_ids)
+        with self._lock:
+            pks = []
+            for employee_id, embedding, tenant in zip(employee_ids, embeddings, tenants):
+                pk = next(self._ids)
+                self._rows[pk] = (employee_id, np.asarray(embedding, dtype=np.float32), tenant)
+                pks.append(pk)
+
+        if self.gallery is not None:
+            self.gallery.add(pks, employee_ids, embeddings, tenants)
+        return {"success": True, "insert_count": len(pks)}
+
+    def flush(self) -> dict:
+        self._rpc()
+        return {"success": True}
+
+    def search_similar(self, embedding, threshold, limit=1, tenant=None, exclude=None, use_gallery=True):
+        result = self.search_similar_batch([embedding], threshold, limit, tenant, exclude, use_gallery)
+        return result["results"][0]
+
+    def search_similar_batch(self, embeddings, threshold, limit=1, tenant=None, exclude=None, use_gallery=True):
+        return MilvusDB.search_similar_batch(self, embeddings, threshold, limit, tenant, exclude, use_gallery)
+
+    def recheck_misses(self, embeddings, thresholds, tenant, results):
+        return MilvusDB.recheck_misses(self, embeddings, thresholds, tenant, results)
+
+    def _search_milvus(self, embeddings, thresholds, limit, tenant, exclude):
+        self._rpc()
+        rows = [row for _, row in self._visible(tenant) if not exclude or row[0] not in exclude]
+
+        if not rows:
+            return {"success": True, "results": [
+                {"success": True, "matched": False, "message": "No match found"} for _ in embeddings
+            ]}
+
+        matrix = np.stack([row[1] for row in rows])
+        scores = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim) @ matrix.T
+        results = []
+        for row, idx in enumerate(np.argmax(scores, axis=1)):
+            sim = float(scores[row, idx])
+            if sim >= thresholds[row]:
+                results.append({"success": True, "matched": True, "employee_id": rows[idx][0], "similarity": sim})
+            else:
+                results.append({"success": True, "matched": False, "similarity": sim})
+        return {"success": True, "results": results}
+
+    def _employee_vectors(self, employee_id: str, tenant) -> np.ndarray:
+        self._rpc()
+        vectors = [row[1] for _, row in self._visible(tenant) if row[0] == employee_id]
+        return np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+
+    def verify_employee(self, embedding, employee_id: str, threshold, tenant=None) -> dict:
+        return MilvusDB.verify_employee(self, embedding, employee_id, threshold, tenant)
+
+    def delete_by_employee_id(self, employee_id: str, tenant=None, flush: bool = True) -> dict:
+        self._rpc()
+        pks = [pk for pk, row in self._visible(tenant) if row[0] == employee_id]
+        if not pks:
+            return {"success": False, "error": f"Employee {employee_id} not found"}
+        with self._lock:
+            for pk in pks:
+                self._rows.pop(pk, None)
+
+        if self.gallery is not None:
+            self.gallery.remove_employee(employee_id, tenant)
+        return {"success": True, "employee_id": employee_id}
+
+    def has_employee(self, employee_id: str, tenant=None) -> dict:
+        return MilvusDB.has_employee(self, employee_id, tenant)
+
+    def has_embedding(self, employee_id: str, embedding, tenant=None) -> dict:
+        return MilvusDB.has_embedding(self, employee_id, embedding, tenant)
+
+    def refresh_templates(self, employee_ids, tenants=None) -> dict:
+        return MilvusDB.refresh_templates(self, employee_ids, tenants)
+
+    def apply_writes(self, writes: list) -> dict:
+        return MilvusDB.apply_writes(self, writes)
+
+    def index_status(self) -> dict:
+        with self._lock:
+            num_entities = len(self._rows)
+        return {
+            "success": True,
+            "num_entities": num_entities,
+            "active": self.active_index,
+            "target": self.active_index,
+            "rebuild_recommended": False,
+        }
+
+    def rebuild_keeps_reads(self) -> bool:
+        return MilvusDB.rebuild_keeps_reads(self)
+
+    def rebuild_index(self, index_type=None, params=None) -> dict:
+        self._rpc()
+        return {"success": True, "active": self.active_index, "elapsed_s": 0.0}
+
+    def list_employee_ids(
+        self, cursor=None, limit: int = 1000, with_counts: bool = False, batch_size: int = 1000, tenant=None
+    ):
+        self._rpc()
+        try:
+            after = parse_cursor(cursor)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+
+        items = sorted(self._visible(tenant), key=lambda item: item[0])
+        rows = [(pk, row[0]) for pk, row in items if after is None or pk > after]
+        batches = (rows[idx:idx + batch_size] for idx in range(0, len(rows), batch_size))
+
+        def seen_before(employee_ids):
+            wanted = set(employee_ids)
+            return {row[0] for pk, row in items if after is not None and pk <= after and row[0] in wanted}
+
+        page, next_pk = employee_page(batches, limit, seen_before)
+        result = {"success": True, "employee_ids": page, "next_cursor": str(next_pk) if next_pk is not None else None}
+        if with_counts:
+            counts = dict.fromkeys(page, 0)
+            for _, row in items:
+                if row[0] in counts:
+                    counts[row[0]] += 1
+            result["vector_counts"] = counts
+        return result
+
+    def sync_gallery(self, batch_size: int = 1000) -> dict:
+        if self.gallery is None:
+            return {"success": False, "error": "Gallery index disabled"}
+
+        self.gallery.begin_sync()
+        items = self._visible(None)
+        self.gallery.finish_sync(
+            [pk for pk, _ in items],
+            [row[0] for _, row in items],
+            [row[1] for _, row in items] or np.empty((0, self.dim), dtype=np.float32),
+            [row[2] for _, row in items],
+        )
+        return {"success": True, "count": len(items)}
+
+    def health(self) -> dict:
+        return {"success": True, "collection": self.collection_name}
+
+
+def install_fake_milvus(container, settings, latency_ms: float = 0.0) -> InMemoryMilvusDB:
+    # Must run before the app starts so startup connects the fake instead of a real server
+    fake = InMemoryMilvusDB(
+        dim=container.milvus_db.dim, latency_ms=latency_ms, multi_tenant=container.milvus_db.multi_tenant
+    )
+    if container.gallery is not None:
+        fake.attach_gallery(container.gallery)
+
+    container.milvus_db = fake
+    container.bulk_enroll.milvus_db = fake
+    container.milvus = AsyncMilvusDB(
+        fake,
+        pool_size=1,
+        max_inflight=settings.MILVUS_MAX_INFLIGHT,
+        coalesce_window_ms=settings.MILVUS_SEARCH_COALESCE_MS,
+        max_coalesced=settings.MILVUS_MAX_COALESCED,
+        health_interval_s=settings.MILVUS_HEALTH_INTERVAL_S,
+        write_buffer=container.milvus.write_buffer,
+    )
+    return fake
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import socket
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the face recognition API")
+    parser.add_argument("--images", help="Directory of face images (default: synthetic images with one face)")
+    parser.add_argument("--synthetic-count", type=int, default=16, help="Synthetic images to generate")
+    parser.add_argument("--synthetic-size", type=int, nargs=2, default=(1280, 960), metavar=("W", "H"))
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent in-flight requests")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per verify/extract phase")
+    parser.add_argument("--phases", nargs="+", default=["enroll", "verify", "extract"],
+                        choices=["enroll", "verify", "extract"])
+    parser.add_argument("--milvus-latency-ms", type=float, default=0.0, help="Simulated Milvus RPC latency")
+    parser.add_argument("--real-milvus", action="store_true", help="Use the configured Milvus instead of the fake")
+    parser.add_argument("--cache", action="store_true", help="Keep the embedding cache enabled")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def generate_images(directory: str, count: int, size) -> None:
+    # One real face (the sample bundled with insightface) pasted at a jittered position, scale and brightness
+    # onto a noise background, so detect, embed and search all run instead of every request ending in a 422
+    import cv2
+    from insightface.data import get_image
+
+    face = get_image("Tom_Hanks_54745")
+    width, height = size
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(0)
+    for idx in range(count):
+        img = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+        scale = rng.uniform(0.35, 0.6) * min(width, height) / max(face.shape[:2])
+        patch = cv2.resize(face, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        patch = cv2.convertScaleAbs(patch, alpha=rng.uniform(0.8, 1.2), beta=rng.uniform(-20, 20))
+        top = int(rng.integers(0, height - patch.shape[0] + 1))
+        left = int(rng.integers(0, width - patch.shape[1] + 1))
+        img[top:top + patch.shape[0], left:left + patch.shape[1]] = patch
+        cv2.imwrite(os.path.join(directory, f"synthetic_{idx:04d}.jpg"), img)
+
+
+def start_image_server(directory: str) -> tuple[ThreadingHTTPServer, str]:
+    class _QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def summarize(values_s: list[float]) -> dict:
+    if not values_s:
+        return {"count": 0}
+    values_ms = np.asarray(values_s) * 1000.0
+    p50, p95, p99 = np.percentile(values_ms, [50, 95, 99])
+    return {
+        "count": len(values_s),
+        "mean_ms": float(values_ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+    }
+
+
+class StageRecorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+
+    def __call__(self, name: str, seconds: float) -> None:
+        self.samples.setdefault(name, []).append(seconds)
+
+    def reset(self) -> None:
+        self.samples = {}
+
+    def summary(self) -> dict:
+        return {name: summarize(values) for name, values in sorted(self.samples.items())}
+
+
+async def run_phase(client, requests: list[tuple[str, dict]], concurrency: int, stages: StageRecorder) -> dict:
+    stages.reset()
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def _worker():
+        while not queue.empty():
+            path, data = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, data=data)
+                status = str(response.status_code)
+            except Exception as exc:
+                status = type(exc).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(requests),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(requests) / elapsed if elapsed > 0 else 0.0,
+        "status_codes": statuses,
+        "latency": summarize(latencies),
+        "stages": stages.summary(),
+    }
+
+
+async def main_async(args) -> dict:
+    # Settings are read at import time, so the environment is prepared first
+    os.environ.setdefault("MILVUS_HOST", "127.0.0.1")
+    if not args.cache:
+        os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+    import httpx
+    import uvicorn
+
+    from app import create_app
+    from core.config import settings
+    from core.container import container
+    from core.timing import add_stage_observer
+    from benchmarks.fake_milvus import install_fake_milvus
+
+    if not args.real_milvus:
+        install_fake_milvus(container, settings, latency_ms=args.milvus_latency_ms)
+
+    images_dir = args.images
+    if images_dir is None:
+        images_dir = os.path.join("bench_data", "synthetic")
+        generate_images(images_dir, args.synthetic_count, args.synthetic_size)
+    images = sorted(name for name in os.listdir(images_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    if not images:
+        raise SystemExit(f"No images found in {images_dir}")
+
+    stages = StageRecorder()
+    add_stage_observer(stages)
+
+    image_server, image_base = start_image_server(images_dir)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(), host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    def _url(name: str) -> str:
+        return f"{image_base}/{name}"
+
+    async def _preflight(client) -> None:
+        # A benchmark of 422 responses measures nothing past detection, so refuse to run one
+        response = await client.post("/extract/embedding", data={"image_url": _url(images[0])})
+        if response.status_code == 422:
+            raise SystemExit(f"No usable face in {images[0]}: {response.text}")
+
+    phases = {
+        "enroll": [("/enroll", {"employee_id": os.path.splitext(name)[0], "image_url": _url(name)}) for name in images],
+        "verify": [("/verify", {"image_url": _url(images[i % len(images)])}) for i in range(args.requests)],
+        "extract": [("/extract/embedding", {"image_url": _url(images[i % len(images)])}) for i in range(args.requests)],
+    }
+
+    report = {
+        "config": {
+            "images": len(images),
+            "synthetic": args.images is None,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "fake_milvus": not args.real_milvus,
+            "milvus_latency_ms": args.milvus_latency_ms,
+            "embedding_cache": args.cache,
+            "inference_mode": settings.INFERENCE_MODE,
+            "infer_max_batch_size": settings.INFER_MAX_BATCH_SIZE,
+            "infer_max_wait_ms": settings.INFER_MAX_WAIT_MS,
+            "max_concurrent_inference": settings.MAX_CONCURRENT_INFERENCE,
+            "det_size": list(settings.DET_SIZE),
+            "gallery_index": settings.GALLERY_INDEX_ENABLED,
+        },
+        "phases": {},
+    }
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120.0, limits=limits) as client:
+            await _preflight(client)
+            for phase in args.phases:
+                report["phases"][phase] = await run_phase(client, phases[phase], args.concurrency, stages)
+    finally:
+        server.should_exit = True
+        await server_task
+        image_server.shutdown()
+
+    return report
+
+
+def main() -> None:
+    args = parse_args()
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
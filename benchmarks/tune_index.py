@@ -0,0 +1,203 @@
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, connections, utility
+
+from benchmarks.run import summarize
+from services.milvus_db import DEFAULT_INDEX_PARAMS
+
+TUNE_ALIAS = "index-tune"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure recall@1 against exact search and latency of candidate Milvus index settings"
+    )
+    parser.add_argument(
+        "--collection",
+        help="Live collection to copy vectors from (default: the searched one, MILVUS_COLLECTION or its templates)",
+    )
+    parser.add_argument("--scratch", help="Scratch collection for candidate indexes (default: <collection>_tune)")
+    parser.add_argument("--queries", type=int, default=500, help="Query vectors sampled from the collection")
+    parser.add_argument("--noise", type=float, default=0.05,
+                        help="Gaussian noise added to sampled vectors to mimic a fresh photo of a known face")
+    parser.add_argument("--index-types", nargs="+", default=["IVF_FLAT", "IVF_SQ8", "HNSW"],
+                        choices=[t for t in DEFAULT_INDEX_PARAMS if t != "FLAT"])
+    parser.add_argument("--nlist", type=int, nargs="+", help="IVF nlist values (default: about 4*sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--hnsw-m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--recall-floor", type=float, default=0.99, help="Minimum acceptable recall@1")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per copy batch")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collection afterwards")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+def copy_collection(source: Collection, scratch: Collection, batch_size: int, queries: int, rng) -> tuple:
+    # One streaming pass: copy to the scratch collection and reservoir-sample query vectors
+    sample = []
+    seen = 0
+    iterator = source.query_iterator(batch_size=batch_size, output_fields=["employee_id", "embedding"])
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            scratch.insert([[row["employee_id"] for row in rows], [row["embedding"] for row in rows]])
+            for row in rows:
+                if len(sample) < queries:
+                    sample.append(row["embedding"])
+                else:
+                    slot = rng.integers(0, seen + 1)
+                    if slot < queries:
+                        sample[slot] = row["embedding"]
+                seen += 1
+    finally:
+        iterator.close()
+    scratch.flush()
+    return seen, np.asarray(sample, dtype=np.float32)
+
+
+def perturb(vectors: np.ndarray, noise: float, rng) -> np.ndarray:
+    noisy = vectors + rng.normal(0.0, noise, size=vectors.shape).astype(np.float32)
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def build_index(collection: Collection, index_type: str, params: dict) -> float:
+    started = time.perf_counter()
+    collection.release()
+    if collection.has_index():
+        collection.drop_index()
+    collection.create_index(
+        "embedding", index_params={"metric_type": "IP", "index_type": index_type, "params": params}
+    )
+    collection.load()
+    return time.perf_counter() - started
+
+
+def run_queries(collection: Collection, queries: np.ndarray, search_params: dict) -> tuple[list, list]:
+    # One vector per call, like /verify, so latency reflects a single request
+    top_ids, latencies = [], []
+    param = {"metric_type": "IP", "params": search_params}
+    for vector in queries:
+        started = time.perf_counter()
+        hits = collection.search(data=[vector.tolist()], anns_field="embedding", param=param, limit=1)
+        latencies.append(time.perf_counter() - started)
+        top_ids.append(hits[0][0].id if hits[0] else None)
+    return top_ids, latencies
+
+
+def candidates(args, num_rows: int) -> list[tuple[str, dict, list[dict]]]:
+    nlists = args.nlist or [max(16, min(65536, 2 ** round(math.log2(4 * math.sqrt(max(num_rows, 1))))))]
+    result = []
+    for index_type in args.index_types:
+        if index_type in ("IVF_FLAT", "IVF_SQ8"):
+            for nlist in nlists:
+                probes = [p for p in args.nprobe if p <= nlist]
+                result.append((index_type, {"nlist": nlist}, [{"nprobe": p} for p in probes]))
+        elif index_type == "HNSW":
+            for m in args.hnsw_m:
+                params = {"M": m, "efConstruction": args.ef_construction}
+                result.append((index_type, params, [{"ef": ef} for ef in args.ef]))
+    return result
+
+
+def main() -> None:
+    args = parse_args()
+
+    from core.config import settings
+
+    if args.collection is None:
+        # Tune the collection searches actually hit: templates replace the raw photos when enabled
+        args.collection = settings.MILVUS_COLLECTION
+        if settings.TEMPLATE_MODE:
+            args.collection = f"{settings.MILVUS_COLLECTION}_templates"
+
+    rng = np.random.default_rng(args.seed)
+    connections.connect(alias=TUNE_ALIAS, host=settings.MILVUS_HOST, port=settings.MILVUS_PORT)
+    source = Collection(args.collection, using=TUNE_ALIAS)
+    source.load()
+
+    scratch_name = args.scratch or f"{args.collection}_tune"
+    if utility.has_collection(scratch_name, using=TUNE_ALIAS):
+        utility.drop_collection(scratch_name, using=TUNE_ALIAS)
+    dim = next(field.params["dim"] for field in source.schema.fields if field.name == "embedding")
+    scratch = Collection(
+        scratch_name,
+        schema=CollectionSchema([
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="employee_id", dtype=DataType.VARCHAR, max_length=100),
+            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dim),
+        ]),
+        using=TUNE_ALIAS,
+    )
+
+    try:
+        num_rows, sample = copy_collection(source, scratch, args.batch_size, args.queries, rng)
+        if not num_rows:
+            raise SystemExit(f"Collection {args.collection} is empty")
+        queries = perturb(sample, args.noise, rng)
+
+        # FLAT is brute force, so its answers are the exact ground truth
+        build_s = build_index(scratch, "FLAT", {})
+        truth, flat_latencies = run_queries(scratch, queries, {})
+        runs = [{
+            "index_type": "FLAT",
+            "params": {},
+            "search_params": {},
+            "build_s": build_s,
+            "recall_at_1": 1.0,
+            "latency": summarize(flat_latencies),
+        }]
+
+        for index_type, params, search_grid in candidates(args, num_rows):
+            build_s = build_index(scratch, index_type, params)
+            for search_params in search_grid:
+                top_ids, latencies = run_queries(scratch, queries, search_params)
+                hits = sum(1 for got, want in zip(top_ids, truth) if got == want)
+                runs.append({
+                    "index_type": index_type,
+                    "params": params,
+                    "search_params": search_params,
+                    "build_s": build_s,
+                    "recall_at_1": hits / len(truth),
+                    "latency": summarize(latencies),
+                })
+    finally:
+        if not args.keep:
+            utility.drop_collection(scratch_name, using=TUNE_ALIAS)
+
+    eligible = [run for run in runs if run["recall_at_1"] >= args.recall_floor]
+    best = min(eligible, key=lambda run: run["latency"]["p95_ms"], default=None)
+    report = {
+        "collection": args.collection,
+        "rows": num_rows,
+        "queries": len(queries),
+        "noise": args.noise,
+        "recall_floor": args.recall_floor,
+        "runs": runs,
+        "recommended": best,
+    }
+    if best is not None:
+        report["settings"] = {
+            "MILVUS_INDEX_TYPE": best["index_type"],
+            "MILVUS_INDEX_PARAMS": json.dumps(best["params"]),
+            "MILVUS_SEARCH_PARAMS": json.dumps(best["search_params"]),
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
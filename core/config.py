@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Literal
+
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -9,27 +11,189 @@ class Settings(BaseSettings):
 
     MILVUS_HOST: str = Field(..., description="Milvus host")
     MILVUS_PORT: int = Field(19530, description="Milvus port")
+    MILVUS_COLLECTION: str = Field("face_embeddings", description="Collection holding the face embeddings")
+    MULTI_TENANT: bool = Field(False, description="Partition the collection by a tenant key; tenant is then required")
+    MILVUS_NUM_PARTITIONS: int = Field(64, gt=0, le=4096, description="Partitions the tenant key hashes into")
+    TEMPLATE_MODE: bool = Field(False, description="Search one aggregate template per employee instead of every photo")
+    TEMPLATE_MAX_EXEMPLARS: int = Field(
+        0, ge=0, le=16, description="Recent per-photo vectors kept searchable next to each template"
+    )
+    TEMPLATE_REPAIR: bool = Field(
+        False, description="Recheck templates against raw rows after each enroll, for several writer processes"
+    )
+    MILVUS_POOL_SIZE: int = Field(4, gt=0, description="Milvus connection aliases used for searches")
+    MILVUS_MAX_INFLIGHT: int = Field(16, gt=0, description="Max concurrent Milvus RPCs")
+    MILVUS_SEARCH_COALESCE_MS: float = Field(2.0, ge=0.0, description="Window for merging searches (0 disables)")
+    MILVUS_MAX_COALESCED: int = Field(64, gt=0, description="Max query vectors per merged search")
+    MILVUS_HEALTH_INTERVAL_S: float = Field(10.0, gt=0, description="Background health check/reconnect period")
+    MILVUS_INDEX_TYPE: Literal["FLAT", "IVF_FLAT", "IVF_SQ8", "HNSW"] = Field(
+        "IVF_FLAT", description="Vector index built on the embedding field"
+    )
+    MILVUS_INDEX_PARAMS: dict[str, int] = Field(
+        default_factory=dict, description="Index build parameters, e.g. {\"nlist\": 1024} (type defaults otherwise)"
+    )
+    MILVUS_SEARCH_PARAMS: dict[str, int] = Field(
+        default_factory=dict, description="Search parameters, e.g. {\"nprobe\": 16} or {\"ef\": 64}"
+    )
+    MILVUS_INDEX_TIERS: list[dict] = Field(
+        default_factory=list,
+        description="Size-driven index choices: [{min_rows, index_type, params?, search_params?}, ...]",
+    )
+    MILVUS_AUTO_REBUILD: bool = Field(
+        False, description="Rebuild on crossing a tier, when templates or a fresh mirror keep serving reads"
+    )
+    MILVUS_INDEX_CHECK_INTERVAL_S: float = Field(3600.0, gt=0, description="Period of the index size check")
+    WRITE_BUFFER_ENABLED: bool = Field(
+        False,
+        description=(
+            "Acknowledge online enroll/delete once buffered and commit them to Milvus in groups; the read overlay "
+            "is per process, so with several uvicorn workers another worker may not see a write for a few seconds"
+        ),
+    )
+    WRITE_BUFFER_MAX_BATCH: int = Field(256, gt=0, description="Writes per group commit (one flush each)")
+    WRITE_BUFFER_MAX_DELAY_MS: float = Field(50.0, ge=0.0, description="Max time a write waits for its group")
+    WRITE_BUFFER_MAX_PENDING: int = Field(10_000, gt=0, description="Uncommitted writes before new ones are refused")
+    WRITE_BUFFER_VISIBILITY_GRACE_S: float = Field(
+        5.0, ge=0.0, description="How long committed writes stay in the read overlay (Milvus bounded staleness)"
+    )
     SIMILARITY_THRESHOLD: float = Field(0.6, ge=0.0, le=1.0)
     MAX_IMAGE_BYTES: int = Field(5_000_000, gt=0, description="Max upload size in bytes")
-    MAX_CONCURRENT_INFERENCE: int = Field(6, gt=0, description="Limit concurrent face inferences")
+    MAX_CONCURRENT_INFERENCE: int = Field(6, gt=0, description="Limit concurrent face inference batches")
+    INFER_MAX_BATCH_SIZE: int = Field(8, gt=0, description="Max faces per batched recognition call")
+    INFER_MAX_WAIT_MS: float = Field(5.0, ge=0.0, description="Max time to wait for a batch to fill")
+    INFER_MAX_QUEUE: int = Field(
+        256, ge=0, description="Images waiting for inference before new requests get 503 (0 = unbounded)"
+    )
+    INFER_DEFAULT_DEADLINE_MS: float = Field(
+        0.0, ge=0.0, description="Request budget when no X-Request-Timeout-Ms header is sent (0 = none)"
+    )
+    INFER_PRIORITY_LANES: bool = Field(True, description="Queue /verify images ahead of enroll and extract")
+    METRICS_ENABLED: bool = Field(True, description="Record per-stage latency metrics served on /metrics")
+    MAX_BATCH_SIZE: int = Field(32, gt=0, description="Max images per /verify/batch request")
+    BATCH_DOWNLOAD_CONCURRENCY: int = Field(8, gt=0, description="Parallel image downloads per batch request")
+
+    DOWNLOAD_MAX_CONNECTIONS_PER_HOST: int = Field(32, gt=0, description="Connection pool size per image host")
+    DOWNLOAD_MAX_KEEPALIVE_PER_HOST: int = Field(16, ge=0, description="Idle keep-alive connections kept per host")
+    DOWNLOAD_KEEPALIVE_EXPIRY_S: float = Field(60.0, gt=0, description="Idle time before a pooled connection closes")
+    DOWNLOAD_HTTP2: bool = Field(False, description="Use HTTP/2 for image downloads (needs the h2 package)")
+    DOWNLOAD_DEADLINE_S: float = Field(8.0, gt=0, description="Total time budget per image download, retries included")
+    DOWNLOAD_MAX_RETRIES: int = Field(2, ge=0, description="Retries on timeouts, connection errors and 429/5xx")
+    DOWNLOAD_REDIRECT_CACHE_SIZE: int = Field(4096, ge=0, description="Remembered final URLs after redirects")
+    DOWNLOAD_REDIRECT_CACHE_TTL_S: float = Field(600.0, gt=0, description="Lifetime of a remembered final URL")
+    EMPLOYEES_PAGE_SIZE: int = Field(1000, gt=0, description="Default page size of GET /employees")
+    EMPLOYEES_MAX_PAGE_SIZE: int = Field(10_000, gt=0, description="Largest page GET /employees will return")
+
+    INFERENCE_MODE: Literal["local", "pool"] = Field(
+        "local", description="Run models in-process or delegate to the shared inference pool"
+    )
+    INFERENCE_POOL_ADDRESS: str = Field("/tmp/face-inference.sock", description="Unix socket of the inference pool")
+    INFERENCE_POOL_AUTHKEY: str = Field(
+        "", description="Shared secret for pool connections; empty means a random key per launch in <address>.key"
+    )
+    INFERENCE_POOL_WORKERS: int = Field(2, gt=0, description="Inference processes started by the pool")
+    INFERENCE_POOL_PIN_CPUS: bool = Field(True, description="Pin each pool worker to its own CPU subset")
+    INFERENCE_POOL_TIMEOUT_S: float = Field(
+        30.0, gt=0, description="Max wait for a pool reply; workers stuck longer are restarted"
+    )
+
+    BULK_ENROLL_STATE_DIR: str = Field("bulk_jobs", description="Uploaded sources, checkpoints and error reports")
+    BULK_ENROLL_CONCURRENCY: int = Field(8, gt=0, description="Parallel downloads/embeddings per bulk job")
+    BULK_ENROLL_INSERT_BATCH_SIZE: int = Field(1000, gt=0, description="Rows per Milvus insert in bulk jobs")
+
+    EMBEDDING_CACHE_ENABLED: bool = Field(True, description="Cache embeddings by image URL and content hash")
+    EMBEDDING_CACHE_MAX_ENTRIES: int = Field(10_000, gt=0, description="Max cached URL/content entries")
+    EMBEDDING_CACHE_TTL_S: float = Field(3600.0, gt=0, description="Embedding cache entry lifetime")
+
+    EMPLOYEE_VECTOR_CACHE_MAX_ENTRIES: int = Field(
+        10_000, ge=0, description="Employees whose vectors are kept for 1:1 verify (0 disables)"
+    )
+    EMPLOYEE_VECTOR_CACHE_TTL_S: float = Field(
+        300.0, gt=0, description="Lifetime of cached employee vectors (bounds staleness across workers)"
+    )
+
+    GALLERY_INDEX_ENABLED: bool = Field(False, description="Serve searches from an in-process exact mirror")
+    GALLERY_SYNC_INTERVAL_S: float = Field(300.0, gt=0, description="Full re-sync period of the gallery mirror")
+    GALLERY_MAX_STALENESS_S: float = Field(
+        300.0, gt=0, description="Fall back to Milvus when the mirror is older; capped at GALLERY_SYNC_INTERVAL_S"
+    )
+
+    STREAM_MAX_CONCURRENT_FRAMES: int = Field(
+        2, gt=0, description="Video frames processed at once across all WebSocket streams"
+    )
+    STREAM_FRAME_DEADLINE_MS: float = Field(
+        1000.0, ge=0, description="Drop a frame still waiting for inference after this long (0 = never)"
+    )
+    STREAM_IOU_THRESHOLD: float = Field(0.3, gt=0.0, le=1.0, description="Min box overlap to continue a face track")
+    STREAM_MAX_MISSED_FRAMES: int = Field(10, ge=0, description="Frames a track survives without a detection")
+    STREAM_CONFIDENCE_DROP: float = Field(
+        0.15, gt=0.0, le=1.0, description="Detector score drop since the last match that triggers re-recognition"
+    )
+    STREAM_UNMATCHED_RETRY_FRAMES: int = Field(
+        15, gt=0, description="Frames between recognition retries for tracks with no match"
+    )
+    STREAM_MIN_DET_SCORE: float = Field(
+        0.5, ge=0.0, le=1.0, description="Min detector score before a tracked face is recognized"
+    )
 
     MODEL_NAME: str = Field("buffalo_l", description="InsightFace model name")
+    FACE_MODULES: list[str] = Field(
+        default_factory=lambda: ["detection", "recognition"],
+        description="InsightFace model tasks to load (detection and recognition are required)",
+    )
     DET_SIZE: tuple[int, int] = Field((640, 640), description="Detector input size")
+    ADAPTIVE_DET_SIZE: bool = Field(False, description="Try DET_SIZE_SMALL first for selfie-style images")
+    DET_SIZE_SMALL: tuple[int, int] = Field((320, 320), description="Detector input size for the fast pass")
+    DET_SMALL_MIN_FACE_RATIO: float = Field(
+        0.1, gt=0.0, le=1.0, description="Min face/image area ratio to accept the fast detector pass"
+    )
+    DECODE_MIN_LONG_SIDE: int = Field(
+        1280, ge=0, description="Decode large JPEGs at reduced scale down to this long side (0 disables)"
+    )
     FACE_PROVIDERS: list[str] = Field(
         default_factory=lambda: ["CUDAExecutionProvider", "CPUExecutionProvider"],
         description="ONNXRuntime execution providers (GPU-first, CPU fallback)",
     )
+    ORT_INTRA_OP_THREADS: int = Field(
+        0, ge=0, description="Threads per ONNX Runtime session (0 = usable CPUs / MAX_CONCURRENT_INFERENCE)"
+    )
+    ORT_INTER_OP_THREADS: int = Field(1, gt=0, description="Threads across graph branches (parallel mode only)")
+    ORT_GRAPH_OPTIMIZATION: Literal["disable", "basic", "extended", "all"] = Field(
+        "all", description="ONNX Runtime graph optimization level"
+    )
+    ORT_EXECUTION_MODE: Literal["sequential", "parallel"] = Field(
+        "sequential", description="Run graph nodes one at a time or independent branches in parallel"
+    )
+    ORT_OPTIMIZED_MODEL_DIR: str = Field(
+        "~/.insightface/optimized", description="Where optimized graphs are saved and reused (empty disables)"
+    )
 
-    @field_validator("DET_SIZE")
+    @field_validator("DET_SIZE", "DET_SIZE_SMALL")
     @classmethod
     def _validate_det_size(cls, value: tuple[int, int]) -> tuple[int, int]:
         if len(value) != 2 or any(v <= 0 for v in value):
-            raise ValueError("DET_SIZE must be a 2-length tuple of positive ints")
+            raise ValueError("Detector sizes must be 2-length tuples of positive ints")
+        return value
+
+    @field_validator("MILVUS_INDEX_TIERS")
+    @classmethod
+    def _validate_index_tiers(cls, value: list[dict]) -> list[dict]:
+        for tier in value:
+            if not isinstance(tier.get("min_rows"), int) or tier["min_rows"] < 0:
+                raise ValueError("Each index tier needs a non-negative integer min_rows")
+            if tier.get("index_type") not in ("FLAT", "IVF_FLAT", "IVF_SQ8", "HNSW"):
+                raise ValueError("Index tier index_type must be FLAT, IVF_FLAT, IVF_SQ8 or HNSW")
+        return value
+
+    @field_validator("FACE_MODULES")
+    @classmethod
+    def _validate_face_modules(cls, value: list[str]) -> list[str]:
+        if "detection" not in value or "recognition" not in value:
+            raise ValueError("FACE_MODULES must include detection and recognition")
         return value
 
-    @field_validator("FACE_PROVIDERS", mode="before")
+    @field_validator("FACE_PROVIDERS", "FACE_MODULES", mode="before")
     @classmethod
-    def _parse_face_providers(cls, value):
+    def _parse_comma_separated(cls, value):
         if isinstance(value, str):
             return [item.strip() for item in value.split(",") if item.strip()]
         return value
@@ -1,19 +1,170 @@
 import asyncio
+import threading
+import time
 
+from services.async_milvus_db import AsyncMilvusDB
+from services.bulk_enroll import BulkEnrollManager
+from services.embedding_cache import EmbeddingCache
+from services.embedding_pipeline import EmbeddingPipeline
+from services.employee_vectors import EmployeeVectorCache
 from services.face_service import FaceRecognitionService
+from services.face_tracker import FaceTracker
+from services.gallery_index import GalleryIndex
+from services.image_loader import ImageFetcher
+from services.inference_pool import RemoteFaceService
 from services.milvus_db import MilvusDB
+from services.stream_verifier import StreamVerifier
+from services.write_buffer import WriteBehindBuffer
 from core.config import settings
+from core.metrics import metrics
+from core.timing import add_stage_observer
 
 
 class Container:
     def __init__(self):
-        self.face_service = FaceRecognitionService(
-            model_name=settings.MODEL_NAME,
-            providers=settings.FACE_PROVIDERS,
-            det_size=settings.DET_SIZE,
+        batching = {
+            "max_batch_size": settings.INFER_MAX_BATCH_SIZE,
+            "max_batch_wait_ms": settings.INFER_MAX_WAIT_MS,
+            "max_concurrent_batches": settings.MAX_CONCURRENT_INFERENCE,
+            "max_queue_size": settings.INFER_MAX_QUEUE,
+        }
+        if settings.INFERENCE_MODE == "pool":
+            self.face_service = RemoteFaceService(
+                address=settings.INFERENCE_POOL_ADDRESS,
+                authkey=settings.INFERENCE_POOL_AUTHKEY.encode(),
+                decode_min_long_side=settings.DECODE_MIN_LONG_SIDE,
+                timeout_s=settings.INFERENCE_POOL_TIMEOUT_S,
+                **batching,
+            )
+        else:
+            self.face_service = FaceRecognitionService(
+                model_name=settings.MODEL_NAME,
+                providers=settings.FACE_PROVIDERS,
+                det_size=settings.DET_SIZE,
+                modules=settings.FACE_MODULES,
+                decode_min_long_side=settings.DECODE_MIN_LONG_SIDE,
+                small_det_size=settings.DET_SIZE_SMALL if settings.ADAPTIVE_DET_SIZE else None,
+                small_det_min_face_ratio=settings.DET_SMALL_MIN_FACE_RATIO,
+                session_options={
+                    "intra_op_threads": settings.ORT_INTRA_OP_THREADS,
+                    "inter_op_threads": settings.ORT_INTER_OP_THREADS,
+                    "graph_optimization": settings.ORT_GRAPH_OPTIMIZATION,
+                    "execution_mode": settings.ORT_EXECUTION_MODE,
+                    "optimized_model_dir": settings.ORT_OPTIMIZED_MODEL_DIR,
+                },
+                **batching,
+            )
+        self.embedding_cache = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                ttl_s=settings.EMBEDDING_CACHE_TTL_S,
+            )
+        self.fetcher = ImageFetcher(
+            max_connections_per_host=settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_per_host=settings.DOWNLOAD_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry_s=settings.DOWNLOAD_KEEPALIVE_EXPIRY_S,
+            http2=settings.DOWNLOAD_HTTP2,
+            deadline_s=settings.DOWNLOAD_DEADLINE_S,
+            max_retries=settings.DOWNLOAD_MAX_RETRIES,
+            redirect_cache_size=settings.DOWNLOAD_REDIRECT_CACHE_SIZE,
+            redirect_cache_ttl_s=settings.DOWNLOAD_REDIRECT_CACHE_TTL_S,
+            on_download=metrics.observe_download if settings.METRICS_ENABLED else None,
+        )
+        self.pipeline = EmbeddingPipeline(
+            self.face_service,
+            max_image_bytes=settings.MAX_IMAGE_BYTES,
+            cache=self.embedding_cache,
+            fetcher=self.fetcher,
+        )
+        self.milvus_db = MilvusDB(
+            index_type=settings.MILVUS_INDEX_TYPE,
+            index_params=settings.MILVUS_INDEX_PARAMS,
+            search_params=settings.MILVUS_SEARCH_PARAMS,
+            index_tiers=settings.MILVUS_INDEX_TIERS,
+            collection_name=settings.MILVUS_COLLECTION,
+            multi_tenant=settings.MULTI_TENANT,
+            num_partitions=settings.MILVUS_NUM_PARTITIONS,
+            template_mode=settings.TEMPLATE_MODE,
+            max_exemplars=settings.TEMPLATE_MAX_EXEMPLARS,
+            template_repair=settings.TEMPLATE_REPAIR,
+        )
+        self.gallery = None
+        if settings.GALLERY_INDEX_ENABLED:
+            # Other workers' writes only arrive with a full sync, so the mirror may not be trusted for longer
+            max_staleness_s = min(settings.GALLERY_MAX_STALENESS_S, settings.GALLERY_SYNC_INTERVAL_S)
+            self.gallery = GalleryIndex(dim=self.milvus_db.dim, max_staleness_s=max_staleness_s)
+            self.milvus_db.attach_gallery(self.gallery)
+        self.vector_cache = None
+        if settings.EMPLOYEE_VECTOR_CACHE_MAX_ENTRIES > 0:
+            self.vector_cache = EmployeeVectorCache(
+                max_entries=settings.EMPLOYEE_VECTOR_CACHE_MAX_ENTRIES,
+                ttl_s=settings.EMPLOYEE_VECTOR_CACHE_TTL_S,
+            )
+            self.milvus_db.attach_vector_cache(self.vector_cache)
+        self._gallery_sync_thread = None
+        self._index_check_task = None
+        self.write_buffer = None
+        if settings.WRITE_BUFFER_ENABLED:
+            self.write_buffer = WriteBehindBuffer(
+                max_batch=settings.WRITE_BUFFER_MAX_BATCH,
+                max_delay_ms=settings.WRITE_BUFFER_MAX_DELAY_MS,
+                max_pending=settings.WRITE_BUFFER_MAX_PENDING,
+                visibility_grace_s=settings.WRITE_BUFFER_VISIBILITY_GRACE_S,
+            )
+        self.milvus = AsyncMilvusDB(
+            self.milvus_db,
+            pool_size=settings.MILVUS_POOL_SIZE,
+            max_inflight=settings.MILVUS_MAX_INFLIGHT,
+            coalesce_window_ms=settings.MILVUS_SEARCH_COALESCE_MS,
+            max_coalesced=settings.MILVUS_MAX_COALESCED,
+            health_interval_s=settings.MILVUS_HEALTH_INTERVAL_S,
+            write_buffer=self.write_buffer,
+        )
+        self.bulk_enroll = BulkEnrollManager(
+            state_dir=settings.BULK_ENROLL_STATE_DIR,
+            pipeline=self.pipeline,
+            milvus_db=self.milvus_db,
+            concurrency=settings.BULK_ENROLL_CONCURRENCY,
+            insert_batch_size=settings.BULK_ENROLL_INSERT_BATCH_SIZE,
+        )
+        self._stream_frame_slots = asyncio.Semaphore(settings.STREAM_MAX_CONCURRENT_FRAMES)
+
+        if settings.METRICS_ENABLED:
+            self._register_metrics()
+
+    def _register_metrics(self) -> None:
+        add_stage_observer(metrics.observe_stage)
+        batcher = self.face_service.batcher
+        batcher.on_shed = metrics.inc_failure
+        metrics.register_gauge(
+            "face_inference_queue_depth", "Images waiting for an inference batch", batcher.queue_depth
+        )
+        metrics.register_gauge(
+            "face_inferences_in_flight", "Images in batches currently running", lambda: batcher.in_flight
+        )
+        if self.write_buffer is not None:
+            metrics.register_gauge(
+                "face_write_buffer_pending", "Acknowledged writes not yet committed to Milvus", self.write_buffer.__len__
+            )
+
+    def stream_verifier(self, threshold: float, tenant: str | None = None) -> StreamVerifier:
+        tracker = FaceTracker(
+            iou_threshold=settings.STREAM_IOU_THRESHOLD,
+            max_missed=settings.STREAM_MAX_MISSED_FRAMES,
+            confidence_drop=settings.STREAM_CONFIDENCE_DROP,
+            unmatched_retry_frames=settings.STREAM_UNMATCHED_RETRY_FRAMES,
+            min_det_score=settings.STREAM_MIN_DET_SCORE,
+        )
+        return StreamVerifier(
+            self.face_service,
+            self.milvus,
+            tracker,
+            threshold,
+            self._stream_frame_slots,
+            tenant=tenant,
+            frame_deadline_ms=settings.STREAM_FRAME_DEADLINE_MS,
         )
-        self.milvus_db = MilvusDB()
-        self.infer_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_INFERENCE)
 
     def startup(self) -> None:
         self.face_service.warmup()
@@ -25,9 +176,94 @@ class Container:
         created = self.milvus_db.create_collection()
         if created is None:
             print("Warning: Milvus collection not ready.")
+            return
+
+        if self.milvus_db.templates_created:
+            # First start in template mode: derive templates from the photos enrolled so far
+            result = self.milvus_db.rebuild_templates()
+            if result.get("success", False):
+                print(f"Templates built for {result['templates']} employees")
+            else:
+                print(f"Warning: Template rebuild failed: {result.get('error')}")
+
+        if self.gallery is not None:
+            # Synced first so a fresh mirror can serve reads if the index has to be rebuilt below
+            self._sync_gallery()
+            if self._gallery_sync_thread is None:
+                self._gallery_sync_thread = threading.Thread(target=self._gallery_sync_loop, daemon=True)
+                self._gallery_sync_thread.start()
+
+        index_status = self.milvus_db.index_status()
+        if self._auto_rebuild(index_status):
+            self._report_rebuild(self.milvus_db.rebuild_index())
+        else:
+            self._report_index(index_status)
+
+    def _sync_gallery(self) -> None:
+        result = self.milvus_db.sync_gallery()
+        if result.get("success", False):
+            print(f"Gallery index synced: {result['count']} vectors")
+        else:
+            print(f"Warning: Gallery index sync failed: {result.get('error')}")
+
+    def _gallery_sync_loop(self) -> None:
+        while True:
+            time.sleep(settings.GALLERY_SYNC_INTERVAL_S)
+            self._sync_gallery()
+
+    def _report_index(self, status: dict) -> None:
+        if not status.get("success", False):
+            print(f"Warning: Index status unavailable: {status.get('error')}")
+        elif status["rebuild_recommended"]:
+            target = status["target"]
+            print(
+                f"Index rebuild recommended at {status['num_entities']} vectors: "
+                f"{status['active']} -> {target['index_type']} {target['params']}"
+            )
+
+    def _auto_rebuild(self, status: dict) -> bool:
+        if not settings.MILVUS_AUTO_REBUILD or not status.get("rebuild_recommended"):
+            return False
+        # A rebuild releases the searched collection; unattended it may only run while reads are served elsewhere
+        if self.milvus_db.rebuild_keeps_reads():
+            return True
+        print(
+            "Warning: Automatic index rebuild skipped: search would be unavailable until it finishes. "
+            "Run POST /index/rebuild in a quiet period, or enable TEMPLATE_MODE or GALLERY_INDEX_ENABLED."
+        )
+        return False
+
+    def _report_rebuild(self, result: dict) -> None:
+        if result.get("success", False):
+            print(f"Index rebuilt as {result['active']} in {result['elapsed_s']:.1f}s")
+        else:
+            print(f"Warning: Index rebuild failed: {result.get('error')}")
+
+    async def _index_check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.MILVUS_INDEX_CHECK_INTERVAL_S)
+            status = await self.milvus.index_status()
+            if not status.get("rebuild_recommended"):
+                continue
+            if self._auto_rebuild(status):
+                self._report_rebuild(await self.milvus.rebuild_index())
+            else:
+                self._report_index(status)
+
+    async def start_async(self) -> None:
+        await self.milvus.start(settings.MILVUS_HOST, settings.MILVUS_PORT)
+        if settings.MILVUS_INDEX_TIERS and self._index_check_task is None:
+            self._index_check_task = asyncio.create_task(self._index_check_loop())
+
+    async def shutdown(self) -> None:
+        if self._index_check_task is not None:
+            self._index_check_task.cancel()
+            self._index_check_task = None
+        await self.fetcher.close()
+        await self.milvus.close()
 
     def health(self) -> dict:
-        return self.milvus_db.health()
+        return self.milvus.health()
 
 
 container = Container()
@@ -0,0 +1,101 @@
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Image URLs are client-supplied, so the host label is capped to keep series bounded
+MAX_DOWNLOAD_HOSTS = 50
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> tuple[list[int], float, int]:
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._stages: dict[str, Histogram] = {}
+        self._failures: dict[str, int] = {}
+        self._downloads: dict[str, Histogram] = {}
+        self._gauges: list[tuple[str, str, object]] = []
+        self._lock = threading.Lock()
+
+    def observe_stage(self, name: str, seconds: float) -> None:
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    def observe_download(self, host: str, seconds: float) -> None:
+        histogram = self._downloads.get(host)
+        if histogram is None:
+            with self._lock:
+                if host not in self._downloads and len(self._downloads) >= MAX_DOWNLOAD_HOSTS:
+                    host = "other"
+                histogram = self._downloads.setdefault(host, Histogram())
+        histogram.observe(seconds)
+
+    def inc_failure(self, category: str) -> None:
+        with self._lock:
+            self._failures[category] = self._failures.get(category, 0) + 1
+
+    def register_gauge(self, name: str, help_text: str, read) -> None:
+        # Gauges are read at scrape time, so the hot path never pays for them
+        self._gauges.append((name, help_text, read))
+
+    @staticmethod
+    def _render_histograms(lines: list[str], metric: str, label: str, histograms: dict) -> None:
+        for name, histogram in sorted(histograms.items()):
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{{label}="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label}="{name}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{{label}="{name}"}} {total}')
+            lines.append(f'{metric}_count{{{label}="{name}"}} {count}')
+
+    def render(self) -> str:
+        lines = [
+            "# HELP face_stage_duration_seconds Time spent per request stage",
+            "# TYPE face_stage_duration_seconds histogram",
+        ]
+        self._render_histograms(lines, "face_stage_duration_seconds", "stage", dict(self._stages))
+
+        lines += [
+            "# HELP face_download_duration_seconds Image download time per source host, retries included",
+            "# TYPE face_download_duration_seconds histogram",
+        ]
+        self._render_histograms(lines, "face_download_duration_seconds", "host", dict(self._downloads))
+
+        lines += [
+            "# HELP face_request_failures_total Failed requests by error category",
+            "# TYPE face_request_failures_total counter",
+        ]
+        with self._lock:
+            failures = sorted(self._failures.items())
+        for category, count in failures:
+            lines.append(f'face_request_failures_total{{category="{category}"}} {count}')
+
+        for name, help_text, read in self._gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {read()}"]
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
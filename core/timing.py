@@ -0,0 +1,32 @@
+import time
+from contextlib import contextmanager
+
+_observers = []
+
+
+def add_stage_observer(observer) -> None:
+    _observers.append(observer)
+
+
+def remove_stage_observer(observer) -> None:
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    for observer in _observers:
+        observer(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    # Near-free when nobody is listening, so call sites can stay instrumented in production
+    if not _observers:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
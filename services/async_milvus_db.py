@@ -0,0 +1,286 @@
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio
+import numpy as np
+
+from core.timing import stage
+from services.milvus_db import MilvusDB
+from services.write_buffer import PendingWrite
+
+
+class AsyncMilvusDB:
+    def __init__(
+        self,
+        primary: MilvusDB,
+        pool_size: int,
+        max_inflight: int,
+        coalesce_window_ms: float,
+        max_coalesced: int,
+        health_interval_s: float,
+        write_buffer=None,
+    ):
+        # Writes go through the primary so the gallery mirror sees them; searches fan out over the pool
+        self.primary = primary
+        self.pool = [primary] + [
+            MilvusDB(alias=f"{primary.alias}-pool-{i}", inline_reconnect=False, **primary.options)
+            for i in range(1, pool_size)
+        ]
+        for db in self.pool[1:]:
+            db.attach_gallery(primary.gallery)
+            db.attach_vector_cache(primary.vector_cache)
+
+        self._round_robin = itertools.cycle(self.pool)
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="milvus")
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._coalesce_window = coalesce_window_ms / 1000.0
+        self._max_coalesced = max_coalesced
+        self._pending_searches: list[tuple] = []
+        self._search_groups: set[asyncio.Task] = set()
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._health_interval_s = health_interval_s
+        self._health_task: asyncio.Task | None = None
+        self.last_health: dict = {"success": False, "error": "Milvus not connected"}
+        # Optional write-behind group commit for online enroll/delete; pending writes overlay every read
+        self.write_buffer = write_buffer
+        if write_buffer is not None:
+            write_buffer.bind(lambda writes: self._run(self.primary, MilvusDB.apply_writes, writes))
+
+    async def start(self, host, port) -> None:
+        self.primary.inline_reconnect = False
+        loop = asyncio.get_running_loop()
+        for db in self.pool[1:]:
+            await loop.run_in_executor(self._executor, lambda db=db: db.connect(host, port, retries=1))
+        self._share_active_index()
+        self.last_health = await self._run(self.primary, MilvusDB.health)
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self.write_buffer is not None:
+            await self.write_buffer.drain()
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, db: MilvusDB, fn, *args, **kwargs):
+        # Own executor and in-flight cap so Milvus I/O never competes with inference threads
+        async with self._inflight:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, lambda: fn(db, *args, **kwargs))
+
+    def _share_active_index(self) -> None:
+        # Only the primary inspects or rebuilds the index; members must search with matching parameters
+        for db in self.pool[1:]:
+            db.active_index = self.primary.active_index
+
+    def _next_db(self) -> MilvusDB:
+        for _ in range(len(self.pool)):
+            db = next(self._round_robin)
+            if db.connected:
+                return db
+        return self.primary
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._health_interval_s)
+            for db in self.pool:
+                if not db.connected:
+                    await self._run(db, MilvusDB.reconnect)
+            self.last_health = await self._run(self.primary, MilvusDB.health)
+
+    async def search_similar(self, embedding, threshold, limit=1, tenant: str | None = None):
+        with stage("search"):
+            result = await self._search_similar(embedding, threshold, limit, tenant)
+            overlay = self.write_buffer.view(tenant) if self.write_buffer is not None else None
+            if overlay is not None:
+                result = await self._apply_overlay(overlay, embedding, threshold, result, tenant)
+            return result
+
+    async def _apply_overlay(self, overlay, embedding, threshold, result: dict, tenant: str | None) -> dict:
+        # Read-your-writes: a pending delete hides the stored match, a pending enroll can beat it
+        if result.get("employee_id") in overlay.masked:
+            result = await self._run(
+                self._next_db(), MilvusDB.search_similar, embedding, threshold, 1, tenant, sorted(overlay.masked)
+            )
+        return overlay.merge(embedding, threshold, result)
+
+    async def _search_similar(self, embedding, threshold, limit, tenant):
+        gallery = self.primary.gallery
+        if gallery is None or limit != 1 or not gallery.is_fresh():
+            return await self._search_milvus(embedding, threshold, limit, tenant)
+
+        # Scoring the whole mirror is a large matmul; on the loop it would stall every other request
+        result = (await anyio.to_thread.run_sync(gallery.search_batch, [embedding], threshold, tenant))[0]
+        if result.get("matched", False):
+            return result
+        # Enrollments made by other workers only reach the mirror at its next sync, so a miss is confirmed in Milvus
+        fallback = await self._search_milvus(embedding, threshold, limit, tenant)
+        return fallback if fallback.get("matched", False) else result
+
+    async def _search_milvus(self, embedding, threshold, limit, tenant):
+        if self._coalesce_window <= 0 or limit != 1:
+            return await self._run(
+                self._next_db(), MilvusDB.search_similar, embedding, threshold, limit, tenant, use_gallery=False
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending_searches.append((embedding, threshold, tenant, future))
+
+        if len(self._pending_searches) >= self._max_coalesced:
+            self._flush_searches()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._coalesce_window, self._flush_searches)
+
+        return await future
+
+    def _flush_searches(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending_searches = self._pending_searches, []
+        # A Milvus search takes one filter, so queries are merged per tenant
+        groups: dict = {}
+        for item in pending:
+            groups.setdefault(item[2], []).append(item)
+        for tenant, group in groups.items():
+            # The loop only holds weak references to tasks, so unreferenced groups could vanish mid-search
+            task = asyncio.create_task(self._run_search_group(group, tenant))
+            self._search_groups.add(task)
+            task.add_done_callback(self._search_groups.discard)
+
+    async def _run_search_group(self, pending: list[tuple], tenant: str | None) -> None:
+        try:
+            result = await self._run(
+                self._next_db(),
+                MilvusDB.search_similar_batch,
+                [embedding for embedding, _, _, _ in pending],
+                [threshold for _, threshold, _, _ in pending],
+                1,
+                tenant,
+                use_gallery=False,
+            )
+        except Exception as exc:
+            for _, _, _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for idx, (_, _, _, future) in enumerate(pending):
+            if future.done():
+                continue
+            future.set_result(result["results"][idx] if result.get("success", False) else result)
+
+    async def search_similar_batch(self, embeddings, threshold, limit=1, tenant: str | None = None):
+        with stage("search"):
+            result = await self._run(
+                self._next_db(), MilvusDB.search_similar_batch, embeddings, threshold, limit, tenant
+            )
+            overlay = self.write_buffer.view(tenant) if self.write_buffer is not None else None
+            if overlay is None or not result.get("success", False):
+                return result
+
+            thresholds = threshold if isinstance(threshold, (list, tuple)) else [threshold] * len(embeddings)
+            result["results"] = [
+                await self._apply_overlay(overlay, embedding, item_threshold, match, tenant)
+                for embedding, item_threshold, match in zip(embeddings, thresholds, result["results"])
+            ]
+            return result
+
+    async def verify_employee(self, embedding, employee_id: str, threshold, tenant: str | None = None) -> dict:
+        with stage("search"):
+            overlay = self.write_buffer.view(tenant) if self.write_buffer is not None else None
+            if overlay is not None and employee_id in overlay.masked:
+                result = {"success": False, "error": f"Employee {employee_id} not found"}
+            else:
+                result = await self._run(
+                    self._next_db(), MilvusDB.verify_employee, embedding, employee_id, threshold, tenant
+                )
+            if overlay is None:
+                return result
+
+            pending = overlay.vectors_for(employee_id)
+            if pending.shape[0] == 0:
+                return result
+            sim = float(np.max(pending @ np.asarray(embedding, dtype=np.float32)))
+            if result.get("success", False) and result["similarity"] >= sim:
+                return result
+            return {"success": True, "matched": sim >= threshold, "employee_id": employee_id, "similarity": sim}
+
+    async def insert_embedding(self, employee_id, embedding, tenant: str | None = None):
+        if self.write_buffer is None:
+            return await self._run(self.primary, MilvusDB.insert_embedding, employee_id, embedding, tenant)
+
+        if self.primary.multi_tenant and not tenant:
+            return {"success": False, "error": "Tenant is required"}
+        if self.write_buffer.is_full():
+            return {"success": False, "error": "Write buffer full"}
+        self.write_buffer.add(PendingWrite("insert", employee_id, tenant, embedding))
+        return {"success": True, "insert_count": 1}
+
+    async def delete_by_employee_id(self, employee_id: str, tenant: str | None = None) -> dict:
+        if self.write_buffer is None:
+            return await self._run(self.primary, MilvusDB.delete_by_employee_id, employee_id, tenant)
+
+        # Existence is still checked up front so an unknown employee keeps its 404
+        overlay = self.write_buffer.view(tenant)
+        exists = overlay is not None and overlay.vectors_for(employee_id).shape[0] > 0
+        if not exists and (overlay is None or employee_id not in overlay.masked):
+            found = await self._run(self._next_db(), MilvusDB.has_employee, employee_id, tenant)
+            if not found.get("success", False):
+                return found
+            exists = found["exists"]
+        if not exists:
+            return {"success": False, "error": f"Employee {employee_id} not found"}
+
+        if self.write_buffer.is_full():
+            return {"success": False, "error": "Write buffer full"}
+        self.write_buffer.add(PendingWrite("delete", employee_id, tenant))
+        return {"success": True, "employee_id": employee_id}
+
+    async def index_status(self) -> dict:
+        return await self._run(self.primary, MilvusDB.index_status)
+
+    async def rebuild_index(self, index_type: str | None = None, params: dict | None = None) -> dict:
+        # Members search the same collection, so they must know it is released while the primary rebuilds it
+        for db in self.pool[1:]:
+            db.rebuilding = True
+        try:
+            result = await self._run(self.primary, MilvusDB.rebuild_index, index_type, params)
+        finally:
+            for db in self.pool[1:]:
+                db.rebuilding = False
+        self._share_active_index()
+        return result
+
+    async def list_employee_ids(
+        self,
+        cursor: str | None = None,
+        limit: int = 1000,
+        with_counts: bool = False,
+        tenant: str | None = None,
+    ):
+        return await self._run(
+            self._next_db(), MilvusDB.list_employee_ids, cursor, limit, with_counts, tenant=tenant
+        )
+
+    async def iter_employee_pages(
+        self,
+        page_size: int,
+        with_counts: bool = False,
+        cursor: str | None = None,
+        tenant: str | None = None,
+    ):
+        # One page in memory at a time; the caller streams each page before the next is fetched
+        while True:
+            page = await self.list_employee_ids(cursor, page_size, with_counts, tenant)
+            yield page
+            cursor = page.get("next_cursor")
+            if not page.get("success", False) or cursor is None:
+                return
+
+    def health(self) -> dict:
+        return self.last_health
@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+
+import anyio
+from fastapi import HTTPException
+
+from services.inference_batcher import current_admission
+
+# Download failures that will not go away on a retry
+_PERMANENT_STATUS = {413}
+
+
+def iter_rows(path: str):
+    # Streams (row_number, employee_id, image_url, tenant) from a CSV with a header or from JSONL
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        if path.endswith((".jsonl", ".ndjson")):
+            for row_number, line in enumerate(fh, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield row_number, None, None, None
+                    continue
+                yield row_number, record.get("employee_id"), record.get("image_url"), record.get("tenant")
+        else:
+            for row_number, record in enumerate(csv.DictReader(fh), start=1):
+                yield row_number, record.get("employee_id"), record.get("image_url"), record.get("tenant") or None
+
+
+class BulkEnrollJob:
+    def __init__(
+        self,
+        job_id: str,
+        source_path: str,
+        state_dir: str,
+        pipeline,
+        milvus_db,
+        concurrency: int,
+        insert_batch_size: int,
+    ):
+        self.job_id = job_id
+        self.source_path = source_path
+        self.pipeline = pipeline
+        self.milvus_db = milvus_db
+        self.concurrency = concurrency
+        self.insert_batch_size = insert_batch_size
+
+        self.checkpoint_path = os.path.join(state_dir, f"{job_id}.done")
+        self.report_path = os.path.join(state_dir, f"{job_id}.errors.jsonl")
+        # Rows handed to Milvus but not yet checkpointed; a crash in between leaves them uncertain
+        self.inflight_path = os.path.join(state_dir, f"{job_id}.inflight")
+
+        self.status = "pending"
+        self.error = None
+        self.rows_seen = 0
+        self.skipped = 0
+        self.enrolled = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+
+        self._buffer: list[tuple[int, str, object, str | None]] = []
+        self._uncertain: set[int] = set()
+        self._write_lock = asyncio.Lock()
+
+    def progress(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        processed = self.enrolled + self.failed
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "rows_seen": self.rows_seen,
+            "skipped": self.skipped,
+            "enrolled": self.enrolled,
+            "failed": self.failed,
+            "rows_per_s": processed / elapsed if elapsed > 0 else 0.0,
+            "error": self.error,
+            "error_report": self.report_path,
+        }
+
+    @staticmethod
+    def _read_rows(path: str) -> set[int]:
+        if not os.path.exists(path):
+            return set()
+        with open(path, "r", encoding="utf-8") as fh:
+            return {int(line) for line in fh if line.strip()}
+
+    def _load_checkpoint(self) -> set[int]:
+        done = self._read_rows(self.checkpoint_path)
+        self._uncertain = self._read_rows(self.inflight_path) - done
+        self._rewrite_lines(self.inflight_path, [str(row) for row in sorted(self._uncertain)])
+        self._compact_report(done)
+        return done
+
+    @staticmethod
+    def _rewrite_lines(path: str, lines: list[str]) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.writelines(line + "\n" for line in lines)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+
+    def _compact_report(self, done: set[int]) -> None:
+        # Retryable failures are attempted again by this run, and final ones are reported once
+        if not os.path.exists(self.report_path):
+            return
+        kept, seen = [], set()
+        with open(self.report_path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                row = json.loads(line).get("row")
+                if row in done and row not in seen:
+                    seen.add(row)
+                    kept.append(line.rstrip("\n"))
+        self._rewrite_lines(self.report_path, kept)
+
+    def _append_lines(self, path: str, lines: list[str]) -> None:
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.writelines(line + "\n" for line in lines)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    async def _record_failures(self, failures: list[dict], retryable: bool = False) -> None:
+        self.failed += len(failures)
+        await anyio.to_thread.run_sync(
+            self._append_lines, self.report_path, [json.dumps(failure) for failure in failures]
+        )
+        # Bad rows (no face, missing fields) are final; download errors are retried on resume
+        if not retryable:
+            await anyio.to_thread.run_sync(
+                self._append_lines, self.checkpoint_path, [str(failure["row"]) for failure in failures]
+            )
+
+    async def _flush_buffer(self) -> None:
+        async with self._write_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+
+            await anyio.to_thread.run_sync(
+                self._append_lines, self.inflight_path, [str(row) for row, _, _, _ in batch]
+            )
+            result = await anyio.to_thread.run_sync(
+                lambda: self.milvus_db.insert_embeddings(
+                    [employee_id for _, employee_id, _, _ in batch],
+                    [embedding for _, _, embedding, _ in batch],
+                    flush=False,
+                    tenants=[tenant for _, _, _, tenant in batch],
+                )
+            )
+            if result.get("raw_inserted"):
+                # Raw rows are already stored; a second insert would add each photo twice, so redo only the templates
+                result = await anyio.to_thread.run_sync(
+                    self.milvus_db.refresh_templates,
+                    [employee_id for _, employee_id, _, _ in batch],
+                    [tenant for _, _, _, tenant in batch],
+                )
+            if not result.get("success", False):
+                # Keep these rows out of the checkpoint so a resumed run retries them
+                self.error = f"Milvus insert failed: {result.get('error')}"
+                return
+
+            # Rows are checkpointed only once Milvus has accepted them
+            await anyio.to_thread.run_sync(
+                self._append_lines, self.checkpoint_path, [str(row) for row, _, _, _ in batch]
+            )
+            self.enrolled += len(batch)
+            print(f"[BulkEnroll] {self.job_id}: {self.progress()}")
+
+    async def _process_row(self, row_number: int, employee_id, image_url, tenant) -> None:
+        if not employee_id or not image_url:
+            await self._record_failures([{
+                "row": row_number, "employee_id": employee_id, "image_url": image_url,
+                "error": "Missing employee_id or image_url",
+            }])
+            return
+        if self.milvus_db.multi_tenant and not tenant:
+            await self._record_failures([{
+                "row": row_number, "employee_id": employee_id, "image_url": image_url,
+                "error": "Missing tenant",
+            }])
+            return
+
+        retryable = False
+        try:
+            result = await self.pipeline.from_url(image_url)
+        except HTTPException as exc:
+            result = {"success": False, "error": exc.detail}
+            retryable = exc.status_code not in _PERMANENT_STATUS
+        except Exception as exc:
+            result = {"success": False, "error": str(exc)}
+            retryable = True
+
+        if not result.get("success", False):
+            await self._record_failures([{
+                "row": row_number, "employee_id": employee_id, "image_url": image_url,
+                "error": result.get("error"),
+            }], retryable=retryable)
+            return
+
+        if row_number in self._uncertain:
+            # The previous run may have inserted this row before it could checkpoint it
+            found = await anyio.to_thread.run_sync(
+                self.milvus_db.has_embedding, employee_id, result["embedding"], tenant
+            )
+            if not found.get("success", False):
+                await self._record_failures([{
+                    "row": row_number, "employee_id": employee_id, "image_url": image_url,
+                    "error": f"Could not check for an earlier insert: {found.get('error')}",
+                }], retryable=True)
+                return
+            if found["exists"]:
+                # The crash may also have come between the raw insert and its template update
+                refreshed = await anyio.to_thread.run_sync(self.milvus_db.refresh_templates, [employee_id], [tenant])
+                if not refreshed.get("success", False):
+                    await self._record_failures([{
+                        "row": row_number, "employee_id": employee_id, "image_url": image_url,
+                        "error": f"Could not refresh the template: {refreshed.get('error')}",
+                    }], retryable=True)
+                    return
+                await anyio.to_thread.run_sync(self._append_lines, self.checkpoint_path, [str(row_number)])
+                self.skipped += 1
+                return
+
+        self._buffer.append((row_number, employee_id, result["embedding"], tenant))
+        if len(self._buffer) >= self.insert_batch_size:
+            await self._flush_buffer()
+
+    async def _consume(self, rows: asyncio.Queue) -> None:
+        while True:
+            row = await rows.get()
+            if row is None:
+                return
+            await self._process_row(*row)
+
+    async def run(self) -> dict:
+        # The job task inherits the starting request's deadline; bulk rows belong in the background lane
+        current_admission.set(None)
+        self.status = "running"
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+
+        try:
+            done = await anyio.to_thread.run_sync(self._load_checkpoint)
+            rows: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+            consumers = [asyncio.create_task(self._consume(rows)) for _ in range(self.concurrency)]
+
+            try:
+                for row in iter_rows(self.source_path):
+                    if self.error is not None:
+                        break
+                    self.rows_seen += 1
+                    if row[0] in done:
+                        self.skipped += 1
+                        continue
+                    await rows.put(row)
+            finally:
+                for _ in consumers:
+                    await rows.put(None)
+                await asyncio.gather(*consumers)
+
+            await self._flush_buffer()
+            if self.error is not None:
+                raise RuntimeError(self.error)
+
+            flush_result = await anyio.to_thread.run_sync(self.milvus_db.flush)
+            if not flush_result.get("success", False):
+                raise RuntimeError(f"Milvus flush failed: {flush_result.get('error')}")
+
+            self.status = "completed"
+        except Exception as exc:
+            self.status = "failed"
+            self.error = str(exc)
+        finally:
+            self.finished_at = time.time()
+
+        return self.progress()
+
+
+class BulkEnrollManager:
+    def __init__(self, state_dir: str, pipeline, milvus_db, concurrency: int, insert_batch_size: int):
+        self.state_dir = state_dir
+        self.pipeline = pipeline
+        self.milvus_db = milvus_db
+        self.concurrency = concurrency
+        self.insert_batch_size = insert_batch_size
+        self.jobs: dict[str, BulkEnrollJob] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def source_path(self, job_id: str, suffix: str = ".csv") -> str:
+        os.makedirs(self.state_dir, exist_ok=True)
+        return os.path.join(self.state_dir, f"{job_id}.source{suffix}")
+
+    def new_job_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def _find_source(self, job_id: str) -> str | None:
+        for suffix in (".csv", ".jsonl"):
+            path = os.path.join(self.state_dir, f"{job_id}.source{suffix}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def create_job(self, job_id: str, source_path: str) -> BulkEnrollJob:
+        job = BulkEnrollJob(
+            job_id=job_id,
+            source_path=source_path,
+            state_dir=self.state_dir,
+            pipeline=self.pipeline,
+            milvus_db=self.milvus_db,
+            concurrency=self.concurrency,
+            insert_batch_size=self.insert_batch_size,
+        )
+        self.jobs[job_id] = job
+        return job
+
+    def start(self, job_id: str) -> BulkEnrollJob | None:
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return self.jobs[job_id]
+
+        # Jobs from a previous process are picked up again from their stored source and checkpoint
+        source_path = self._find_source(job_id)
+        if source_path is None:
+            return None
+
+        job = self.create_job(job_id, source_path)
+        self._tasks[job_id] = asyncio.create_task(job.run())
+        return job
+
+    def get(self, job_id: str) -> BulkEnrollJob | None:
+        return self.jobs.get(job_id)
+
+
+async def _run_cli(args) -> dict:
+    from core.config import settings
+    from core.container import container
+
+    container.startup()
+    if not container.milvus_db.connected:
+        return {"success": False, "error": "Milvus not connected"}
+
+    os.makedirs(args.state_dir, exist_ok=True)
+    job_id = args.job_id or os.path.splitext(os.path.basename(args.source))[0]
+    job = BulkEnrollJob(
+        job_id=job_id,
+        source_path=args.source,
+        state_dir=args.state_dir,
+        pipeline=container.pipeline,
+        milvus_db=container.milvus_db,
+        concurrency=args.concurrency or settings.BULK_ENROLL_CONCURRENCY,
+        insert_batch_size=args.batch_size or settings.BULK_ENROLL_INSERT_BATCH_SIZE,
+    )
+    return await job.run()
+
+
+def main() -> None:
+    from core.config import settings
+
+    parser = argparse.ArgumentParser(
+        description="Bulk-enroll employees from a CSV/JSONL of employee_id,image_url[,tenant]"
+    )
+    parser.add_argument("source", help="CSV (with header) or .jsonl file")
+    parser.add_argument("--job-id", help="Job name; re-run with the same id to resume (default: file name)")
+    parser.add_argument("--state-dir", default=settings.BULK_ENROLL_STATE_DIR, help="Checkpoint and error report dir")
+    parser.add_argument("--concurrency", type=int, help="Parallel downloads/embeddings")
+    parser.add_argument("--batch-size", type=int, help="Rows per Milvus insert")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(_run_cli(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from services.inference_batcher import AdmissionRejected
+
+
+class _Inflight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int, ttl_s: float):
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._inflight: dict[str, _Inflight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.evictions += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def lookup(self, key: str):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value) -> None:
+        self._entries[key] = (time.monotonic() + self._ttl_s, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def run_once(self, key: str, compute):
+        # Concurrent callers with the same key share a single computation, run in a task none of them owns
+        while True:
+            entry = self._inflight.get(key)
+            follower = entry is not None
+            if follower:
+                self.coalesced += 1
+            else:
+                entry = self._inflight[key] = _Inflight(asyncio.create_task(compute()))
+                entry.task.add_done_callback(lambda task, key=key, entry=entry: self._finish(key, entry))
+
+            entry.waiters += 1
+            try:
+                return await asyncio.shield(entry.task)
+            except asyncio.CancelledError:
+                # A disconnecting caller only stops the work once nobody else is waiting for it
+                if entry.waiters == 1:
+                    entry.task.cancel()
+                raise
+            except AdmissionRejected:
+                # Shedding reflects the starting caller's deadline, not this one's, so it retries under its own
+                if not follower:
+                    raise
+            finally:
+                entry.waiters -= 1
+
+    def _finish(self, key: str, entry: "_Inflight") -> None:
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+        # Mark as retrieved so a failure nobody awaited is not reported as unhandled
+        if not entry.task.cancelled():
+            entry.task.exception()
+
+    async def get_or_compute(self, key: str, compute):
+        value = self.lookup(key)
+        if value is not None:
+            return value
+
+        async def _compute_and_store():
+            self.misses += 1
+            result = await compute()
+            self.put(key, result)
+            return result
+
+        return await self.run_once(key, _compute_and_store)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "ttl_s": self._ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,71 @@
+import asyncio
+import contextlib
+import hashlib
+
+from services.image_loader import fetch_image
+
+
+class EmbeddingPipeline:
+    def __init__(self, face_service, max_image_bytes: int, cache=None, fetcher=None):
+        self.face_service = face_service
+        self.max_image_bytes = max_image_bytes
+        self.cache = cache
+        self.fetcher = fetcher
+
+    async def from_url(self, url: str, download_limiter=None) -> dict:
+        if self.cache is None:
+            downloaded = await self._fetch(url, download_limiter)
+            return await self.face_service.extract_embedding(downloaded.data)
+
+        result = await self.cache.run_once(f"url:{url}", lambda: self._from_url_cached(url, download_limiter))
+        return dict(result)
+
+    async def from_urls(self, urls: list[str], download_concurrency: int) -> list:
+        limiter = asyncio.Semaphore(download_concurrency)
+        # Failures are returned in place so callers can report them per item
+        return await asyncio.gather(*(self.from_url(url, limiter) for url in urls), return_exceptions=True)
+
+    async def from_bytes(self, data) -> dict:
+        if self.cache is None:
+            return await self.face_service.extract_embedding(data)
+        return dict(await self._from_bytes_cached(data, self._content_key(data)))
+
+    async def _from_url_cached(self, url: str, download_limiter) -> dict:
+        url_key = f"url:{url}"
+        validators = self.cache.get(url_key)
+
+        if validators is not None:
+            downloaded = await self._fetch(
+                url, download_limiter, etag=validators["etag"], last_modified=validators["last_modified"]
+            )
+            if downloaded.not_modified:
+                result = self.cache.lookup(validators["content_key"])
+                if result is not None:
+                    return result
+                downloaded = await self._fetch(url, download_limiter)
+        else:
+            downloaded = await self._fetch(url, download_limiter)
+
+        content_key = self._content_key(downloaded.data)
+        result = await self._from_bytes_cached(downloaded.data, content_key)
+
+        if downloaded.etag or downloaded.last_modified:
+            self.cache.put(url_key, {
+                "etag": downloaded.etag,
+                "last_modified": downloaded.last_modified,
+                "content_key": content_key,
+            })
+        return result
+
+    async def _from_bytes_cached(self, data, content_key: str) -> dict:
+        return await self.cache.get_or_compute(content_key, lambda: self.face_service.extract_embedding(data))
+
+    async def _fetch(self, url: str, download_limiter, etag=None, last_modified=None):
+        async with download_limiter or contextlib.nullcontext():
+            if self.fetcher is not None:
+                return await self.fetcher.fetch(url, self.max_image_bytes, etag=etag, last_modified=last_modified)
+            return await fetch_image(url, self.max_image_bytes, etag=etag, last_modified=last_modified)
+
+    @staticmethod
+    def _content_key(data) -> str:
+        return "sha:" + hashlib.blake2b(data, digest_size=16).hexdigest()
@@ -1,16 +1,93 @@
-import cv2
+from dataclasses import dataclass
+
 import numpy as np
-from insightface.app import FaceAnalysis
+from insightface.utils import face_align
+
+from core.timing import stage
+from services.image_decode import decode_image
+from services.inference_batcher import InferenceBatcher
+from services.onnx_models import FaceModels
+
+
+def rescale_bboxes(results, scales):
+    for result, scale in zip(results, scales):
+        if scale != 1.0 and isinstance(result, dict) and result.get("bbox") is not None:
+            result["bbox"] = [value * scale for value in result["bbox"]]
+    return results
+
+
+def call_isolated(fn, *args):
+    # A failing item hands its exception back in its own slot, so the rest of the batch still gets answers
+    try:
+        return fn(*args)
+    except Exception as exc:
+        return exc
+
+
+def split_decoded(decoded) -> tuple[list, list[float]]:
+    # (img, scale) pairs from call_isolated(decode); a failed decode leaves no image and scale 1
+    imgs = [None if isinstance(item, Exception) else item[0] for item in decoded]
+    scales = [1.0 if isinstance(item, Exception) else item[1] for item in decoded]
+    return imgs, scales
+
+
+def restore_failures(results, decoded) -> list:
+    for idx, item in enumerate(decoded):
+        if isinstance(item, Exception):
+            results[idx] = item
+    return results
+
+
+@dataclass(frozen=True, eq=False)
+class FrameJob:
+    # Stream work sent through the batcher: "detect" decodes a frame and finds every face, "embed" runs ArcFace
+    kind: str
+    data: object
+    kpss: list | None = None
 
 
 class FaceRecognitionService:
-    def __init__(self, model_name: str, providers: list[str], det_size):
+    def __init__(
+        self,
+        model_name: str,
+        providers: list[str],
+        det_size,
+        max_batch_size: int = 8,
+        max_batch_wait_ms: float = 5.0,
+        max_concurrent_batches: int = 1,
+        max_queue_size: int = 0,
+        decode_min_long_side: int = 0,
+        small_det_size=None,
+        small_det_min_face_ratio: float = 0.1,
+        modules: list[str] | None = None,
+        session_options: dict | None = None,
+    ):
         self._det_size = det_size
+        self._small_det_size = small_det_size
+        self._small_det_min_face_ratio = small_det_min_face_ratio
+        self._decode_min_long_side = decode_min_long_side
         self._warmed_up = False
 
-        self.app = self._init_with_fallback(model_name, providers, det_size)
+        self.app = self._init_with_fallback(
+            model_name, providers, det_size, modules, session_options, max_concurrent_batches
+        )
+        self.batcher = InferenceBatcher(
+            self._run_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_batch_wait_ms,
+            max_concurrent_batches=max_concurrent_batches,
+            max_queue=max_queue_size,
+        )
 
-    def _init_with_fallback(self, model_name: str, providers: list[str], det_size):
+    def _init_with_fallback(
+        self,
+        model_name: str,
+        providers: list[str],
+        det_size,
+        modules=None,
+        session_options: dict | None = None,
+        concurrent_sessions: int = 1,
+    ):
         provider_options = [providers]
         if providers != ["CPUExecutionProvider"]:
             provider_options.append(["CPUExecutionProvider"])
@@ -19,7 +96,16 @@ class FaceRecognitionService:
             try:
                 print("[InsightFace] Trying providers:", prov)
 
-                app = FaceAnalysis(name=model_name, providers=prov)
+                # Only bbox, det_score and the embedding are used, so landmark/attribute models are neither kept nor run
+                app = FaceModels(
+                    model_name,
+                    providers=prov,
+                    modules=modules,
+                    session_options=session_options,
+                    concurrent_sessions=concurrent_sessions,
+                )
+                if "recognition" not in app.models:
+                    raise RuntimeError(f"Model pack {model_name} has no recognition model")
                 app.prepare(ctx_id=0, det_size=det_size)
 
                 for name, model in app.models.items():
@@ -30,37 +116,160 @@ class FaceRecognitionService:
             except Exception as exc:
                 print("[InsightFace] Failed providers:", prov, exc)
 
-        raise RuntimeError("Failed to initialize FaceAnalysis")
+        raise RuntimeError("Failed to initialize face models")
 
     def warmup(self):
         if self._warmed_up:
             return
         dummy = np.zeros((self._det_size[1], self._det_size[0], 3), dtype=np.uint8)
-        self.app.get(dummy)
+        self.app.det_model.detect(dummy, max_num=0, metric="default")
+        rec_model = self.app.models["recognition"]
+        rec_model.get_feat([np.zeros((rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8)])
+        if self._small_det_size is not None:
+            self.app.det_model.detect(dummy, input_size=self._small_det_size, max_num=0, metric="default")
         self._warmed_up = True
 
+    async def extract_embedding(self, image_bytes):
+        return await self.batcher.submit(image_bytes)
+
+    async def extract_embeddings(self, images):
+        return await self.batcher.submit_many(images)
+
+    async def detect_frame(self, data) -> tuple:
+        # (img, scale, detections); img is None when the frame does not decode
+        return await self.batcher.submit(FrameJob("detect", data))
+
+    async def embed_frame(self, img, kpss) -> np.ndarray:
+        return await self.batcher.submit(FrameJob("embed", img, kpss))
+
+    def _run_batch(self, items) -> list:
+        # Request images and stream frames share one batcher, so both go through the same admission and lanes
+        results = [None] * len(items)
+        images = [(idx, item) for idx, item in enumerate(items) if not isinstance(item, FrameJob)]
+        if images:
+            extracted = self.extract_embeddings_from_bytes_batch([item for _, item in images])
+            for (idx, _), result in zip(images, extracted):
+                results[idx] = result
+        for idx, item in enumerate(items):
+            if isinstance(item, FrameJob):
+                results[idx] = call_isolated(self._run_frame_job, item)
+        return results
+
+    def _run_frame_job(self, job: FrameJob):
+        if job.kind == "embed":
+            return self.embed_faces(job.data, job.kpss)
+        img, scale = self.decode(job.data)
+        if img is None:
+            return None, scale, []
+        return img, scale, self.detect_faces(img)
+
     def extract_embedding_from_bytes(self, image_bytes):
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        return self._process_image(img)
+        return self.extract_embeddings_from_bytes_batch([image_bytes])[0]
+
+    def extract_embeddings_from_bytes_batch(self, images):
+        decoded = [call_isolated(self.decode, image_bytes) for image_bytes in images]
+        imgs, scales = split_decoded(decoded)
+        results = restore_failures(self.extract_embeddings_from_images_batch(imgs), decoded)
+        return rescale_bboxes(results, scales)
+
+    def extract_embeddings_from_images_batch(self, imgs):
+        # Result slots are dicts, or the exception that item raised; the batcher fails only that request
+        results = [None] * len(imgs)
+        pending = []
+
+        # Detection runs per image; every aligned crop then goes through ArcFace in one session call
+        for idx, img in enumerate(imgs):
+            detected = call_isolated(self._detect_single_face, img)
+            if isinstance(detected, Exception) or not detected["success"]:
+                results[idx] = detected
+                continue
+            pending.append((idx, img, detected))
+
+        if pending:
+            embeddings = self._embed_isolated([img for _, img, _ in pending], [d["kps"] for _, _, d in pending])
+            for (idx, _, detected), embedding in zip(pending, embeddings):
+                if isinstance(embedding, Exception):
+                    results[idx] = embedding
+                    continue
+                results[idx] = {
+                    "success": True,
+                    "embedding": embedding,
+                    "bbox": detected["bbox"],
+                    "det_score": detected["det_score"],
+                }
+
+        return results
+
+    def decode(self, image_bytes):
+        with stage("decode"):
+            return decode_image(image_bytes, self._decode_min_long_side)
 
-    def _process_image(self, img):
+    def _detect(self, img):
+        det_model = self.app.det_model
+
+        # Selfie-style shots are resolved at the small detector size; anything else gets the full pass
+        if self._small_det_size is not None:
+            bboxes, kpss = det_model.detect(img, input_size=self._small_det_size, max_num=0, metric="default")
+            if bboxes.shape[0] == 1:
+                x1, y1, x2, y2 = bboxes[0, 0:4]
+                face_ratio = (x2 - x1) * (y2 - y1) / float(img.shape[0] * img.shape[1])
+                if face_ratio >= self._small_det_min_face_ratio:
+                    return bboxes, kpss
+
+        return det_model.detect(img, max_num=0, metric="default")
+
+    def detect_faces(self, img) -> list[dict]:
+        # Every face in the frame, for callers (video streams) that track several people at once
+        with stage("detect"):
+            bboxes, kpss = self._detect(img)
+        return [
+            {"bbox": bboxes[i, 0:4].tolist(), "det_score": float(bboxes[i, 4]), "kps": kpss[i]}
+            for i in range(bboxes.shape[0])
+        ]
+
+    def embed_faces(self, img, kpss) -> np.ndarray:
+        with stage("embed"):
+            return self._embed_faces([img] * len(kpss), kpss)
+
+    def _detect_single_face(self, img):
         if img is None:
             return {"success": False, "error": "Invalid image"}
 
-        faces = self.app.get(img)
+        with stage("detect"):
+            bboxes, kpss = self._detect(img)
 
-        if not faces:
+        if bboxes.shape[0] == 0:
             return {"success": False, "error": "No face detected"}
-        if len(faces) > 1:
+        if bboxes.shape[0] > 1:
             return {"success": False, "error": "Multiple faces detected"}
 
-        face = faces[0]
         return {
             "success": True,
-            "embedding": face.normed_embedding,
-            "bbox": face.bbox.tolist(),
-            "det_score": float(face.det_score),
+            "bbox": bboxes[0, 0:4].tolist(),
+            "det_score": float(bboxes[0, 4]),
+            "kps": kpss[0],
         }
-    
-    
+
+    def _embed_isolated(self, imgs, kpss) -> list:
+        try:
+            with stage("embed"):
+                return list(self._embed_faces(imgs, kpss))
+        except Exception as exc:
+            if len(imgs) == 1:
+                return [exc]
+
+        # The batched call failed; retrying face by face pins the error on the crop that caused it
+        with stage("embed"):
+            return [
+                call_isolated(lambda img=img, kps=kps: self._embed_faces([img], [kps])[0])
+                for img, kps in zip(imgs, kpss)
+            ]
+
+    def _embed_faces(self, imgs, kpss):
+        rec_model = self.app.models["recognition"]
+        crops = [
+            face_align.norm_crop(img, landmark=kps, image_size=rec_model.input_size[0])
+            for img, kps in zip(imgs, kpss)
+        ]
+        feats = rec_model.get_feat(crops)
+        return feats / np.linalg.norm(feats, axis=1, keepdims=True)
@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+
+
+def iou(a, b) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    if inter <= 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+@dataclass
+class Track:
+    track_id: int
+    bbox: list[float]
+    det_score: float
+    kps: object = None
+    missed: int = 0
+    frames_since_recognition: int = 0
+    recognized_det_score: float | None = None
+    matched: bool = False
+    employee_id: str | None = None
+    similarity: float | None = None
+
+
+class FaceTracker:
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_missed: int = 10,
+        confidence_drop: float = 0.15,
+        unmatched_retry_frames: int = 15,
+        min_det_score: float = 0.5,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.confidence_drop = confidence_drop
+        self.unmatched_retry_frames = unmatched_retry_frames
+        self.min_det_score = min_det_score
+        self.tracks: dict[int, Track] = {}
+        self._next_id = 1
+
+    def update(self, detections: list[dict]) -> tuple[list[Track], list[Track]]:
+        # Greedy IoU association: best-overlapping pairs first; returns (visible tracks, lost tracks)
+        pairs = sorted(
+            (
+                (iou(track.bbox, detection["bbox"]), track_id, det_idx)
+                for track_id, track in self.tracks.items()
+                for det_idx, detection in enumerate(detections)
+            ),
+            reverse=True,
+        )
+
+        assigned_tracks, assigned_dets = set(), set()
+        for overlap, track_id, det_idx in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if track_id in assigned_tracks or det_idx in assigned_dets:
+                continue
+            assigned_tracks.add(track_id)
+            assigned_dets.add(det_idx)
+            track = self.tracks[track_id]
+            detection = detections[det_idx]
+            track.bbox = detection["bbox"]
+            track.det_score = detection["det_score"]
+            track.kps = detection["kps"]
+            track.missed = 0
+            track.frames_since_recognition += 1
+
+        for det_idx, detection in enumerate(detections):
+            if det_idx in assigned_dets:
+                continue
+            track = Track(self._next_id, detection["bbox"], detection["det_score"], detection["kps"])
+            self._next_id += 1
+            self.tracks[track.track_id] = track
+            assigned_tracks.add(track.track_id)
+
+        lost = []
+        for track_id in list(self.tracks):
+            if track_id in assigned_tracks:
+                continue
+            track = self.tracks[track_id]
+            track.missed += 1
+            if track.missed > self.max_missed:
+                lost.append(self.tracks.pop(track_id))
+
+        return [self.tracks[track_id] for track_id in sorted(assigned_tracks)], lost
+
+    def needs_recognition(self, track: Track) -> bool:
+        # Blurry or partial faces make poor embeddings; wait for a cleaner frame
+        if track.det_score < self.min_det_score:
+            return False
+        if track.recognized_det_score is None:
+            return True
+        # A sharp drop in detector confidence suggests occlusion or a different face inside the box
+        if track.det_score < track.recognized_det_score - self.confidence_drop:
+            return True
+        return not track.matched and track.frames_since_recognition >= self.unmatched_retry_frames
+
+    def mark_recognized(self, track: Track, match: dict) -> None:
+        track.recognized_det_score = track.det_score
+        track.frames_since_recognition = 0
+        track.matched = bool(match.get("matched", False))
+        track.employee_id = match.get("employee_id")
+        track.similarity = match.get("similarity")
@@ -0,0 +1,176 @@
+import threading
+import time
+
+import numpy as np
+
+
+class GalleryIndex:
+    def __init__(self, dim: int, max_staleness_s: float):
+        self.dim = dim
+        self._max_staleness_s = max_staleness_s
+        self._lock = threading.RLock()
+        self._size = 0
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._pks = np.empty((0,), dtype=np.int64)
+        self._employee_ids = np.empty((0,), dtype=object)
+        self._tenants = np.empty((0,), dtype=object)
+        self._synced_at: float | None = None
+        self._pending_ops: list | None = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def is_fresh(self) -> bool:
+        synced_at = self._synced_at
+        return synced_at is not None and time.monotonic() - synced_at <= self._max_staleness_s
+
+    def begin_sync(self) -> None:
+        # Local writes that land while a full reload is in progress are replayed on top of it
+        with self._lock:
+            self._pending_ops = []
+
+    def abort_sync(self) -> None:
+        with self._lock:
+            self._pending_ops = None
+
+    def finish_sync(self, pks, employee_ids, embeddings, tenants=None) -> None:
+        matrix = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim))
+        with self._lock:
+            self._matrix = matrix
+            self._pks = np.asarray(pks, dtype=np.int64)
+            self._employee_ids = np.asarray(employee_ids, dtype=object)
+            self._tenants = self._tenant_column(tenants, len(pks))
+            self._size = matrix.shape[0]
+
+            pending_ops, self._pending_ops = self._pending_ops or [], None
+            for op, args in pending_ops:
+                op(*args)
+
+            self._synced_at = time.monotonic()
+
+    @staticmethod
+    def _tenant_column(tenants, size: int) -> np.ndarray:
+        column = np.empty((size,), dtype=object)
+        if tenants is not None:
+            column[:] = list(tenants)
+        return column
+
+    def add(self, pks, employee_ids, embeddings, tenants=None) -> None:
+        with self._lock:
+            if self._pending_ops is not None:
+                self._pending_ops.append((self._add, (pks, employee_ids, embeddings, tenants)))
+            self._add(pks, employee_ids, embeddings, tenants)
+
+    def upsert(self, pks, employee_ids, embeddings, tenants=None) -> None:
+        with self._lock:
+            if self._pending_ops is not None:
+                self._pending_ops.append((self._upsert, (pks, employee_ids, embeddings, tenants)))
+            self._upsert(pks, employee_ids, embeddings, tenants)
+
+    def remove_employee(self, employee_id: str, tenant: str | None = None) -> None:
+        with self._lock:
+            if self._pending_ops is not None:
+                self._pending_ops.append((self._remove_employee, (employee_id, tenant)))
+            self._remove_employee(employee_id, tenant)
+
+    def _add(self, pks, employee_ids, embeddings, tenants=None) -> None:
+        pks = np.asarray(pks, dtype=np.int64)
+        keep = ~np.isin(pks, self._pks[: self._size])
+        if not keep.any():
+            return
+
+        rows = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)[keep]
+        new_size = self._size + rows.shape[0]
+
+        # Grow geometrically so a stream of single enrollments stays amortised O(1)
+        if new_size > self._matrix.shape[0]:
+            capacity = max(new_size, self._matrix.shape[0] * 2, 64)
+            matrix = np.empty((capacity, self.dim), dtype=np.float32)
+            matrix[: self._size] = self._matrix[: self._size]
+            self._matrix = matrix
+            self._pks = np.resize(self._pks, capacity)
+            self._employee_ids = np.resize(self._employee_ids, capacity)
+            self._tenants = np.resize(self._tenants, capacity)
+
+        self._matrix[self._size:new_size] = rows
+        self._pks[self._size:new_size] = pks[keep]
+        self._employee_ids[self._size:new_size] = np.asarray(employee_ids, dtype=object)[keep]
+        self._tenants[self._size:new_size] = self._tenant_column(tenants, len(pks))[keep]
+        self._size = new_size
+
+    def _upsert(self, pks, employee_ids, embeddings, tenants=None) -> None:
+        rows = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        tenant_column = self._tenant_column(tenants, len(pks))
+        fresh = []
+        for idx, pk in enumerate(pks):
+            found = np.flatnonzero(self._pks[: self._size] == pk)
+            if not found.size:
+                fresh.append(idx)
+                continue
+            # Overwrite in place; dropping and re-appending would copy the whole matrix per enrollment
+            self._matrix[found[0]] = rows[idx]
+            self._employee_ids[found[0]] = employee_ids[idx]
+            self._tenants[found[0]] = tenant_column[idx]
+
+        if fresh:
+            self._add(
+                [pks[idx] for idx in fresh],
+                [employee_ids[idx] for idx in fresh],
+                rows[fresh],
+                tenant_column[fresh],
+            )
+
+    def _remove_employee(self, employee_id: str, tenant: str | None = None) -> None:
+        drop = self._employee_ids[: self._size] == employee_id
+        if tenant is not None:
+            drop &= self._tenants[: self._size] == tenant
+        self._drop(drop)
+
+    def _drop(self, drop: np.ndarray) -> None:
+        if not drop.any():
+            return
+        keep = ~drop
+        self._matrix = np.ascontiguousarray(self._matrix[: self._size][keep])
+        self._pks = self._pks[: self._size][keep]
+        self._employee_ids = self._employee_ids[: self._size][keep]
+        self._tenants = self._tenants[: self._size][keep]
+        self._size = self._matrix.shape[0]
+
+    def employee_vectors(self, employee_id: str, tenant: str | None = None) -> np.ndarray:
+        with self._lock:
+            rows = self._employee_ids[: self._size] == employee_id
+            if tenant is not None:
+                rows &= self._tenants[: self._size] == tenant
+            return self._matrix[: self._size][rows]
+
+    def search_batch(self, embeddings, threshold, tenant: str | None = None) -> list[dict]:
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+
+        with self._lock:
+            size = self._size
+            matrix = self._matrix[:size]
+            employee_ids = self._employee_ids[:size]
+            if tenant is not None:
+                # Only the tenant's own rows are scored, mirroring the partition-key filter in Milvus
+                rows = np.flatnonzero(self._tenants[:size] == tenant)
+                matrix = matrix[rows]
+                employee_ids = employee_ids[rows]
+            if matrix.shape[0] == 0:
+                return [{"success": True, "matched": False, "message": "No match found"} for _ in queries]
+            scores = queries @ matrix.T
+
+        thresholds = threshold if isinstance(threshold, (list, tuple)) else [threshold] * len(queries)
+        best = np.argmax(scores, axis=1)
+        results = []
+        for row, idx in enumerate(best):
+            sim = float(scores[row, idx])
+            if sim >= thresholds[row]:
+                results.append({
+                    "success": True,
+                    "matched": True,
+                    "employee_id": employee_ids[idx],
+                    "similarity": sim,
+                })
+            else:
+                results.append({"success": True, "matched": False, "similarity": sim})
+        return results
@@ -0,0 +1,60 @@
+import struct
+
+import cv2
+import numpy as np
+
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def jpeg_size(data) -> tuple[int, int] | None:
+    # Walks the marker segments up to the first SOF header without decoding any pixels
+    view = memoryview(data)
+    if len(view) < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+
+    pos = 2
+    while pos + 4 <= len(view):
+        if view[pos] != 0xFF:
+            return None
+        marker = view[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+
+        (length,) = struct.unpack(">H", view[pos + 2:pos + 4])
+        if marker in _SOF_MARKERS:
+            if pos + 9 > len(view):
+                return None
+            height, width = struct.unpack(">HH", view[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+
+    return None
+
+
+def decode_image(data, min_long_side: int = 0):
+    # Large JPEGs are decoded at 1/2, 1/4 or 1/8 size by libjpeg as long as the long side stays
+    # >= min_long_side; the returned scale maps decoded coordinates back to the original image
+    nparr = np.frombuffer(data, np.uint8)
+
+    if min_long_side > 0:
+        size = jpeg_size(data)
+        if size is not None:
+            long_side = max(size)
+            for factor, flag in _REDUCED_FLAGS:
+                if long_side // factor >= min_long_side:
+                    img = cv2.imdecode(nparr, flag)
+                    if img is not None:
+                        return img, long_side / max(img.shape[:2])
+                    break
+
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR), 1.0
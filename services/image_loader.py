@@ -1,72 +1,383 @@
+import asyncio
 import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from urllib.parse import urlsplit
 
 import httpx
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
+from starlette.formparsers import MultiPartException, MultiPartParser
 
-_client: httpx.AsyncClient | None = None
+from core.timing import stage
 
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+except ImportError:
+    h2 = None
 
-def _get_client() -> httpx.AsyncClient:
-    global _client
-    if _client is None:
-        timeout = httpx.Timeout(connect=2.0, read=5.0, write=2.0, pool=2.0)
-        _client = httpx.AsyncClient(
-            follow_redirects=True,
-            timeout=timeout,
-        )
-    return _client
+# Transient failures worth another attempt while the deadline allows it
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Redirect hops followed per download, each through the target host's own pool
+_MAX_REDIRECTS = 5
+# Room for multipart boundaries, part headers and the small text fields sent next to the image
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
 
-async def download_image_from_url(url: str, max_bytes: int) -> bytes:
-    try:
-        if "drive.google.com" in url:
-            match = re.search(r"/d/([^/]+)", url)
-            if match:
-                file_id = match.group(1)
-                url = f"https://drive.google.com/uc?id={file_id}"
+@dataclass
+class DownloadedImage:
+    data: bytearray | None
+    etag: str | None = None
+    last_modified: str | None = None
+    not_modified: bool = False
 
-        client = _get_client()
 
-        async with client.stream("GET", url) as response:
-            response.raise_for_status()
+class _UploadTooLarge(MultiPartException):
+    # A MultiPartException so the parser closes the spooled file it had started
+    pass
 
-            content_type = response.headers.get("Content-Type", "")
-            if not content_type.startswith("image/"):
-                raise HTTPException(
-                    status_code=400,
-                    detail="URL does not point to a valid image"
-                )
 
-            data = bytearray()
-            total = 0
+async def _capped_stream(request: Request, max_bytes: int):
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_bytes:
+            raise _UploadTooLarge("Image payload too large")
+        yield chunk
 
-            async for chunk in response.aiter_bytes():
-                if not chunk:
-                    continue
 
-                total += len(chunk)
-                if total > max_bytes:
-                    raise HTTPException(
-                        status_code=413,
-                        detail="Image payload too large"
-                    )
+class _Retryable(Exception):
+    def __init__(self, error: HTTPException):
+        super().__init__(error.detail)
+        self.error = error
 
-                data.extend(chunk)
 
-        return bytes(data)
+def _normalize_url(url: str) -> str:
+    if "drive.google.com" in url:
+        match = re.search(r"/d/([^/]+)", url)
+        if match:
+            file_id = match.group(1)
+            url = f"https://drive.google.com/uc?id={file_id}"
+    return url
 
-    except httpx.TimeoutException:
-        raise HTTPException(
-            status_code=408,
-            detail="Timeout while downloading image"
+
+class ImageFetcher:
+    def __init__(
+        self,
+        max_connections_per_host: int = 32,
+        max_keepalive_per_host: int = 16,
+        keepalive_expiry_s: float = 60.0,
+        http2: bool = False,
+        deadline_s: float = 8.0,
+        max_retries: int = 2,
+        redirect_cache_size: int = 4096,
+        redirect_cache_ttl_s: float = 600.0,
+        max_hosts: int = 64,
+        on_download=None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        if http2 and h2 is None:
+            print("Warning: DOWNLOAD_HTTP2 needs the h2 package (pip install httpx[http2]); using HTTP/1.1")
+            http2 = False
+
+        self._limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry_s,
         )
-    except httpx.RequestError as exc:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Failed to download image: {exc}"
+        self._http2 = http2
+        self._deadline_s = deadline_s
+        self._max_retries = max_retries
+        self._max_hosts = max_hosts
+        self._transport = transport
+        self._clients: OrderedDict[str, httpx.AsyncClient] = OrderedDict()
+        # Requests streaming on each client; an evicted client is closed only once this drops to zero
+        self._in_flight: dict[httpx.AsyncClient, int] = {}
+        self._retired: set[httpx.AsyncClient] = set()
+        self._redirects: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._redirect_cache_size = redirect_cache_size
+        self._redirect_cache_ttl_s = redirect_cache_ttl_s
+        self._on_download = on_download
+        self.redirect_hits = 0
+        self.redirect_misses = 0
+        self.retries = 0
+
+    def _client(self, host: str) -> httpx.AsyncClient:
+        # One pool per host so a slow origin cannot take every connection from the others
+        client = self._clients.get(host)
+        if client is not None:
+            self._clients.move_to_end(host)
+            return client
+
+        client = httpx.AsyncClient(
+            follow_redirects=False, limits=self._limits, http2=self._http2, transport=self._transport
         )
-    except httpx.HTTPStatusError as exc:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Failed to download image: HTTP {exc.response.status_code}"
+        self._clients[host] = client
+        if len(self._clients) > self._max_hosts:
+            _, evicted = self._clients.popitem(last=False)
+            self._retired.add(evicted)
+        return client
+
+    @asynccontextmanager
+    async def _lease(self, host: str):
+        client = self._client(host)
+        self._in_flight[client] = self._in_flight.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            self._in_flight[client] -= 1
+            if not self._in_flight[client]:
+                del self._in_flight[client]
+            # Evicted clients may still be streaming other downloads, so each is closed once it goes idle
+            idle = [retired for retired in self._retired if retired not in self._in_flight]
+            self._retired.difference_update(idle)
+            for retired in idle:
+                await retired.aclose()
+
+    def _resolved(self, url: str) -> str | None:
+        entry = self._redirects.get(url)
+        if entry is None:
+            return None
+        resolved, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._redirects[url]
+            return None
+        self._redirects.move_to_end(url)
+        return resolved
+
+    def _remember_redirect(self, url: str, resolved: str) -> None:
+        self._redirects[url] = (resolved, time.monotonic() + self._redirect_cache_ttl_s)
+        self._redirects.move_to_end(url)
+        while len(self._redirects) > self._redirect_cache_size:
+            self._redirects.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "hosts": len(self._clients),
+            "http2": self._http2,
+            "redirect_entries": len(self._redirects),
+            "redirect_hits": self.redirect_hits,
+            "redirect_misses": self.redirect_misses,
+            "retries": self.retries,
+        }
+
+    async def close(self) -> None:
+        clients, self._clients = list(self._clients.values()) + list(self._retired), OrderedDict()
+        self._retired = set()
+        for client in clients:
+            await client.aclose()
+
+    async def fetch(
+        self,
+        url: str,
+        max_bytes: int,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> DownloadedImage:
+        with stage("download"):
+            url = _normalize_url(url)
+            started = time.perf_counter()
+            host = urlsplit(url).hostname or ""
+            try:
+                return await self._fetch_with_redirect_cache(url, max_bytes, etag, last_modified)
+            finally:
+                if self._on_download is not None:
+                    self._on_download(host, time.perf_counter() - started)
+
+    async def _fetch_with_redirect_cache(self, url, max_bytes, etag, last_modified) -> DownloadedImage:
+        deadline = time.monotonic() + self._deadline_s
+        resolved = self._resolved(url)
+        if resolved is not None:
+            self.redirect_hits += 1
+            try:
+                downloaded, _ = await self._fetch_until_deadline(resolved, max_bytes, etag, last_modified, deadline)
+                return downloaded
+            except HTTPException as exc:
+                if exc.status_code == 413:
+                    raise
+                # Signed CDN links expire; forget the shortcut and go through the original URL again
+                self._redirects.pop(url, None)
+        else:
+            self.redirect_misses += 1
+
+        downloaded, final_url = await self._fetch_until_deadline(url, max_bytes, etag, last_modified, deadline)
+        if final_url != url:
+            self._remember_redirect(url, final_url)
+        return downloaded
+
+    async def _fetch_until_deadline(self, url, max_bytes, etag, last_modified, deadline) -> tuple:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(status_code=408, detail="Timeout while downloading image")
+            try:
+                return await asyncio.wait_for(
+                    self._fetch_once(url, max_bytes, etag, last_modified, remaining), remaining
+                )
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=408, detail="Timeout while downloading image")
+            except _Retryable as exc:
+                backoff = 0.1 * (2 ** attempt)
+                attempt += 1
+                if attempt > self._max_retries or deadline - time.monotonic() <= backoff:
+                    raise exc.error
+                self.retries += 1
+                await asyncio.sleep(backoff)
+
+    async def _fetch_once(self, url, max_bytes, etag, last_modified, remaining: float) -> tuple:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        # Per-phase timeouts never outlive the remaining deadline budget
+        timeout = httpx.Timeout(
+            connect=min(2.0, remaining),
+            read=min(5.0, remaining),
+            write=min(2.0, remaining),
+            pool=min(2.0, remaining),
         )
+        try:
+            for _ in range(_MAX_REDIRECTS + 1):
+                # Each hop goes through the pool of the host it targets, so redirects keep per-host isolation
+                async with self._lease(urlsplit(url).hostname or "") as client:
+                    async with client.stream("GET", url, headers=headers, timeout=timeout) as response:
+                        if response.is_redirect:
+                            url = str(response.url.join(response.headers["Location"]))
+                            continue
+                        return await self._read_response(response, max_bytes, etag, last_modified), url
+            raise HTTPException(status_code=400, detail="Failed to download image: too many redirects")
+
+        except httpx.TimeoutException:
+            raise _Retryable(HTTPException(
+                status_code=408,
+                detail="Timeout while downloading image"
+            ))
+        except (httpx.NetworkError, httpx.RemoteProtocolError) as exc:
+            raise _Retryable(HTTPException(
+                status_code=400,
+                detail=f"Failed to download image: {exc}"
+            ))
+        except (httpx.RequestError, httpx.InvalidURL) as exc:
+            # Unsupported scheme, malformed URL and the like fail the same way on every attempt
+            raise HTTPException(
+                status_code=400,
+                detail=f"Failed to download image: {exc}"
+            )
+        except httpx.HTTPStatusError as exc:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Failed to download image: HTTP {exc.response.status_code}"
+            )
+
+    @staticmethod
+    async def _read_response(response: httpx.Response, max_bytes: int, etag, last_modified) -> DownloadedImage:
+        if response.status_code == 304:
+            return DownloadedImage(data=None, etag=etag, last_modified=last_modified, not_modified=True)
+
+        if response.status_code in _RETRY_STATUSES:
+            raise _Retryable(HTTPException(
+                status_code=400,
+                detail=f"Failed to download image: HTTP {response.status_code}"
+            ))
+        response.raise_for_status()
+
+        content_type = response.headers.get("Content-Type", "")
+        if not content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=400,
+                detail="URL does not point to a valid image"
+            )
+
+        data = bytearray()
+        total = 0
+
+        async for chunk in response.aiter_bytes():
+            if not chunk:
+                continue
+
+            total += len(chunk)
+            if total > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail="Image payload too large"
+                )
+
+            data.extend(chunk)
+
+        return DownloadedImage(
+            data=data,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+
+_default_fetcher: ImageFetcher | None = None
+
+
+def _get_fetcher() -> ImageFetcher:
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = ImageFetcher()
+    return _default_fetcher
+
+
+async def download_image_from_url(url: str, max_bytes: int) -> bytearray:
+    downloaded = await fetch_image(url, max_bytes)
+    return downloaded.data
+
+
+async def fetch_image(
+    url: str,
+    max_bytes: int,
+    etag: str | None = None,
+    last_modified: str | None = None,
+) -> DownloadedImage:
+    return await _get_fetcher().fetch(url, max_bytes, etag, last_modified)
+
+
+async def read_image_upload(request: Request, max_bytes: int):
+    # Returns the image buffer plus the accompanying fields (form fields or query params)
+    content_type = request.headers.get("Content-Type", "")
+    is_multipart = content_type.startswith("multipart/form-data")
+    max_body = max_bytes + _MULTIPART_OVERHEAD_BYTES if is_multipart else max_bytes
+
+    content_length = request.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_body:
+        raise HTTPException(status_code=413, detail="Image payload too large")
+
+    if is_multipart:
+        # request.form() would spool the whole body first; this parser stops reading once the cap is passed
+        parser = MultiPartParser(request.headers, _capped_stream(request, max_body), max_files=1, max_fields=16)
+        try:
+            form = await parser.parse()
+        except _UploadTooLarge:
+            raise HTTPException(status_code=413, detail="Image payload too large")
+        except MultiPartException as exc:
+            raise HTTPException(status_code=400, detail=exc.message)
+        try:
+            upload = form.get("image")
+            if upload is None or isinstance(upload, str):
+                raise HTTPException(status_code=422, detail="image file is required")
+
+            data = await upload.read(max_bytes + 1)
+            if len(data) > max_bytes:
+                raise HTTPException(status_code=413, detail="Image payload too large")
+            fields = dict(request.query_params)
+            fields.update((key, value) for key, value in form.items() if isinstance(value, str))
+        finally:
+            await form.close()
+    else:
+        data = bytearray()
+        async for chunk in request.stream():
+            if len(data) + len(chunk) > max_bytes:
+                raise HTTPException(status_code=413, detail="Image payload too large")
+            data.extend(chunk)
+        fields = dict(request.query_params)
+
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty image payload")
+    return data, fields
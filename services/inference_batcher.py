@@ -0,0 +1,205 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+import anyio
+from fastapi import HTTPException
+
+from core.timing import record_stage
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+# Video frames: behind request traffic, ahead of bulk jobs
+PRIORITY_STREAM = 2
+PRIORITY_BACKGROUND = 3
+
+# Weight of the newest batch in the per-image service time estimate
+_SERVICE_TIME_ALPHA = 0.2
+
+
+@dataclass(frozen=True)
+class Admission:
+    deadline: float | None
+    priority: int = PRIORITY_STANDARD
+
+
+class AdmissionRejected(HTTPException):
+    # Shed by admission control; says nothing about the input, so callers sharing the work may retry it
+    pass
+
+
+# Set per HTTP request by api.admission; work without one (bulk jobs) is never shed and runs last
+current_admission: ContextVar[Admission | None] = ContextVar("inference_admission", default=None)
+
+
+class InferenceBatcher:
+    def __init__(
+        self,
+        run_batch,
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_concurrent_batches: int,
+        max_queue: int = 0,
+    ):
+        self._run_batch = run_batch
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000.0
+        self._max_concurrent_batches = max_concurrent_batches
+        self._max_queue = max_queue
+        self._lanes = [deque() for _ in range(PRIORITY_BACKGROUND + 1)]
+        self._ready: asyncio.Semaphore | None = None
+        self._executors: asyncio.Semaphore | None = None
+        self._collector: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+        self._item_seconds: float | None = None
+        self.in_flight = 0
+        self.on_shed = None
+
+    def _ensure_started(self) -> None:
+        # Created lazily so the semaphores and the collector bind to the server's running loop
+        if self._ready is None:
+            self._ready = asyncio.Semaphore(0)
+            self._executors = asyncio.Semaphore(self._max_concurrent_batches)
+            self._collector = asyncio.create_task(self._collect_loop())
+
+    def _estimated_wait(self, priority: int) -> float:
+        # Lower lanes never delay this one, so only same-or-higher priority work counts
+        if self._item_seconds is None:
+            return 0.0
+        ahead = self.in_flight + sum(len(lane) for lane in self._lanes[:priority + 1])
+        return ahead * self._item_seconds / self._max_concurrent_batches
+
+    def _shed(
+        self, reason: str, status_code: int, detail: str, retry_after: float | None = None
+    ) -> AdmissionRejected:
+        if self.on_shed is not None:
+            self.on_shed(reason)
+        headers = None
+        if retry_after is not None:
+            headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+        return AdmissionRejected(status_code=status_code, detail=detail, headers=headers)
+
+    def _admit(self, admission: Admission) -> None:
+        # Rejecting up front is cheap; admitting work that will miss its deadline only deepens the overload
+        wait = self._estimated_wait(admission.priority)
+        if self._max_queue and self.queue_depth() >= self._max_queue:
+            raise self._shed("overloaded", 503, "Inference queue is full", wait)
+        if admission.deadline is None:
+            return
+        remaining = admission.deadline - time.perf_counter()
+        if remaining <= 0:
+            raise self._shed("deadline_exceeded", 504, "Request deadline passed before inference")
+        if wait + (self._item_seconds or 0.0) > remaining:
+            raise self._shed("overloaded", 503, "Inference queue wait exceeds the request deadline", wait)
+
+    async def submit(self, item):
+        self._ensure_started()
+        admission = current_admission.get()
+        if admission is None:
+            priority, deadline = PRIORITY_BACKGROUND, None
+        else:
+            self._admit(admission)
+            priority, deadline = admission.priority, admission.deadline
+
+        future = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append((item, future, time.perf_counter(), deadline))
+        self._ready.release()
+        return await future
+
+    async def submit_many(self, items: list) -> list:
+        return list(await asyncio.gather(*(self.submit(item) for item in items)))
+
+    def _pop(self):
+        # One semaphore permit per queued item, so a non-empty lane always exists here
+        for lane in self._lanes:
+            if lane:
+                return lane.popleft()
+
+    async def _collect_batch(self) -> list:
+        await self._ready.acquire()
+        batch = [self._pop()]
+        # The wait window runs from the oldest item's arrival, so work that queued behind busy executors goes at once
+        deadline = batch[0][2] + self._max_wait
+
+        while len(batch) < self._max_batch_size:
+            if not self._ready.locked():
+                await self._ready.acquire()
+                batch.append(self._pop())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._ready.acquire(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(self._pop())
+
+        started = time.perf_counter()
+        live = []
+        for item, future, enqueued_at, item_deadline in batch:
+            record_stage("inference_queue", started - enqueued_at)
+            # Callers that gave up while queued are not worth a forward pass
+            if future.done():
+                continue
+            if item_deadline is not None and started >= item_deadline:
+                future.set_exception(
+                    self._shed("deadline_exceeded", 504, "Request deadline passed while queued for inference")
+                )
+                continue
+            live.append((item, future))
+        return live
+
+    def _observe_service_time(self, seconds: float, size: int) -> None:
+        per_item = seconds / size
+        if self._item_seconds is None:
+            self._item_seconds = per_item
+        else:
+            self._item_seconds += _SERVICE_TIME_ALPHA * (per_item - self._item_seconds)
+
+    async def _collect_loop(self) -> None:
+        # One collector forms every batch and starts it only once an executor is free; competing collectors
+        # would each grab the first queued item and split the queue into size-1 batches
+        while True:
+            await self._executors.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                self._executors.release()
+                raise
+            if not batch:
+                self._executors.release()
+                continue
+            task = asyncio.create_task(self._execute(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, batch: list) -> None:
+        self.in_flight += len(batch)
+        started = time.perf_counter()
+        try:
+            results = await anyio.to_thread.run_sync(self._run_batch, [item for item, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self.in_flight -= len(batch)
+            self._executors.release()
+
+        self._observe_service_time(time.perf_counter() - started, len(batch))
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            # run_batch reports an item's own failure as its exception, leaving the rest of the batch intact
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def queue_depth(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
@@ -0,0 +1,377 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from fastapi import HTTPException
+
+from core.timing import add_stage_observer, record_stage, stage
+from services.face_service import (
+    FaceRecognitionService,
+    call_isolated,
+    rescale_bboxes,
+    restore_failures,
+    split_decoded,
+)
+from services.image_decode import decode_image
+from services.inference_batcher import InferenceBatcher
+
+
+def _attach_shared_image(name: str, shape) -> tuple[SharedMemory, np.ndarray]:
+    shm = SharedMemory(name=name)
+    # The client owns the segment; stop this process's tracker from unlinking it on exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm, np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+
+def _worker_main(worker_id: int, cpu_ids: list[int], service_kwargs: dict, tasks, results) -> None:
+    if cpu_ids and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_ids)
+        print(f"[InferencePool] worker {worker_id} pinned to CPUs {cpu_ids}")
+
+    # Stage timings are taken here but exported by the API process that owns /metrics
+    timings = []
+    add_stage_observer(lambda name, seconds: timings.append((name, seconds)))
+
+    service = FaceRecognitionService(**service_kwargs)
+    service.warmup()
+    results.put(("ready", worker_id))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        task_id, frames = task
+        # Lets the supervisor fail this task if the worker dies or hangs on it
+        results.put(("claim", worker_id, task_id))
+        timings.clear()
+        handles, imgs = [], []
+        try:
+            for frame in frames:
+                if frame is None:
+                    imgs.append(None)
+                    continue
+                shm, img = _attach_shared_image(*frame)
+                handles.append(shm)
+                imgs.append(img)
+
+            payload = service.extract_embeddings_from_images_batch(imgs)
+        except Exception as exc:
+            payload = exc
+        finally:
+            del imgs
+            for shm in handles:
+                shm.close()
+        results.put(("result", worker_id, task_id, payload, list(timings)))
+
+
+def _write_authkey(path: str) -> bytes:
+    authkey = os.urandom(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+class InferencePoolServer:
+    def __init__(
+        self,
+        address: str,
+        authkey: bytes,
+        num_workers: int,
+        service_kwargs: dict,
+        pin_cpus: bool = True,
+        task_timeout_s: float = 30.0,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.num_workers = num_workers
+        self.service_kwargs = service_kwargs
+        self.pin_cpus = pin_cpus
+        self.task_timeout_s = task_timeout_s
+
+        ctx = mp.get_context("spawn")
+        self._ctx = ctx
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._workers = []
+        self._cpu_ids: list[list[int]] = []
+        self._task_ids = itertools.count()
+        self._waiters: dict[int, tuple] = {}
+        # worker_id -> (task_id, claimed_at) for the task each worker is running
+        self._claims: dict[int, tuple[int, float]] = {}
+        self._waiters_lock = threading.Lock()
+
+    def _cpu_sets(self) -> list[list[int]]:
+        if not self.pin_cpus or not hasattr(os, "sched_getaffinity"):
+            return [[] for _ in range(self.num_workers)]
+        cpus = sorted(os.sched_getaffinity(0))
+        return [cpus[i::self.num_workers] for i in range(self.num_workers)]
+
+    def _spawn(self, worker_id: int):
+        cpu_ids = self._cpu_ids[worker_id]
+        service_kwargs = self.service_kwargs
+        if not cpu_ids:
+            # Unpinned workers share every core, so their ONNX Runtime sessions split the threads
+            service_kwargs = {**service_kwargs, "max_concurrent_batches": self.num_workers}
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, cpu_ids, service_kwargs, self._tasks, self._results),
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def start(self) -> None:
+        self._cpu_ids = self._cpu_sets()
+        self._workers = [self._spawn(worker_id) for worker_id in range(self.num_workers)]
+
+        ready = 0
+        while ready < self.num_workers:
+            if self._results.get()[0] == "ready":
+                ready += 1
+        print(f"[InferencePool] {self.num_workers} workers ready")
+
+        threading.Thread(target=self._dispatch_results, daemon=True).start()
+        threading.Thread(target=self._supervise, daemon=True).start()
+
+    def _reply(self, task_id: int, response: tuple) -> None:
+        with self._waiters_lock:
+            waiter = self._waiters.pop(task_id, None)
+        if waiter is None:
+            return
+
+        conn, send_lock, request_id = waiter
+        try:
+            with send_lock:
+                conn.send((request_id, *response))
+        except (OSError, EOFError):
+            pass
+
+    def _dispatch_results(self) -> None:
+        while True:
+            message = self._results.get()
+            kind, worker_id = message[0], message[1]
+            if kind == "ready":
+                print(f"[InferencePool] worker {worker_id} ready")
+                # A claim from the replaced process can arrive after the supervisor already cleared its slot
+                with self._waiters_lock:
+                    claim = self._claims.pop(worker_id, None)
+                if claim is not None:
+                    self._reply(claim[0], (False, "Inference worker crashed", None))
+            elif kind == "claim":
+                with self._waiters_lock:
+                    self._claims[worker_id] = (message[2], time.monotonic())
+            else:
+                _, _, task_id, payload, timings = message
+                with self._waiters_lock:
+                    if self._claims.get(worker_id, (None,))[0] == task_id:
+                        del self._claims[worker_id]
+                self._reply(task_id, (True, payload, timings))
+
+    def _supervise(self) -> None:
+        # A crashed or wedged worker would otherwise leave its caller, and the API batcher behind it, waiting forever
+        while True:
+            time.sleep(1.0)
+            for worker_id, process in enumerate(self._workers):
+                with self._waiters_lock:
+                    claim = self._claims.get(worker_id)
+                if process.is_alive():
+                    if claim is None or time.monotonic() - claim[1] <= self.task_timeout_s:
+                        continue
+                    print(f"[InferencePool] worker {worker_id} stuck on a task for over {self.task_timeout_s}s")
+                    process.kill()
+                    process.join()
+                    reason = "Inference worker timed out"
+                else:
+                    print(f"[InferencePool] worker {worker_id} exited with code {process.exitcode}")
+                    reason = "Inference worker crashed"
+
+                with self._waiters_lock:
+                    claim = self._claims.pop(worker_id, None)
+                if claim is not None:
+                    self._reply(claim[0], (False, reason, None))
+                self._workers[worker_id] = self._spawn(worker_id)
+
+    def _serve_connection(self, conn) -> None:
+        send_lock = threading.Lock()
+        try:
+            while True:
+                request_id, frames = conn.recv()
+                task_id = next(self._task_ids)
+                with self._waiters_lock:
+                    self._waiters[task_id] = (conn, send_lock, request_id)
+                self._tasks.put((task_id, frames))
+        except (OSError, EOFError):
+            pass
+        finally:
+            with self._waiters_lock:
+                for task_id in [task_id for task_id, waiter in self._waiters.items() if waiter[0] is conn]:
+                    del self._waiters[task_id]
+            conn.close()
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        if not self.authkey:
+            # A fresh secret per launch, readable only by this user, instead of a default anyone can look up
+            self.authkey = _write_authkey(f"{self.address}.key")
+
+        self.start()
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            print(f"[InferencePool] listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (mp.AuthenticationError, OSError, EOFError) as exc:
+                    print(f"[InferencePool] rejected connection: {exc}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+class RemoteFaceService:
+    def __init__(
+        self,
+        address: str,
+        authkey: bytes,
+        max_batch_size: int = 8,
+        max_batch_wait_ms: float = 5.0,
+        max_concurrent_batches: int = 1,
+        max_queue_size: int = 0,
+        decode_min_long_side: int = 0,
+        timeout_s: float = 30.0,
+    ):
+        self.address = address
+        self.authkey = authkey
+        self.timeout_s = timeout_s
+        self._decode_min_long_side = decode_min_long_side
+        self._connections: queue.LifoQueue = queue.LifoQueue()
+        self._request_ids = itertools.count()
+        self.batcher = InferenceBatcher(
+            self.extract_embeddings_from_bytes_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_batch_wait_ms,
+            max_concurrent_batches=max_concurrent_batches,
+            max_queue=max_queue_size,
+        )
+
+    def _connect(self):
+        authkey = self.authkey
+        if not authkey:
+            # The pool writes a new key each launch, so it is read again for every new connection
+            with open(f"{self.address}.key", "rb") as f:
+                authkey = f.read()
+        return Client(self.address, family="AF_UNIX", authkey=authkey)
+
+    def warmup(self):
+        # Models are owned and warmed up by the pool; just make sure it is reachable
+        self._connections.put(self._connect())
+
+    async def extract_embedding(self, image_bytes):
+        return await self.batcher.submit(image_bytes)
+
+    async def extract_embeddings(self, images):
+        return await self.batcher.submit_many(images)
+
+    def extract_embedding_from_bytes(self, image_bytes):
+        return self.extract_embeddings_from_bytes_batch([image_bytes])[0]
+
+    def extract_embeddings_from_bytes_batch(self, images):
+        with stage("decode"):
+            decoded = [
+                call_isolated(decode_image, image_bytes, self._decode_min_long_side) for image_bytes in images
+            ]
+        imgs, scales = split_decoded(decoded)
+        results = restore_failures(self.extract_embeddings_from_images_batch(imgs), decoded)
+        return rescale_bboxes(results, scales)
+
+    def extract_embeddings_from_images_batch(self, imgs):
+        handles, frames = [], []
+        try:
+            for img in imgs:
+                if img is None:
+                    frames.append(None)
+                    continue
+                shm = SharedMemory(create=True, size=img.nbytes)
+                handles.append(shm)
+                np.ndarray(img.shape, dtype=np.uint8, buffer=shm.buf)[:] = img
+                frames.append((shm.name, img.shape))
+
+            return self._request(frames)
+        finally:
+            for shm in handles:
+                shm.close()
+                shm.unlink()
+
+    def _request(self, frames):
+        try:
+            conn = self._connections.get_nowait()
+        except queue.Empty:
+            try:
+                conn = self._connect()
+            except (OSError, EOFError, mp.AuthenticationError):
+                raise HTTPException(status_code=503, detail="Inference pool unavailable")
+
+        request_id = next(self._request_ids)
+        try:
+            conn.send((request_id, frames))
+            # A reply that never comes must not hold this thread and the batch behind it forever
+            if not conn.poll(self.timeout_s):
+                conn.close()
+                raise HTTPException(status_code=503, detail="Inference pool did not respond in time")
+            response_id, ok, payload, timings = conn.recv()
+        except (OSError, EOFError):
+            conn.close()
+            raise HTTPException(status_code=503, detail="Inference pool connection lost")
+
+        if response_id != request_id:
+            conn.close()
+            raise RuntimeError("Inference pool response out of order")
+
+        self._connections.put(conn)
+        if not ok:
+            raise HTTPException(status_code=503, detail=payload)
+        for name, seconds in timings:
+            record_stage(name, seconds)
+        if isinstance(payload, Exception):
+            raise payload
+        return payload
+
+
+def main() -> None:
+    from core.config import settings
+
+    server = InferencePoolServer(
+        address=settings.INFERENCE_POOL_ADDRESS,
+        authkey=settings.INFERENCE_POOL_AUTHKEY.encode(),
+        num_workers=settings.INFERENCE_POOL_WORKERS,
+        pin_cpus=settings.INFERENCE_POOL_PIN_CPUS,
+        task_timeout_s=settings.INFERENCE_POOL_TIMEOUT_S,
+        service_kwargs={
+            "model_name": settings.MODEL_NAME,
+            "providers": settings.FACE_PROVIDERS,
+            "det_size": settings.DET_SIZE,
+            "modules": settings.FACE_MODULES,
+            "small_det_size": settings.DET_SIZE_SMALL if settings.ADAPTIVE_DET_SIZE else None,
+            "small_det_min_face_ratio": settings.DET_SMALL_MIN_FACE_RATIO,
+            "session_options": {
+                "intra_op_threads": settings.ORT_INTRA_OP_THREADS,
+                "inter_op_threads": settings.ORT_INTER_OP_THREADS,
+                "graph_optimization": settings.ORT_GRAPH_OPTIMIZATION,
+                "execution_mode": settings.ORT_EXECUTION_MODE,
+                "optimized_model_dir": settings.ORT_OPTIMIZED_MODEL_DIR,
+            },
+        },
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
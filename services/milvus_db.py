@@ -1,23 +1,156 @@
+import threading
 import time
 
+import numpy as np
 from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, connections, utility
 
+from services.templates import exemplar_slots, gallery_pk, merge_centroid, template_key
+
+TENANT_FIELD = "tenant_id"
+
+# Rounds of recomputing templates that another process overwrote concurrently
+TEMPLATE_REPAIR_ATTEMPTS = 3
+
+# 1:1 verify of an uncached employee while the raw collection is released for an index rebuild
+INDEX_REBUILDING_ERROR = "Index rebuild in progress; employee vectors unavailable until it finishes"
+
+# Re-embedding the same photo with the same model agrees to within float noise
+DUPLICATE_SIMILARITY = 0.999
+
+DEFAULT_INDEX_PARAMS = {
+    "FLAT": {},
+    "IVF_FLAT": {"nlist": 128},
+    "IVF_SQ8": {"nlist": 128},
+    "HNSW": {"M": 16, "efConstruction": 200},
+}
+
+DEFAULT_SEARCH_PARAMS = {
+    "FLAT": {},
+    "IVF_FLAT": {"nprobe": 10},
+    "IVF_SQ8": {"nprobe": 10},
+    "HNSW": {"ef": 64},
+}
+
+
+def index_spec(index_type: str, params: dict | None = None, search_params: dict | None = None) -> dict:
+    return {
+        "index_type": index_type,
+        "params": {**DEFAULT_INDEX_PARAMS[index_type], **(params or {})},
+        "search_params": {**DEFAULT_SEARCH_PARAMS[index_type], **(search_params or {})},
+    }
+
+
+def same_index(a: dict | None, b: dict | None) -> bool:
+    if a is None or b is None:
+        return a is b
+    return a["index_type"] == b["index_type"] and a["params"] == b["params"]
+
+
+def employee_page(batches, limit: int, seen_before) -> tuple[list[str], int | None]:
+    # Lists employees in order of their first row. batches yields (pk, employee_id) rows in primary-key order
+    # after the cursor, and seen_before(employee_ids) returns those with a row at or before it, i.e. already
+    # listed. The next cursor is the last pk all of whose employees are listed, so a page resumes there
+    # instead of rescanning the collection.
+    page: list[str] = []
+    listed: set[str] = set()
+    previous_pk = None
+    for batch in batches:
+        fresh = sorted({employee_id for _, employee_id in batch if employee_id not in listed})
+        earlier = seen_before(fresh) if fresh else set()
+        for pk, employee_id in batch:
+            if employee_id not in listed and employee_id not in earlier:
+                if len(page) == limit:
+                    return page, previous_pk
+                page.append(employee_id)
+                listed.add(employee_id)
+            previous_pk = pk
+    return page, None
+
+
+def parse_cursor(cursor: str | None) -> int | None:
+    # Cursors are opaque to clients; they carry the primary key the previous page stopped at
+    if not cursor:
+        return None
+    if not cursor.isdigit():
+        raise ValueError("Invalid cursor")
+    return int(cursor)
+
+
+def quote_expr(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
 class MilvusDB:
-    def __init__(self):
-        self.collection_name = "face_embeddings"
+    def __init__(
+        self,
+        alias: str = "default",
+        inline_reconnect: bool = True,
+        index_type: str = "IVF_FLAT",
+        index_params: dict | None = None,
+        search_params: dict | None = None,
+        index_tiers: list[dict] | None = None,
+        collection_name: str = "face_embeddings",
+        multi_tenant: bool = False,
+        num_partitions: int = 64,
+        template_mode: bool = False,
+        max_exemplars: int = 0,
+        template_repair: bool = False,
+    ):
+        self.alias = alias
+        # Pooled instances leave reconnects to a background health loop
+        self.inline_reconnect = inline_reconnect
+        self.collection_name = collection_name
+        self.multi_tenant = multi_tenant
+        self.num_partitions = num_partitions
+        # Template mode searches one aggregate row per employee; raw vectors stay in collection_name
+        self.template_mode = template_mode
+        self.max_exemplars = max_exemplars
+        # Costs a Strong raw query and a template query per enroll; only worth it with several writer processes
+        self.template_repair = template_repair
+        self.templates_name = f"{collection_name}_templates"
+        self.templates_created = False
+        self._template_lock = threading.Lock()
         self.dim = 512
         self.host = None
         self.port = None
         self.connected = False
-        self._collection = None
-        self._collection_loaded = False
+        self._collections: dict = {}
+        self.gallery = None
+        self.vector_cache = None
+        self.options = {
+            "index_type": index_type,
+            "index_params": index_params,
+            "search_params": search_params,
+            "index_tiers": index_tiers,
+            "collection_name": collection_name,
+            "multi_tenant": multi_tenant,
+            "num_partitions": num_partitions,
+            "template_mode": template_mode,
+            "max_exemplars": max_exemplars,
+            "template_repair": template_repair,
+        }
+        self.index = index_spec(index_type, index_params, search_params)
+        self.index_tiers = []
+        for tier in sorted(index_tiers or [], key=lambda tier: tier["min_rows"]):
+            spec = index_spec(tier["index_type"], tier.get("params"), tier.get("search_params"))
+            self.index_tiers.append({"min_rows": tier["min_rows"], **spec})
+        # What the collection is actually indexed with; searches must use matching parameters
+        self.active_index = None
+        # Set while the searched collection is released for a rebuild; AsyncMilvusDB sets it on every pool member
+        self.rebuilding = False
+
+    def attach_gallery(self, gallery) -> None:
+        self.gallery = gallery
+
+    def attach_vector_cache(self, vector_cache) -> None:
+        self.vector_cache = vector_cache
 
     def connect(self, host, port, retries: int = 3, delay: float = 2.0):
         self.host = host
         self.port = port
         for attempt in range(1, retries + 1):
             try:
-                connections.connect(alias="default", host=host, port=port)
+                connections.connect(alias=self.alias, host=host, port=port)
                 self.connected = True
                 print("Connected to Milvus")
                 return True
@@ -28,71 +161,231 @@ class MilvusDB:
                     time.sleep(delay)
         return False
 
+    @property
+    def search_collection_name(self) -> str:
+        return self.templates_name if self.template_mode else self.collection_name
+
+    def _tenant_field(self) -> list:
+        if not self.multi_tenant:
+            return []
+        # Milvus hashes the key into partitions and prunes searches filtered on it
+        return [FieldSchema(name=TENANT_FIELD, dtype=DataType.VARCHAR, max_length=64, is_partition_key=True)]
+
+    def _ensure_collection(self, name: str, fields: list, description: str):
+        searched = name == self.search_collection_name
+        if utility.has_collection(name, using=self.alias):
+            collection = Collection(name, using=self.alias)
+            partitioned = any(field.name == TENANT_FIELD for field in collection.schema.fields)
+            if partitioned != self.multi_tenant:
+                print(
+                    f"create_collection error: {name} is "
+                    f"{'' if partitioned else 'not '}partitioned by {TENANT_FIELD} "
+                    f"but MULTI_TENANT={self.multi_tenant}; see services.tenant_migration"
+                )
+                return None
+            active = self._describe_index(collection)
+            if active is None:
+                self._create_index(collection, self.target_index(collection.num_entities), searched)
+            elif searched:
+                self.active_index = active
+        else:
+            options = {"num_partitions": self.num_partitions} if self.multi_tenant else {}
+            schema = CollectionSchema(fields + self._tenant_field(), description)
+            collection = Collection(name, schema=schema, using=self.alias, **options)
+            self._create_index(collection, self.target_index(0), searched)
+            if name == self.templates_name:
+                self.templates_created = True
+
+        collection.load()
+        self._collections[name] = collection
+        return collection
+
     def create_collection(self):
         try:
-            if utility.has_collection(self.collection_name):
-                self._collection = Collection(self.collection_name)
-                if not self._collection_loaded:
-                    self._collection.load()
-                    self._collection_loaded = True
-                return self._collection
-
-            fields = [
-                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-                FieldSchema(name="employee_id", dtype=DataType.VARCHAR, max_length=100),
-                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dim),
-            ]
-
-            schema = CollectionSchema(fields, "Face embeddings")
-            collection = Collection(self.collection_name, schema=schema)
-
-            index_params = {
-                "metric_type": "IP",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 128},
-            }
-
-            collection.create_index("embedding", index_params=index_params)
-            collection.load()
-            self._collection = collection
-            self._collection_loaded = True
-            return collection
+            collection = self._ensure_collection(
+                self.collection_name,
+                [
+                    FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+                    FieldSchema(name="employee_id", dtype=DataType.VARCHAR, max_length=100),
+                    FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dim),
+                ],
+                "Face embeddings",
+            )
+            if collection is None or not self.template_mode:
+                return collection
+
+            templates = self._ensure_collection(
+                self.templates_name,
+                [
+                    # Upserted in place, so the key is deterministic rather than auto-generated
+                    FieldSchema(name="key", dtype=DataType.VARCHAR, is_primary=True, max_length=256),
+                    FieldSchema(name="employee_id", dtype=DataType.VARCHAR, max_length=100),
+                    FieldSchema(name="enroll_count", dtype=DataType.INT64),
+                    FieldSchema(name="sum_norm", dtype=DataType.FLOAT),
+                    FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dim),
+                ],
+                "Per-employee face templates",
+            )
+            return None if templates is None else collection
         except Exception as e:
             # If the call fails because there's no connection, mark as not connected
             print(f"create_collection error: {e}")
             self.connected = False
             return None
 
-    def get_collection(self):
-        # Ensure we have a recorded connection; if not, attempt to reconnect once
-        if not self.connected and self.host and self.port:
-            try:
-                connections.connect(alias="default", host=self.host, port=self.port)
-                self.connected = True
-            except Exception as e:
-                print(f"Reconnection failed: {e}")
-                self.connected = False
+    def _create_index(self, collection, spec: dict, searched: bool = True) -> None:
+        collection.create_index(
+            "embedding",
+            index_params={"metric_type": "IP", "index_type": spec["index_type"], "params": spec["params"]},
+        )
+        if searched:
+            self.active_index = self._matching_spec(spec["index_type"], spec["params"])
+
+    def _describe_index(self, collection) -> dict | None:
+        for index in collection.indexes:
+            if index.field_name != "embedding":
+                continue
+            info = dict(index.params)
+            index_type = info.pop("index_type", None)
+            if index_type not in DEFAULT_INDEX_PARAMS:
                 return None
+            params = info.get("params")
+            if params is None:
+                # Older servers report build parameters flattened next to the index type
+                params = {key: value for key, value in info.items() if key in DEFAULT_INDEX_PARAMS[index_type]}
+            return self._matching_spec(index_type, {key: int(value) for key, value in params.items()})
+        return None
+
+    def _matching_spec(self, index_type: str, params: dict) -> dict:
+        # Reuse the configured search parameters of whichever setting built this index
+        for spec in [self.index] + self.index_tiers:
+            if spec["index_type"] == index_type and spec["params"] == params:
+                return {"index_type": index_type, "params": params, "search_params": spec["search_params"]}
+        return {"index_type": index_type, "params": params, "search_params": DEFAULT_SEARCH_PARAMS[index_type]}
+
+    def target_index(self, num_entities: int) -> dict:
+        # Without tiers the configured index applies at every size
+        target = self.index
+        for tier in self.index_tiers:
+            if num_entities >= tier["min_rows"]:
+                target = tier
+        return target
+
+    def _search_params(self, limit: int) -> dict:
+        params = dict((self.active_index or self.index)["search_params"])
+        if "ef" in params:
+            # HNSW rejects an ef smaller than the requested top-k
+            params["ef"] = max(params["ef"], limit)
+        return {"metric_type": "IP", "params": params}
+
+    def index_status(self) -> dict:
+        if not self.connected:
+            return {"success": False, "error": "Milvus not connected"}
+
+        col = self.get_collection(self.search_collection_name)
+        if col is None:
+            return {"success": False, "error": "Collection not found"}
 
         try:
-            if self._collection:
-                if not self._collection_loaded:
-                    self._collection.load()
-                    self._collection_loaded = True
-                return self._collection
+            num_entities = col.num_entities
+            active = self._describe_index(col)
+            target = self.target_index(num_entities)
+            return {
+                "success": True,
+                "collection": self.search_collection_name,
+                "num_entities": num_entities,
+                "active": active,
+                "target": target,
+                "rebuild_recommended": not same_index(active, target),
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def rebuild_keeps_reads(self) -> bool:
+        # Templates are re-indexed while the raw rows stay loaded; otherwise only a fresh mirror can answer reads
+        return self.template_mode or (self.gallery is not None and self.gallery.is_fresh())
+
+    def rebuild_index(self, index_type: str | None = None, params: dict | None = None) -> dict:
+        if not self.connected:
+            return {"success": False, "error": "Milvus not connected"}
+
+        col = self.get_collection(self.search_collection_name)
+        if col is None:
+            return {"success": False, "error": "Collection not found"}
+
+        try:
+            if index_type is None:
+                spec = self.target_index(col.num_entities)
+            else:
+                spec = index_spec(index_type, params)
+
+            # Milvus only drops the index of a released collection; searches fail until it is loaded again
+            started = time.perf_counter()
+            self.rebuilding = True
+            col.release()
+            col.drop_index()
+            self._create_index(col, spec)
+            col.load()
+            return {
+                "success": True,
+                "active": self.active_index,
+                "elapsed_s": time.perf_counter() - started,
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        finally:
+            self.rebuilding = False
 
-            if utility.has_collection(self.collection_name):
-                self._collection = Collection(self.collection_name)
-                self._collection.load()
-                self._collection_loaded = True
-                return self._collection
+    def reconnect(self) -> bool:
+        if not self.host or not self.port:
+            return False
+        try:
+            connections.connect(alias=self.alias, host=self.host, port=self.port)
+            self.connected = True
+            return True
+        except Exception as e:
+            print(f"Reconnection failed: {e}")
+            self.connected = False
+            return False
+
+    def get_collection(self, name: str | None = None):
+        name = name or self.collection_name
+        # Ensure we have a recorded connection; if not, attempt to reconnect once
+        if not self.connected and self.inline_reconnect and not self.reconnect():
+            return None
+
+        try:
+            collection = self._collections.get(name)
+            if collection is not None:
+                return collection
+
+            if utility.has_collection(name, using=self.alias):
+                collection = Collection(name, using=self.alias)
+                collection.load()
+                self._collections[name] = collection
+                return collection
             return None
         except Exception as e:
             print(f"get_collection error: {e}")
             self.connected = False
             return None
 
-    def insert_embedding(self, employee_id, embedding):
+    def _scoped_expr(self, expr: str | None, tenant: str | None) -> str | None:
+        if not self.multi_tenant or tenant is None:
+            return expr
+        tenant_expr = f"{TENANT_FIELD} == {quote_expr(tenant)}"
+        return f"({expr}) and {tenant_expr}" if expr else tenant_expr
+
+    @staticmethod
+    def _exclude_expr(employee_ids) -> str | None:
+        if not employee_ids:
+            return None
+        return f"employee_id not in [{', '.join(quote_expr(employee_id) for employee_id in employee_ids)}]"
+
+    def insert_embedding(self, employee_id, embedding, tenant: str | None = None):
+        return self.insert_embeddings([employee_id], [embedding], tenants=[tenant])
+
+    def insert_embeddings(self, employee_ids, embeddings, flush: bool = True, tenants=None):
         if not self.connected:
             return {"success": False, "error": "Milvus not connected"}
 
@@ -100,17 +393,217 @@ class MilvusDB:
         if col is None:
             return {"success": False, "error": "Collection not found"}
 
+        if self.multi_tenant and (tenants is None or not all(tenants)):
+            return {"success": False, "error": "Tenant is required"}
+
         try:
-            data = [[employee_id], [embedding.tolist()]]
+            data = [list(employee_ids), [embedding.tolist() for embedding in embeddings]]
+            if self.multi_tenant:
+                data.append(list(tenants))
 
             result = col.insert(data)
+            if flush:
+                col.flush()
+            if self.vector_cache is not None:
+                self.vector_cache.invalidate(
+                    zip(tenants if self.multi_tenant else [None] * len(employee_ids), employee_ids)
+                )
+
+            if not self.template_mode and self.gallery is not None:
+                self.gallery.add(result.primary_keys, employee_ids, embeddings, tenants)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+        if self.template_mode:
+            try:
+                tenants = list(tenants) if tenants is not None else [None] * len(employee_ids)
+                self._update_templates(employee_ids, embeddings, tenants, flush)
+            except Exception as e:
+                # The raw rows are stored; a caller that retries must redo only the templates, or they land twice
+                return {"success": False, "error": str(e), "raw_inserted": True, "insert_count": result.insert_count}
+
+        return {"success": True, "insert_count": result.insert_count}
+
+    def _template_query(self, col, expr: str) -> list[dict]:
+        # Strong consistency so a read-modify-write sees the previous upsert
+        return col.query(
+            expr=expr,
+            output_fields=["key", "enroll_count", "sum_norm", "embedding"],
+            consistency_level="Strong",
+        )
+
+    def _upsert_template_rows(self, col, rows: list[tuple], flush: bool) -> None:
+        data = [
+            [key for key, _, _, _, _, _ in rows],
+            [employee_id for _, employee_id, _, _, _, _ in rows],
+            [count for _, _, count, _, _, _ in rows],
+            [sum_norm for _, _, _, sum_norm, _, _ in rows],
+            [embedding.tolist() for _, _, _, _, embedding, _ in rows],
+        ]
+        if self.multi_tenant:
+            data.append([tenant for _, _, _, _, _, tenant in rows])
+        col.upsert(data)
+        if flush:
             col.flush()
 
-            return {"success": True, "insert_count": result.insert_count}
+        if self.gallery is not None:
+            self.gallery.upsert(
+                [gallery_pk(key) for key, _, _, _, _, _ in rows],
+                [employee_id for _, employee_id, _, _, _, _ in rows],
+                [embedding for _, _, _, _, embedding, _ in rows],
+                [tenant for _, _, _, _, _, tenant in rows],
+            )
+
+    def _template_rows(self, employee_id, tenant, vectors, state) -> list[tuple]:
+        count = state["enroll_count"] if state else 0
+        centroid, sum_norm = merge_centroid(
+            state["embedding"] if state else None, state["sum_norm"] if state else 0.0, vectors
+        )
+        rows = [(template_key(employee_id, tenant), employee_id, count + len(vectors), sum_norm, centroid, tenant)]
+        for slot, idx in exemplar_slots(count, len(vectors), self.max_exemplars):
+            rows.append((template_key(employee_id, tenant, slot), employee_id, 0, 0.0, vectors[idx], tenant))
+        return rows
+
+    def _update_templates(self, employee_ids, embeddings, tenants, flush: bool) -> None:
+        col = self.get_collection(self.templates_name)
+        if col is None:
+            raise RuntimeError("Template collection not found")
+
+        groups: dict[tuple, list] = {}
+        for employee_id, embedding, tenant in zip(employee_ids, embeddings, tenants):
+            groups.setdefault((tenant, employee_id), []).append(np.asarray(embedding, dtype=np.float32))
+
+        # Serialised so two enrollments of one employee cannot both build on the same old centroid
+        with self._template_lock:
+            keys = [template_key(employee_id, tenant) for tenant, employee_id in groups]
+            states = {
+                row["key"]: row
+                for row in self._template_query(col, f"key in [{', '.join(quote_expr(key) for key in keys)}]")
+            }
+            rows = []
+            for key, ((tenant, employee_id), vectors) in zip(keys, groups.items()):
+                rows += self._template_rows(employee_id, tenant, vectors, states.get(key))
+            self._upsert_template_rows(col, rows, flush)
+            if self.template_repair:
+                self._repair_templates(col, list(groups), flush)
+
+    def _repair_templates(self, templates, employees: list[tuple], flush: bool) -> bool:
+        # The lock above only covers this process. Another worker enrolling the same employee at the same time
+        # can build on the same old centroid, and one update is lost. The raw rows are the source of truth, so a
+        # template whose enroll_count disagrees with them is recomputed from scratch.
+        raw = self.get_collection()
+        for _ in range(TEMPLATE_REPAIR_ATTEMPTS):
+            stale = self._stale_templates(raw, templates, employees)
+            if not stale:
+                return True
+            rows = []
+            for (tenant, employee_id), vectors in self._raw_vectors(raw, stale).items():
+                rows += self._template_rows(employee_id, tenant, vectors, None)
+            self._upsert_template_rows(templates, rows, flush)
+        print(f"[MilvusDB] templates still disagree with raw rows after {TEMPLATE_REPAIR_ATTEMPTS} repairs")
+        return False
+
+    def refresh_templates(self, employee_ids, tenants=None) -> dict:
+        # For raw rows stored without their template update (a failed update, or a crash in between). Templates
+        # that already count every raw row are left alone, so calling this twice cannot add a photo twice.
+        if not self.template_mode:
+            return {"success": True}
+        tenants = list(tenants) if tenants is not None else [None] * len(employee_ids)
+        try:
+            col = self.get_collection(self.templates_name)
+            if col is None:
+                return {"success": False, "error": "Template collection not found"}
+            with self._template_lock:
+                if not self._repair_templates(col, list(dict.fromkeys(zip(tenants, employee_ids))), flush=False):
+                    return {"success": False, "error": "Templates still disagree with raw rows"}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True}
+
+    def _raw_query(self, raw, employees: list[tuple], output_fields: list[str]) -> list[dict]:
+        id_list = ", ".join(quote_expr(employee_id) for employee_id in {employee_id for _, employee_id in employees})
+        if self.multi_tenant:
+            output_fields = output_fields + [TENANT_FIELD]
+        rows = raw.query(
+            expr=f"employee_id in [{id_list}]", output_fields=output_fields, consistency_level="Strong"
+        )
+        wanted = set(employees)
+        return [row for row in rows if (row.get(TENANT_FIELD), row["employee_id"]) in wanted]
+
+    def _stale_templates(self, raw, templates, employees: list[tuple]) -> list[tuple]:
+        raw_counts = dict.fromkeys(employees, 0)
+        for row in self._raw_query(raw, employees, ["id", "employee_id"]):
+            raw_counts[(row.get(TENANT_FIELD), row["employee_id"])] += 1
+
+        keys = {template_key(employee_id, tenant): (tenant, employee_id) for tenant, employee_id in employees}
+        counts = {
+            keys[row["key"]]: row["enroll_count"]
+            for row in self._template_query(templates, f"key in [{', '.join(quote_expr(key) for key in keys)}]")
+        }
+        return [employee for employee in employees if counts.get(employee, 0) != raw_counts[employee]]
+
+    def _raw_vectors(self, raw, employees: list[tuple]) -> dict[tuple, list]:
+        # Primary-key order is enrollment order, which keeps the exemplar ring the same as incremental updates
+        groups: dict[tuple, list] = {}
+        for row in sorted(self._raw_query(raw, employees, ["id", "employee_id", "embedding"]), key=lambda r: r["id"]):
+            key = (row.get(TENANT_FIELD), row["employee_id"])
+            groups.setdefault(key, []).append(np.asarray(row["embedding"], dtype=np.float32))
+        return groups
+
+    def rebuild_templates(self, page_size: int = 200) -> dict:
+        # Recomputes every template from the raw vectors, e.g. after enabling TEMPLATE_MODE on old data
+        if not self.template_mode:
+            return {"success": False, "error": "Template mode disabled"}
+        if not self.connected:
+            return {"success": False, "error": "Milvus not connected"}
+
+        raw = self.get_collection()
+        templates = self.get_collection(self.templates_name)
+        if raw is None or templates is None:
+            return {"success": False, "error": "Collection not found"}
+
+        employees = 0
+        cursor = None
+        try:
+            while True:
+                page = self.list_employee_ids(cursor, page_size)
+                if not page.get("success", False):
+                    return page
+                if not page["employee_ids"]:
+                    break
+
+                id_list = ", ".join(quote_expr(employee_id) for employee_id in page["employee_ids"])
+                output_fields = ["id", "employee_id", "embedding"] + ([TENANT_FIELD] if self.multi_tenant else [])
+                vectors = sorted(
+                    raw.query(expr=f"employee_id in [{id_list}]", output_fields=output_fields),
+                    key=lambda row: row["id"],
+                )
+                groups: dict[tuple, list] = {}
+                for row in vectors:
+                    key = (row.get(TENANT_FIELD), row["employee_id"])
+                    groups.setdefault(key, []).append(np.asarray(row["embedding"], dtype=np.float32))
+
+                with self._template_lock:
+                    templates.delete(expr=f"employee_id in [{id_list}]")
+                    if self.gallery is not None:
+                        for employee_id in page["employee_ids"]:
+                            self.gallery.remove_employee(employee_id)
+                    rows = []
+                    for (tenant, employee_id), group in groups.items():
+                        rows += self._template_rows(employee_id, tenant, group, None)
+                    self._upsert_template_rows(templates, rows, flush=False)
+
+                employees += len(groups)
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+
+            templates.flush()
+            return {"success": True, "templates": employees}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def search_similar(self, embedding, threshold, limit=1):
+    def flush(self) -> dict:
         if not self.connected:
             return {"success": False, "error": "Milvus not connected"}
 
@@ -119,35 +612,138 @@ class MilvusDB:
             return {"success": False, "error": "Collection not found"}
 
         try:
-            search_params = {"metric_type": "IP", "params": {"nprobe": 10}}
+            col.flush()
+            if self.template_mode:
+                self.get_collection(self.templates_name).flush()
+            return {"success": True}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def search_similar(
+        self, embedding, threshold, limit=1, tenant: str | None = None, exclude=None, use_gallery: bool = True
+    ):
+        result = self.search_similar_batch([embedding], threshold, limit, tenant, exclude, use_gallery)
+        if not result.get("success", False):
+            return result
+        return result["results"][0]
+
+    def search_similar_batch(
+        self, embeddings, threshold, limit=1, tenant: str | None = None, exclude=None, use_gallery: bool = True
+    ):
+        thresholds = threshold if isinstance(threshold, (list, tuple)) else [threshold] * len(embeddings)
+        # The local mirror is exact; Milvus is only consulted when it is disabled or stale, or to confirm a miss
+        if use_gallery and self.gallery is not None and limit == 1 and not exclude and self.gallery.is_fresh():
+            results = self.gallery.search_batch(embeddings, thresholds, tenant)
+            return {"success": True, "results": self.recheck_misses(embeddings, thresholds, tenant, results)}
+        return self._search_milvus(embeddings, thresholds, limit, tenant, exclude)
+
+    def recheck_misses(self, embeddings, thresholds, tenant: str | None, results: list[dict]) -> list[dict]:
+        # Enrollments made by other workers only reach the mirror at its next sync, so a miss is confirmed in Milvus
+        misses = [idx for idx, result in enumerate(results) if not result.get("matched", False)]
+        if not misses or not self.connected:
+            return results
+
+        fallback = self._search_milvus(
+            [embeddings[idx] for idx in misses], [thresholds[idx] for idx in misses], 1, tenant, None
+        )
+        # Milvus being unavailable (e.g. mid-rebuild) leaves the mirror's answer standing
+        if not fallback.get("success", False):
+            return results
+        results = list(results)
+        for idx, result in zip(misses, fallback["results"]):
+            if result.get("matched", False):
+                results[idx] = result
+        return results
+
+    def _search_milvus(self, embeddings, thresholds: list, limit: int, tenant: str | None, exclude) -> dict:
+        if not self.connected:
+            return {"success": False, "error": "Milvus not connected"}
 
+        col = self.get_collection(self.search_collection_name)
+        if col is None:
+            return {"success": False, "error": "Collection not found"}
+
+        try:
             results = col.search(
-                data=[embedding.tolist()],
+                data=[embedding.tolist() for embedding in embeddings],
                 anns_field="embedding",
-                param=search_params,
+                param=self._search_params(limit),
                 limit=limit,
+                expr=self._scoped_expr(self._exclude_expr(exclude), tenant),
                 output_fields=["employee_id"],
             )
+            return {
+                "success": True,
+                "results": [self._hits_to_match(hits, t) for hits, t in zip(results, thresholds)],
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _employee_vectors(self, employee_id: str, tenant: str | None) -> np.ndarray:
+        key = (tenant, employee_id)
+        generation = None
+        if self.vector_cache is not None:
+            vectors = self.vector_cache.get(key)
+            if vectors is not None:
+                return vectors
+            generation = self.vector_cache.generation
+
+        if self.rebuilding and self.search_collection_name == self.collection_name:
+            # Without templates the raw collection itself is released for the rebuild; only the mirror can answer
+            if self.gallery is not None and self.gallery.is_fresh():
+                return self.gallery.employee_vectors(employee_id, tenant)
+            raise RuntimeError(INDEX_REBUILDING_ERROR)
+
+        expr = self._scoped_expr(f"employee_id == {quote_expr(employee_id)}", tenant)
+        try:
+            # Raw photos, not templates: in template mode this collection stays loaded while templates are re-indexed
+            col = self.get_collection()
+            if col is None:
+                raise RuntimeError("Collection not found")
+            rows = col.query(expr=expr, output_fields=["embedding"], consistency_level="Strong")
+        except Exception:
+            # Without templates the raw collection is the one being rebuilt; the mirror still has the vectors
+            if self.gallery is None or not self.gallery.is_fresh():
+                raise
+            return self.gallery.employee_vectors(employee_id, tenant)
+
+        vectors = np.asarray([row["embedding"] for row in rows], dtype=np.float32).reshape(-1, self.dim)
+        if self.vector_cache is not None:
+            self.vector_cache.put(key, vectors, generation)
+        return vectors
+
+    def verify_employee(self, embedding, employee_id: str, threshold, tenant: str | None = None) -> dict:
+        # 1:1 check against one employee's own vectors; its cost does not grow with the gallery
+        try:
+            vectors = self._employee_vectors(employee_id, tenant)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        if vectors.shape[0] == 0:
+            return {"success": False, "error": f"Employee {employee_id} not found"}
 
-            if results and results[0]:
-                top = results[0][0]
-                sim = top.distance
+        # Stored vectors and queries are unit length, so the dot product is the IP score Milvus reports
+        sim = float(np.max(vectors @ np.asarray(embedding, dtype=np.float32)))
+        return {"success": True, "matched": sim >= threshold, "employee_id": employee_id, "similarity": sim}
 
-                if sim >= threshold:
-                    return {
-                        "success": True,
-                        "matched": True,
-                        "employee_id": top.entity.get("employee_id"),
-                        "similarity": float(sim),
-                    }
+    @staticmethod
+    def _hits_to_match(hits, threshold):
+        if hits:
+            top = hits[0]
+            sim = top.distance
 
-                return {"success": True, "matched": False, "similarity": float(sim)}
+            if sim >= threshold:
+                return {
+                    "success": True,
+                    "matched": True,
+                    "employee_id": top.entity.get("employee_id"),
+                    "similarity": float(sim),
+                }
 
-            return {"success": True, "matched": False, "message": "No match found"}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+            return {"success": True, "matched": False, "similarity": float(sim)}
+
+        return {"success": True, "matched": False, "message": "No match found"}
 
-    def delete_by_employee_id(self, employee_id: str) -> dict:
+    def delete_by_employee_id(self, employee_id: str, tenant: str | None = None, flush: bool = True) -> dict:
         if not self.connected:
             return {"success": False, "error": "Milvus not connected"}
 
@@ -156,36 +752,209 @@ class MilvusDB:
             return {"success": False, "error": "Collection not found"}
 
         try:
-            res = col.query(expr=f"employee_id == '{employee_id}'", output_fields=["employee_id"])
+            expr = self._scoped_expr(f"employee_id == {quote_expr(employee_id)}", tenant)
+            # Strong read, then delete by primary key, so unflushed rows from the same write group go too
+            res = col.query(expr=expr, output_fields=["id"], consistency_level="Strong")
             if not res:
                 return {"success": False, "error": f"Employee {employee_id} not found"}
 
-            col.delete(expr=f"employee_id == '{employee_id}'")
-            col.flush()
+            col.delete(expr=f"id in [{', '.join(str(row['id']) for row in res)}]")
+            if flush:
+                col.flush()
+            if self.vector_cache is not None:
+                self.vector_cache.invalidate([(tenant, employee_id)])
+
+            if self.template_mode:
+                templates = self.get_collection(self.templates_name)
+                with self._template_lock:
+                    keys = [row["key"] for row in self._template_query(templates, expr)]
+                    if keys:
+                        templates.delete(expr=f"key in [{', '.join(quote_expr(key) for key in keys)}]")
+                    if flush:
+                        templates.flush()
+
+            if self.gallery is not None:
+                self.gallery.remove_employee(employee_id, tenant)
+
             return {"success": True, "employee_id": employee_id}
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def list_employee_ids(self):
+    def has_employee(self, employee_id: str, tenant: str | None = None) -> dict:
+        try:
+            return {"success": True, "exists": self._employee_vectors(employee_id, tenant).shape[0] > 0}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def has_embedding(self, employee_id: str, embedding, tenant: str | None = None) -> dict:
+        # Whether this exact photo is already stored for the employee, so a resumed insert can be skipped
+        try:
+            vectors = self._employee_vectors(employee_id, tenant)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        if vectors.shape[0] == 0:
+            return {"success": True, "exists": False}
+        sim = float(np.max(vectors @ np.asarray(embedding, dtype=np.float32)))
+        return {"success": True, "exists": sim >= DUPLICATE_SIMILARITY}
+
+    def apply_writes(self, writes: list) -> dict:
+        # One group from the write-behind buffer, in arrival order: runs of inserts share a call, the group a flush.
+        # "template" writes already have their raw row stored and only need the template update redone.
+        applied = 0
+        try:
+            idx = 0
+            while idx < len(writes):
+                kind = writes[idx].kind
+                if kind == "delete":
+                    write = writes[idx]
+                    result = self.delete_by_employee_id(write.employee_id, write.tenant, flush=False)
+                    # Gone already (deleted by another worker) is the state the delete asked for
+                    if not result.get("success", False) and not result.get("error", "").endswith("not found"):
+                        raise RuntimeError(result.get("error"))
+                    idx += 1
+                else:
+                    end = idx
+                    while end < len(writes) and writes[end].kind == kind:
+                        end += 1
+                    run = writes[idx:end]
+                    employee_ids = [write.employee_id for write in run]
+                    embeddings = [write.embedding for write in run]
+                    tenants = [write.tenant for write in run]
+                    if kind == "template":
+                        self._update_templates(employee_ids, embeddings, tenants, flush=False)
+                    else:
+                        result = self.insert_embeddings(employee_ids, embeddings, flush=False, tenants=tenants)
+                        if result.get("raw_inserted"):
+                            return {
+                                "success": False,
+                                "error": result.get("error"),
+                                "applied": idx,
+                                "raw_applied": end - idx,
+                            }
+                        if not result.get("success", False):
+                            raise RuntimeError(result.get("error"))
+                    idx = end
+                applied = idx
+        except Exception as e:
+            return {"success": False, "error": str(e), "applied": applied}
+
+        # Inserted rows are already durable in the Milvus log; a failed flush only delays sealing
+        flush_result = self.flush()
+        return {**flush_result, "applied": applied}
+
+    def sync_gallery(self, batch_size: int = 1000) -> dict:
+        if self.gallery is None:
+            return {"success": False, "error": "Gallery index disabled"}
+        if not self.connected:
+            return {"success": False, "error": "Milvus not connected"}
+
+        col = self.get_collection(self.search_collection_name)
+        if col is None:
+            return {"success": False, "error": "Collection not found"}
+
+        # The mirror holds whatever searches run against: raw vectors or templates
+        pk_field = "key" if self.template_mode else "id"
+        self.gallery.begin_sync()
+        try:
+            pks, employee_ids, embeddings, tenants = [], [], [], []
+            output_fields = [pk_field, "employee_id", "embedding"] + ([TENANT_FIELD] if self.multi_tenant else [])
+            iterator = col.query_iterator(batch_size=batch_size, output_fields=output_fields)
+            try:
+                while True:
+                    rows = iterator.next()
+                    if not rows:
+                        break
+                    for row in rows:
+                        pks.append(gallery_pk(row["key"]) if self.template_mode else row["id"])
+                        employee_ids.append(row["employee_id"])
+                        embeddings.append(row["embedding"])
+                        tenants.append(row.get(TENANT_FIELD))
+            finally:
+                iterator.close()
+
+            self.gallery.finish_sync(pks, employee_ids, embeddings, tenants)
+            return {"success": True, "count": len(pks)}
+        except Exception as e:
+            self.gallery.abort_sync()
+            return {"success": False, "error": str(e)}
+
+    def list_employee_ids(
+        self,
+        cursor: str | None = None,
+        limit: int = 1000,
+        with_counts: bool = False,
+        batch_size: int = 1000,
+        tenant: str | None = None,
+    ):
         if not self.connected:
             return {"success": False, "error": "Milvus not connected"}
 
         col = self.get_collection()
         if col is None:
             return {"success": False, "error": "Collection not found"}
+
         try:
-            res = col.query(expr="employee_id != ''", output_fields=["employee_id"])
-            employee_ids = [item["employee_id"] for item in res]
-            return {"success": True, "employee_ids": employee_ids}
+            after = parse_cursor(cursor)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+
+        def _batches():
+            expr = self._scoped_expr(f"id > {after}" if after is not None else "employee_id != ''", tenant)
+            iterator = col.query_iterator(batch_size=batch_size, expr=expr, output_fields=["employee_id"])
+            try:
+                while True:
+                    rows = iterator.next()
+                    if not rows:
+                        break
+                    yield [(row["id"], row["employee_id"]) for row in rows]
+            finally:
+                iterator.close()
+
+        def _seen_before(employee_ids: list[str]) -> set[str]:
+            if after is None:
+                return set()
+            id_list = ", ".join(quote_expr(employee_id) for employee_id in employee_ids)
+            expr = self._scoped_expr(f"employee_id in [{id_list}] and id <= {after}", tenant)
+            return {row["employee_id"] for row in col.query(expr=expr, output_fields=["employee_id"])}
+
+        try:
+            # Rows come back in primary-key order, so a page reads only from its cursor to its last employee
+            page, next_pk = employee_page(_batches(), limit, _seen_before)
+            result = {
+                "success": True,
+                "employee_ids": page,
+                "next_cursor": str(next_pk) if next_pk is not None else None,
+            }
+            if with_counts:
+                result["vector_counts"] = self._vector_counts(col, page, batch_size, tenant)
+            return result
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _vector_counts(self, col, employee_ids: list[str], batch_size: int, tenant: str | None) -> dict[str, int]:
+        counts = dict.fromkeys(employee_ids, 0)
+        if not employee_ids:
+            return counts
+        id_list = ", ".join(quote_expr(employee_id) for employee_id in employee_ids)
+        expr = self._scoped_expr(f"employee_id in [{id_list}]", tenant)
+        iterator = col.query_iterator(batch_size=batch_size, expr=expr, output_fields=["employee_id"])
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                for row in rows:
+                    counts[row["employee_id"]] += 1
+        finally:
+            iterator.close()
+        return counts
+
     def health(self) -> dict:
         if not self.connected:
             return {"success": False, "error": "Milvus not connected"}
 
         try:
-            if not utility.has_collection(self.collection_name):
+            if not utility.has_collection(self.collection_name, using=self.alias):
                 return {"success": False, "error": "Collection not found"}
             # Touch the collection metadata to ensure liveness
             col = self.get_collection()
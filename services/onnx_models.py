@@ -0,0 +1,133 @@
+import functools
+import hashlib
+import os
+import os.path as osp
+import platform
+
+import onnxruntime
+from insightface.app import FaceAnalysis
+
+_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+_EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def usable_cpus() -> int:
+    # Pool workers are pinned to a CPU subset, so the affinity mask is the real budget
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def make_session_options(
+    intra_op_threads: int = 0,
+    inter_op_threads: int = 1,
+    graph_optimization: str = "all",
+    execution_mode: str = "sequential",
+    concurrent_sessions: int = 1,
+) -> onnxruntime.SessionOptions:
+    sess_options = onnxruntime.SessionOptions()
+    # Every concurrent inference batch drives its own session run; splitting the cores keeps them from thrashing
+    sess_options.intra_op_num_threads = intra_op_threads or max(1, usable_cpus() // concurrent_sessions)
+    sess_options.inter_op_num_threads = inter_op_threads
+    sess_options.graph_optimization_level = _OPTIMIZATION_LEVELS[graph_optimization]
+    sess_options.execution_mode = _EXECUTION_MODES[execution_mode]
+    return sess_options
+
+
+@functools.lru_cache(maxsize=1)
+def cpu_fingerprint() -> str:
+    # ORT_ENABLE_ALL bakes in layout transforms (NCHWc) sized for the ISA it ran on, e.g. AVX2 vs AVX-512
+    features = ""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() in ("flags", "Features"):
+                    features = " ".join(sorted(value.split()))
+                    break
+    except OSError:
+        pass
+    digest = hashlib.sha1(f"{platform.machine()} {features}".encode()).hexdigest()[:10]
+    return f"{platform.machine() or 'cpu'}-{digest}"
+
+
+def _cache_path(cache_dir: str, model_file: str, provider: str, graph_optimization: str) -> str:
+    # Optimized graphs may hold provider-, version- and CPU-specific kernels, so the key covers all three;
+    # a cache on a shared volume is then never loaded on a host with a different instruction set
+    stem = osp.splitext(osp.basename(model_file))[0]
+    tag = f"{provider}.{graph_optimization}.ort{onnxruntime.__version__}.{cpu_fingerprint()}"
+    return osp.join(osp.expanduser(cache_dir), osp.basename(osp.dirname(model_file)), f"{stem}.{tag}.onnx")
+
+
+def create_session(
+    model_file: str,
+    providers: list[str],
+    options: dict,
+    concurrent_sessions: int = 1,
+) -> onnxruntime.InferenceSession:
+    graph_optimization = options.get("graph_optimization", "all")
+    cache_dir = options.get("optimized_model_dir")
+
+    def session_options():
+        return make_session_options(
+            intra_op_threads=options.get("intra_op_threads", 0),
+            inter_op_threads=options.get("inter_op_threads", 1),
+            graph_optimization=graph_optimization,
+            execution_mode=options.get("execution_mode", "sequential"),
+            concurrent_sessions=concurrent_sessions,
+        )
+
+    if not cache_dir or graph_optimization == "disable":
+        return onnxruntime.InferenceSession(model_file, sess_options=session_options(), providers=providers)
+
+    available = onnxruntime.get_available_providers()
+    provider = next((prov for prov in providers if prov in available), "CPUExecutionProvider")
+    cached = _cache_path(cache_dir, model_file, provider, graph_optimization)
+
+    if osp.exists(cached):
+        # The saved graph is already optimized; running the optimizer again would only repeat the cold-start cost
+        sess_options = session_options()
+        sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return onnxruntime.InferenceSession(cached, sess_options=sess_options, providers=providers)
+        except Exception as exc:
+            print(f"[ONNXRuntime] Ignoring unreadable optimized model {cached}: {exc}")
+
+    os.makedirs(osp.dirname(cached), exist_ok=True)
+    # Pool workers start together; writing aside and renaming means a half-written file is never loaded
+    partial = f"{cached}.{os.getpid()}.tmp"
+    sess_options = session_options()
+    sess_options.optimized_model_filepath = partial
+    session = onnxruntime.InferenceSession(model_file, sess_options=sess_options, providers=providers)
+    try:
+        os.replace(partial, cached)
+        print(f"[ONNXRuntime] Saved optimized model {cached}")
+    except OSError as exc:
+        print(f"[ONNXRuntime] Could not save optimized model {cached}: {exc}")
+    return session
+
+
+class FaceModels(FaceAnalysis):
+    # FaceAnalysis routes the model pack; the models it keeps get their sessions rebuilt with the tuned options
+    def __init__(
+        self,
+        model_name: str,
+        providers: list[str],
+        modules: list[str] | None = None,
+        session_options: dict | None = None,
+        concurrent_sessions: int = 1,
+        root: str = "~/.insightface",
+    ):
+        super().__init__(name=model_name, root=root, allowed_modules=modules, providers=providers)
+        for model in self.models.values():
+            # Same graph, so the input/output names the model read from its routing session stay valid
+            model.session = create_session(model.model_file, providers, session_options or {}, concurrent_sessions)
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from services.face_tracker import FaceTracker, Track
+from services.inference_batcher import PRIORITY_STREAM, Admission, current_admission
+
+
+class StreamVerifier:
+    def __init__(
+        self,
+        face_service,
+        milvus,
+        tracker: FaceTracker,
+        threshold: float,
+        frame_slots: asyncio.Semaphore,
+        tenant: str | None = None,
+        frame_deadline_ms: float = 0.0,
+    ):
+        self.face_service = face_service
+        self.milvus = milvus
+        self.tracker = tracker
+        self.threshold = threshold
+        self.tenant = tenant
+        # Shared across connections so camera streams cannot fill the inference queue on their own
+        self._frame_slots = frame_slots
+        self._frame_deadline_s = frame_deadline_ms / 1000.0
+        self.frames = 0
+        self.recognitions = 0
+
+    @staticmethod
+    def _scaled(bbox, scale: float) -> list[float]:
+        return [float(value) * scale for value in bbox]
+
+    def _admission(self) -> Admission:
+        # A frame answered late is worthless, so each one carries its own deadline in the stream lane
+        deadline = time.perf_counter() + self._frame_deadline_s if self._frame_deadline_s > 0 else None
+        return Admission(deadline=deadline, priority=PRIORITY_STREAM)
+
+    async def process_frame(self, data) -> list[dict]:
+        self.frames += 1
+        frame = self.frames
+
+        token = current_admission.set(self._admission())
+        try:
+            async with self._frame_slots:
+                try:
+                    img, scale, detections = await self.face_service.detect_frame(data)
+                except HTTPException as exc:
+                    return [{"event": "error", "frame": frame, "error": exc.detail}]
+                if img is None:
+                    return [{"event": "error", "frame": frame, "error": "Failed to decode image bytes"}]
+
+                visible, lost = self.tracker.update(detections)
+                events = [
+                    {"event": "lost", "frame": frame, "track_id": track.track_id, "employee_id": track.employee_id}
+                    for track in lost
+                ]
+                pending = [track for track in visible if self.tracker.needs_recognition(track)]
+                if not pending:
+                    return events
+                # Only new or doubtful tracks pay for ArcFace; steady ones reuse their last match
+                try:
+                    embeddings = await self.face_service.embed_frame(img, [track.kps for track in pending])
+                except HTTPException as exc:
+                    # The tracks stay unrecognized and are retried on the next frame
+                    return events + [{"event": "error", "frame": frame, "error": exc.detail}]
+        finally:
+            current_admission.reset(token)
+
+        return events + await self._recognize(frame, scale, pending, embeddings)
+
+    async def _recognize(self, frame: int, scale: float, tracks: list[Track], embeddings) -> list[dict]:
+        result = await self.milvus.search_similar_batch(list(embeddings), self.threshold, tenant=self.tenant)
+        if not result.get("success", False):
+            return [{"event": "error", "frame": frame, "error": result.get("error")}]
+
+        self.recognitions += len(tracks)
+        events = []
+        for track, match in zip(tracks, result["results"]):
+            self.tracker.mark_recognized(track, match)
+            events.append({
+                "event": "match",
+                "frame": frame,
+                "track_id": track.track_id,
+                "matched": track.matched,
+                "employee_id": track.employee_id,
+                "similarity": track.similarity,
+                "threshold": self.threshold,
+                "bbox": self._scaled(track.bbox, scale),
+                "detection_score": track.det_score,
+            })
+        return events
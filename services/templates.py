@@ -0,0 +1,57 @@
+import argparse
+import hashlib
+import json
+
+import numpy as np
+
+
+def template_key(employee_id: str, tenant: str | None, slot: int | None = None) -> str:
+    # JSON keeps keys unambiguous whatever characters the IDs contain; slot None is the centroid row
+    return json.dumps([tenant, employee_id, slot], separators=(",", ":"))
+
+
+def gallery_pk(key: str) -> int:
+    # Template rows have string keys; the in-process gallery indexes rows by int64
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def merge_centroid(centroid, sum_norm: float, embeddings) -> tuple[np.ndarray, float]:
+    # centroid * sum_norm recovers the running sum of unit vectors, so updates need no history
+    total = np.sum(np.asarray(embeddings, dtype=np.float32), axis=0)
+    if centroid is not None:
+        total = total + np.asarray(centroid, dtype=np.float32) * sum_norm
+    norm = float(np.linalg.norm(total))
+    if norm > 0:
+        total = total / norm
+    return total.astype(np.float32), norm
+
+
+def exemplar_slots(count_before: int, count_new: int, max_exemplars: int) -> list[tuple[int, int]]:
+    # Ring buffer of the most recent photos: (slot, index into the new embeddings)
+    if max_exemplars <= 0:
+        return []
+    return [
+        ((count_before + idx) % max_exemplars, idx)
+        for idx in range(max(0, count_new - max_exemplars), count_new)
+    ]
+
+
+def main() -> None:
+    from core.config import settings
+    from core.container import container
+
+    parser = argparse.ArgumentParser(description="Rebuild per-employee templates from the raw enrollment vectors")
+    parser.add_argument("--page-size", type=int, default=200, help="Employees recomputed per round trip")
+    args = parser.parse_args()
+
+    if not settings.TEMPLATE_MODE:
+        raise SystemExit("TEMPLATE_MODE is disabled")
+
+    db = container.milvus_db
+    if not db.connect(settings.MILVUS_HOST, settings.MILVUS_PORT) or db.create_collection() is None:
+        raise SystemExit("Milvus not ready")
+    print(json.dumps(db.rebuild_templates(args.page_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
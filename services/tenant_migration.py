@@ -0,0 +1,111 @@
+import argparse
+import csv
+import json
+
+import numpy as np
+from pymilvus import Collection, utility
+
+from services.milvus_db import MilvusDB
+
+
+def load_tenant_map(path: str) -> dict[str, str]:
+    # CSV with a header: employee_id,tenant
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        return {row["employee_id"]: row["tenant"] for row in csv.DictReader(fh) if row.get("tenant")}
+
+
+def migrate(
+    source_name: str,
+    target: MilvusDB,
+    tenant_map: dict[str, str],
+    default_tenant: str | None,
+    batch_size: int,
+) -> dict:
+    if not utility.has_collection(source_name, using=target.alias):
+        return {"success": False, "error": f"Source collection {source_name} not found"}
+    if utility.has_collection(target.collection_name, using=target.alias):
+        return {"success": False, "error": f"Target collection {target.collection_name} already exists"}
+    if target.create_collection() is None:
+        return {"success": False, "error": "Could not create the target collection"}
+
+    source = Collection(source_name, using=target.alias)
+    source.load()
+
+    copied, unmapped = 0, set()
+    iterator = source.query_iterator(batch_size=batch_size, output_fields=["employee_id", "embedding"])
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+
+            employee_ids, embeddings, tenants = [], [], []
+            for row in rows:
+                tenant = tenant_map.get(row["employee_id"], default_tenant)
+                if not tenant:
+                    unmapped.add(row["employee_id"])
+                    continue
+                employee_ids.append(row["employee_id"])
+                embeddings.append(np.asarray(row["embedding"], dtype=np.float32))
+                tenants.append(tenant)
+
+            if employee_ids:
+                result = target.insert_embeddings(employee_ids, embeddings, flush=False, tenants=tenants)
+                if not result.get("success", False):
+                    return {"success": False, "error": result.get("error"), "copied": copied}
+                copied += len(employee_ids)
+                print(f"[TenantMigration] copied {copied} vectors")
+    finally:
+        iterator.close()
+
+    flush_result = target.flush()
+    if not flush_result.get("success", False):
+        return {"success": False, "error": flush_result.get("error"), "copied": copied}
+
+    return {
+        "success": True,
+        "source": source_name,
+        "target": target.collection_name,
+        "copied": copied,
+        "unmapped_employees": sorted(unmapped),
+    }
+
+
+def main() -> None:
+    from core.config import settings
+
+    parser = argparse.ArgumentParser(
+        description="Copy an unpartitioned face collection into a new collection partitioned by tenant"
+    )
+    parser.add_argument("target", help="Name of the new partitioned collection")
+    parser.add_argument("--source", default=settings.MILVUS_COLLECTION, help="Existing unpartitioned collection")
+    parser.add_argument("--tenant-map", help="CSV of employee_id,tenant")
+    parser.add_argument("--default-tenant", help="Tenant for employees missing from the map")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per read/insert")
+    args = parser.parse_args()
+
+    if not args.tenant_map and not args.default_tenant:
+        parser.error("give --tenant-map, --default-tenant or both")
+
+    target = MilvusDB(
+        alias="tenant-migration",
+        index_type=settings.MILVUS_INDEX_TYPE,
+        index_params=settings.MILVUS_INDEX_PARAMS,
+        search_params=settings.MILVUS_SEARCH_PARAMS,
+        index_tiers=settings.MILVUS_INDEX_TIERS,
+        collection_name=args.target,
+        multi_tenant=True,
+        num_partitions=settings.MILVUS_NUM_PARTITIONS,
+    )
+    if not target.connect(settings.MILVUS_HOST, settings.MILVUS_PORT):
+        raise SystemExit("Milvus not connected")
+
+    tenant_map = load_tenant_map(args.tenant_map) if args.tenant_map else {}
+    result = migrate(args.source, target, tenant_map, args.default_tenant, args.batch_size)
+    print(json.dumps(result, indent=2))
+    if result["success"]:
+        print(f"Switch the service over with MILVUS_COLLECTION={args.target} MULTI_TENANT=true")
+
+
+if __name__ == "__main__":
+    main()
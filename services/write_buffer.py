@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+# Pause before retrying a group that failed without applying anything (Milvus down, collection missing)
+_RETRY_DELAY_S = 1.0
+_DRAIN_ATTEMPTS = 3
+
+
+@dataclass(frozen=True)
+class PendingWrite:
+    # "insert", "delete", or "template": an insert whose raw row is stored but whose template update failed
+    kind: str
+    employee_id: str
+    tenant: str | None = None
+    embedding: np.ndarray | None = None
+
+
+class OverlayView:
+    # Writes not yet visible in Milvus for one tenant: rows to score and employees whose stored rows are gone
+    def __init__(self, matrix: np.ndarray, employee_ids: list[str], masked: set[str]):
+        self.matrix = matrix
+        self.employee_ids = employee_ids
+        self.masked = masked
+
+    def vectors_for(self, employee_id: str) -> np.ndarray:
+        rows = [idx for idx, row_employee in enumerate(self.employee_ids) if row_employee == employee_id]
+        return self.matrix[rows]
+
+    def merge(self, embedding, threshold: float, result: dict) -> dict:
+        if not self.employee_ids or not result.get("success", False):
+            return result
+        scores = self.matrix @ np.asarray(embedding, dtype=np.float32)
+        idx = int(np.argmax(scores))
+        sim = float(scores[idx])
+        if "similarity" in result and sim <= result["similarity"]:
+            return result
+        if sim >= threshold:
+            return {"success": True, "matched": True, "employee_id": self.employee_ids[idx], "similarity": sim}
+        return {"success": True, "matched": False, "similarity": sim}
+
+
+class WriteBehindBuffer:
+    def __init__(self, max_batch: int, max_delay_ms: float, max_pending: int, visibility_grace_s: float):
+        self.max_batch = max_batch
+        self._max_delay = max_delay_ms / 1000.0
+        self.max_pending = max_pending
+        # Milvus searches are bounded-staleness, so committed writes stay in the overlay a little longer
+        self._visibility_grace_s = visibility_grace_s
+        self._pending: list[PendingWrite] = []
+        self._recent: deque[tuple[float, PendingWrite]] = deque()
+        self._commit = None
+        self._commit_task: asyncio.Task | None = None
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._closing = asyncio.Event()
+        self._version = 0
+        self._views: dict = {}
+        self._views_version = -1
+        self.committed = 0
+        self.groups = 0
+        self.failures = 0
+
+    def bind(self, commit) -> None:
+        # commit(writes) -> {"success", "applied", "raw_applied"?, "error"?}; runs the Milvus side of one group
+        self._commit = commit
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def is_full(self) -> bool:
+        return len(self._pending) >= self.max_pending
+
+    def add(self, write: PendingWrite) -> None:
+        self._pending.append(write)
+        self._version += 1
+        if self._commit_task is not None and not self._commit_task.done():
+            # The running commit loop picks this up as part of its next group
+            return
+        if len(self._pending) >= self.max_batch:
+            self._start_commit()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._max_delay, self._start_commit)
+
+    def _start_commit(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.create_task(self._commit_loop())
+
+    async def _commit_group(self) -> bool:
+        group = self._pending[: self.max_batch]
+        result = await self._commit(group)
+        applied = result.get("applied", 0)
+        raw_applied = result.get("raw_applied", 0)
+        if raw_applied:
+            # Their raw rows are stored, so the retry must only redo the templates or the rows would be inserted twice
+            self._pending[applied:applied + raw_applied] = [
+                replace(write, kind="template") for write in self._pending[applied:applied + raw_applied]
+            ]
+            self._version += 1
+        if applied:
+            expires_at = time.monotonic() + self._visibility_grace_s
+            self._recent.extend((expires_at, write) for write in group[:applied])
+            del self._pending[:applied]
+            self._version += 1
+            self.committed += applied
+            self.groups += 1
+        if not result.get("success", False):
+            self.failures += 1
+            print(f"[WriteBuffer] group commit failed after {applied}/{len(group)} writes: {result.get('error')}")
+        return applied > 0
+
+    async def _try_commit_group(self) -> bool:
+        try:
+            return await self._commit_group()
+        except Exception as exc:
+            self.failures += 1
+            print(f"[WriteBuffer] group commit failed: {exc}")
+            return False
+
+    async def _commit_loop(self) -> None:
+        # Writes that arrive while a group is committing form the next group, so one flush covers all of them
+        while self._pending:
+            if await self._try_commit_group():
+                continue
+            if self._closing.is_set():
+                return
+            try:
+                await asyncio.wait_for(self._closing.wait(), _RETRY_DELAY_S)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> None:
+        # A group already handed to Milvus must finish rather than be cancelled, or it would be applied twice
+        self._closing.set()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._commit_task is not None:
+            await self._commit_task
+
+        for _ in range(_DRAIN_ATTEMPTS):
+            if not self._pending:
+                return
+            await self._try_commit_group()
+        print(f"[WriteBuffer] {len(self._pending)} acknowledged writes could not be committed on shutdown")
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._recent and self._recent[0][0] < now:
+            self._recent.popleft()
+            self._version += 1
+
+    def view(self, tenant: str | None) -> OverlayView | None:
+        self._expire()
+        if not self._pending and not self._recent:
+            return None
+        if self._views_version != self._version:
+            self._views = {}
+            self._views_version = self._version
+
+        view = self._views.get(tenant)
+        if view is None:
+            view = self._views[tenant] = self._build_view(tenant)
+        return view
+
+    def _build_view(self, tenant: str | None) -> OverlayView:
+        writes = [write for _, write in self._recent] + self._pending
+        if tenant is not None:
+            writes = [write for write in writes if write.tenant == tenant]
+
+        # A delete hides every earlier row of that employee; inserts after it stay visible
+        last_delete = {write.employee_id: idx for idx, write in enumerate(writes) if write.kind == "delete"}
+        rows = [
+            write for idx, write in enumerate(writes)
+            if write.kind != "delete" and idx > last_delete.get(write.employee_id, -1)
+        ]
+        if rows:
+            matrix = np.stack([np.asarray(write.embedding, dtype=np.float32) for write in rows])
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        return OverlayView(matrix, [write.employee_id for write in rows], set(last_delete))
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "recent": len(self._recent),
+            "committed": self.committed,
+            "groups": self.groups,
+            "failures": self.failures,
+        }
@@ -0,0 +1,4 @@
+import os
+
+# Settings require a Milvus host; tests never connect to it
+os.environ.setdefault("MILVUS_HOST", "localhost")
@@ -0,0 +1,52 @@
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from api.admission import AdmissionMiddleware
+from services.inference_batcher import PRIORITY_INTERACTIVE, PRIORITY_STANDARD, PRIORITY_STREAM, current_admission
+
+
+def _describe() -> dict:
+    admission = current_admission.get()
+    return {"priority": admission.priority, "has_deadline": admission.deadline is not None}
+
+
+def _client(default_deadline_ms: float) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, default_deadline_ms=default_deadline_ms)
+
+    @app.get("/verify/probe")
+    async def verify_probe():
+        return _describe()
+
+    @app.get("/enroll/probe")
+    async def enroll_probe():
+        return _describe()
+
+    @app.websocket("/ws/probe")
+    async def ws_probe(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_json(_describe())
+        await websocket.close()
+
+    return TestClient(app)
+
+
+def test_no_deadline_unless_configured_or_requested():
+    client = _client(default_deadline_ms=0)
+
+    assert client.get("/enroll/probe").json() == {"priority": PRIORITY_STANDARD, "has_deadline": False}
+    response = client.get("/verify/probe", headers={"X-Request-Timeout-Ms": "500"})
+    assert response.json() == {"priority": PRIORITY_INTERACTIVE, "has_deadline": True}
+
+
+def test_configured_default_deadline_applies():
+    client = _client(default_deadline_ms=10_000)
+
+    assert client.get("/enroll/probe").json()["has_deadline"]
+
+
+def test_websocket_runs_in_the_stream_lane_without_a_request_deadline():
+    client = _client(default_deadline_ms=10_000)
+
+    with client.websocket_connect("/ws/probe") as websocket:
+        assert websocket.receive_json() == {"priority": PRIORITY_STREAM, "has_deadline": False}
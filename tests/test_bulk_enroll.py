@@ -0,0 +1,133 @@
+import asyncio
+import json
+
+import numpy as np
+from fastapi import HTTPException
+
+from benchmarks.fake_milvus import InMemoryMilvusDB
+from services.bulk_enroll import BulkEnrollJob
+
+DIM = 8
+
+
+class FakePipeline:
+    # image_url -> unit vector, or the HTTPException a download of it raises
+    def __init__(self, outcomes: dict):
+        self.outcomes = outcomes
+
+    async def from_url(self, image_url):
+        outcome = self.outcomes[image_url]
+        if isinstance(outcome, HTTPException):
+            raise outcome
+        return {"success": True, "embedding": outcome}
+
+
+def _unit(axis: int) -> np.ndarray:
+    return np.eye(DIM, dtype=np.float32)[axis]
+
+
+def _job(tmp_path, rows: list[tuple[str, str]], outcomes: dict, db: InMemoryMilvusDB) -> BulkEnrollJob:
+    source = tmp_path / "job.csv"
+    source.write_text("employee_id,image_url\n" + "".join(f"{emp},{url}\n" for emp, url in rows))
+    return BulkEnrollJob(
+        job_id="job",
+        source_path=str(source),
+        state_dir=str(tmp_path),
+        pipeline=FakePipeline(outcomes),
+        milvus_db=db,
+        concurrency=2,
+        insert_batch_size=10,
+    )
+
+
+def _report_rows(tmp_path) -> list[int]:
+    lines = (tmp_path / "job.errors.jsonl").read_text().splitlines()
+    return sorted(json.loads(line)["row"] for line in lines)
+
+
+def test_resume_skips_rows_inserted_before_the_checkpoint(tmp_path):
+    db = InMemoryMilvusDB(dim=DIM)
+    outcomes = {"a.jpg": _unit(0), "b.jpg": _unit(1)}
+    # The previous run inserted row 1 and crashed before checkpointing it
+    db.insert_embeddings(["alice"], [_unit(0)])
+    (tmp_path / "job.inflight").write_text("1\n")
+
+    job = _job(tmp_path, [("alice", "a.jpg"), ("bob", "b.jpg")], outcomes, db)
+    progress = asyncio.run(job.run())
+
+    assert progress["status"] == "completed"
+    assert (progress["enrolled"], progress["skipped"]) == (1, 1)
+    assert sorted(row[0] for _, row in db._visible(None)) == ["alice", "bob"]
+    assert (tmp_path / "job.done").read_text().split() == ["1", "2"]
+
+
+def test_uncertain_row_missing_from_milvus_is_inserted(tmp_path):
+    db = InMemoryMilvusDB(dim=DIM)
+    (tmp_path / "job.inflight").write_text("1\n")
+
+    job = _job(tmp_path, [("alice", "a.jpg")], {"a.jpg": _unit(0)}, db)
+    progress = asyncio.run(job.run())
+
+    assert progress["enrolled"] == 1
+    assert [row[0] for _, row in db._visible(None)] == ["alice"]
+
+
+def test_oversized_image_is_final_and_report_has_one_entry_per_row(tmp_path):
+    db = InMemoryMilvusDB(dim=DIM)
+    outcomes = {
+        "slow.jpg": HTTPException(status_code=408, detail="Timeout while downloading image"),
+        "huge.jpg": HTTPException(status_code=413, detail="Image too large"),
+    }
+    rows = [("alice", "slow.jpg"), ("bob", "huge.jpg")]
+
+    for _ in range(3):
+        progress = asyncio.run(_job(tmp_path, rows, outcomes, db).run())
+        assert _report_rows(tmp_path) == [1, 2]
+
+    # Only the timeout is retried on resume; the 413 was checkpointed the first time
+    assert progress["skipped"] == 1
+    assert (tmp_path / "job.done").read_text().split() == ["2"]
+
+
+class TemplateDB(InMemoryMilvusDB):
+    # Raw rows land but the first template update fails, as insert_embeddings reports it in template mode
+    def __init__(self, refresh_ok: bool = True):
+        super().__init__(dim=DIM)
+        self.template_mode = True
+        self.refresh_ok = refresh_ok
+        self.refreshed = []
+
+    def insert_embeddings(self, employee_ids, embeddings, flush=True, tenants=None):
+        super().insert_embeddings(employee_ids, embeddings, flush, tenants)
+        return {"success": False, "error": "templates down", "raw_inserted": True, "insert_count": len(employee_ids)}
+
+    def refresh_templates(self, employee_ids, tenants=None):
+        self.refreshed.append(list(employee_ids))
+        return {"success": True} if self.refresh_ok else {"success": False, "error": "templates down"}
+
+
+def test_failed_template_update_is_retried_without_reinserting(tmp_path):
+    db = TemplateDB()
+    job = _job(tmp_path, [("alice", "a.jpg"), ("bob", "b.jpg")], {"a.jpg": _unit(0), "b.jpg": _unit(1)}, db)
+    progress = asyncio.run(job.run())
+
+    assert progress["status"] == "completed" and progress["enrolled"] == 2
+    assert [sorted(employee_ids) for employee_ids in db.refreshed] == [["alice", "bob"]]
+    assert sorted(row[0] for _, row in db._visible(None)) == ["alice", "bob"]
+
+
+def test_resumed_row_refreshes_its_template_before_it_is_skipped(tmp_path):
+    db = TemplateDB(refresh_ok=False)
+    InMemoryMilvusDB.insert_embeddings(db, ["alice"], [_unit(0)])
+    (tmp_path / "job.inflight").write_text("1\n")
+
+    progress = asyncio.run(_job(tmp_path, [("alice", "a.jpg")], {"a.jpg": _unit(0)}, db).run())
+    assert db.refreshed == [["alice"]]
+    assert progress["skipped"] == 0 and _report_rows(tmp_path) == [1]
+    assert not (tmp_path / "job.done").exists()
+
+    db.refresh_ok = True
+    progress = asyncio.run(_job(tmp_path, [("alice", "a.jpg")], {"a.jpg": _unit(0)}, db).run())
+    assert progress["skipped"] == 1
+    assert (tmp_path / "job.done").read_text().split() == ["1"]
+    assert len(db._visible(None)) == 1
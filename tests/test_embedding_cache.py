@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from services.embedding_cache import EmbeddingCache
+from services.inference_batcher import AdmissionRejected
+
+
+def _cache() -> EmbeddingCache:
+    return EmbeddingCache(max_entries=8, ttl_s=60.0)
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "vector"
+
+    async def scenario():
+        cache = _cache()
+        results = await asyncio.gather(*(cache.run_once("k", compute) for _ in range(3)))
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert results == ["vector"] * 3
+    assert len(calls) == 1
+    assert cache.coalesced == 2
+
+
+def test_cancelled_starter_does_not_cancel_followers():
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "vector"
+
+    async def scenario():
+        cache = _cache()
+        starter = asyncio.create_task(cache.run_once("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.run_once("k", compute))
+        await asyncio.sleep(0.01)
+        starter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await starter
+        return await follower
+
+    assert asyncio.run(scenario()) == "vector"
+
+
+def test_last_waiter_cancelling_stops_the_computation():
+    finished = []
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+
+    async def scenario():
+        cache = _cache()
+        caller = asyncio.create_task(cache.run_once("k", compute))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0.08)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert finished == []
+    assert cache.stats()["entries"] == 0
+
+
+def test_follower_retries_when_the_starter_is_shed():
+    calls = []
+
+    def compute_for(owner):
+        async def compute():
+            calls.append(owner)
+            await asyncio.sleep(0.01)
+            if owner == "starter":
+                raise AdmissionRejected(status_code=504, detail="Request deadline passed before inference")
+            return owner
+        return compute
+
+    async def scenario():
+        cache = _cache()
+        starter = asyncio.create_task(cache.run_once("k", compute_for("starter")))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.run_once("k", compute_for("follower")))
+        with pytest.raises(AdmissionRejected):
+            await starter
+        return await follower
+
+    assert asyncio.run(scenario()) == "follower"
+    assert calls == ["starter", "follower"]
+
+
+def test_errors_are_shared_but_never_cached():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        raise ValueError("no face")
+
+    async def scenario():
+        cache = _cache()
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await cache.get_or_compute("k", compute)
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert cache.get("k") is None
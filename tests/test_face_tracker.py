@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from services.face_tracker import FaceTracker, iou
+from services.inference_batcher import PRIORITY_STREAM, AdmissionRejected, current_admission
+from services.stream_verifier import StreamVerifier
+
+
+def _det(bbox, score=0.9):
+    return {"bbox": bbox, "det_score": score, "kps": None}
+
+
+def test_iou():
+    assert iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert iou([0, 0, 10, 10], [20, 20, 30, 30]) == 0.0
+    assert iou([0, 0, 10, 10], [5, 0, 15, 10]) == pytest.approx(50 / 150)
+
+
+def test_overlapping_detection_continues_its_track():
+    tracker = FaceTracker(iou_threshold=0.3)
+    (first,), _ = tracker.update([_det([0, 0, 10, 10])])
+    (second,), lost = tracker.update([_det([1, 1, 11, 11])])
+
+    assert second.track_id == first.track_id
+    assert second.bbox == [1, 1, 11, 11]
+    assert second.frames_since_recognition == 1
+    assert lost == []
+
+
+def test_distant_detection_starts_a_new_track():
+    tracker = FaceTracker(iou_threshold=0.3)
+    tracker.update([_det([0, 0, 10, 10])])
+    visible, _ = tracker.update([_det([50, 50, 60, 60])])
+
+    assert [track.track_id for track in visible] == [2]
+    assert set(tracker.tracks) == {1, 2}
+
+
+def test_best_overlap_wins_when_two_detections_compete():
+    tracker = FaceTracker(iou_threshold=0.1)
+    tracker.update([_det([0, 0, 10, 10])])
+    visible, _ = tracker.update([_det([4, 0, 14, 10]), _det([1, 0, 11, 10])])
+
+    by_id = {track.track_id: track for track in visible}
+    assert by_id[1].bbox == [1, 0, 11, 10]
+    assert by_id[2].bbox == [4, 0, 14, 10]
+
+
+def test_track_is_lost_after_max_missed_frames():
+    tracker = FaceTracker(max_missed=2)
+    tracker.update([_det([0, 0, 10, 10])])
+
+    assert tracker.update([]) == ([], [])
+    assert tracker.update([]) == ([], [])
+    _, lost = tracker.update([])
+    assert [track.track_id for track in lost] == [1]
+    assert tracker.tracks == {}
+
+
+def test_recognition_is_skipped_until_confidence_drops_or_retry_is_due():
+    tracker = FaceTracker(confidence_drop=0.15, unmatched_retry_frames=3, min_det_score=0.5)
+    (track,), _ = tracker.update([_det([0, 0, 10, 10], score=0.3)])
+    assert not tracker.needs_recognition(track)
+
+    (track,), _ = tracker.update([_det([0, 0, 10, 10], score=0.9)])
+    assert tracker.needs_recognition(track)
+    tracker.mark_recognized(track, {"matched": True, "employee_id": "EMP001", "similarity": 0.8})
+    assert not tracker.needs_recognition(track)
+
+    (track,), _ = tracker.update([_det([0, 0, 10, 10], score=0.7)])
+    assert tracker.needs_recognition(track)
+
+    tracker.mark_recognized(track, {"matched": False})
+    for _ in range(2):
+        (track,), _ = tracker.update([_det([0, 0, 10, 10], score=0.7)])
+        assert not tracker.needs_recognition(track)
+    (track,), _ = tracker.update([_det([0, 0, 10, 10], score=0.7)])
+    assert tracker.needs_recognition(track)
+
+
+class FakeFaceService:
+    def __init__(self, shed_embed=False):
+        self.shed_embed = shed_embed
+        self.admissions = []
+
+    async def detect_frame(self, data):
+        self.admissions.append(current_admission.get())
+        return object(), 1.0, [_det([0, 0, 10, 10])]
+
+    async def embed_frame(self, img, kpss):
+        self.admissions.append(current_admission.get())
+        if self.shed_embed:
+            raise AdmissionRejected(status_code=503, detail="Inference queue is full")
+        return [[1.0, 0.0]] * len(kpss)
+
+
+class FakeMilvus:
+    async def search_similar_batch(self, embeddings, threshold, tenant=None):
+        return {"success": True, "results": [{"matched": True, "employee_id": "EMP001", "similarity": 0.9}]}
+
+
+def test_frames_run_in_the_stream_lane_with_their_own_deadline():
+    face_service = FakeFaceService()
+    verifier = StreamVerifier(
+        face_service, FakeMilvus(), FaceTracker(), 0.5, asyncio.Semaphore(1), frame_deadline_ms=1000
+    )
+
+    events = asyncio.run(verifier.process_frame(b"frame"))
+
+    assert [event["event"] for event in events] == ["match"]
+    assert all(admission.priority == PRIORITY_STREAM for admission in face_service.admissions)
+    assert all(admission.deadline is not None for admission in face_service.admissions)
+    assert current_admission.get() is None
+
+
+def test_shed_frame_reports_an_error_and_retries_the_track():
+    face_service = FakeFaceService(shed_embed=True)
+    verifier = StreamVerifier(face_service, FakeMilvus(), FaceTracker(), 0.5, asyncio.Semaphore(1))
+
+    events = asyncio.run(verifier.process_frame(b"frame"))
+
+    assert events == [{"event": "error", "frame": 1, "error": "Inference queue is full"}]
+    assert verifier.tracker.needs_recognition(verifier.tracker.tracks[1])
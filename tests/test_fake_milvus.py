@@ -0,0 +1,29 @@
+import importlib
+
+import pytest
+
+from benchmarks.fake_milvus import InMemoryMilvusDB, install_fake_milvus
+from core.config import settings
+from services.milvus_db import MilvusDB
+
+
+def test_fake_has_every_public_attribute_of_the_real_client():
+    fake = InMemoryMilvusDB()
+    missing = [name for name in vars(MilvusDB()) if not name.startswith("_") and not hasattr(fake, name)]
+    assert missing == []
+
+
+def test_container_starts_against_the_fake(monkeypatch):
+    pytest.importorskip("insightface")
+    pytest.importorskip("cv2")
+    # Pool mode leaves the models to the inference pool, so building the container loads none
+    monkeypatch.setattr(settings, "INFERENCE_MODE", "pool")
+    container_module = importlib.import_module("core.container")
+
+    container = container_module.Container()
+    monkeypatch.setattr(container.face_service, "warmup", lambda: None)
+    fake = install_fake_milvus(container, settings)
+
+    container.startup()
+
+    assert fake.connected
@@ -0,0 +1,81 @@
+import asyncio
+
+import numpy as np
+
+from benchmarks.fake_milvus import InMemoryMilvusDB
+from services.async_milvus_db import AsyncMilvusDB
+from services.gallery_index import GalleryIndex
+
+DIM = 8
+
+
+def _unit(axis: int) -> np.ndarray:
+    # Orthogonal faces, so each only ever matches itself
+    return np.eye(DIM, dtype=np.float32)[axis]
+
+
+def _synced_db() -> InMemoryMilvusDB:
+    db = InMemoryMilvusDB(dim=DIM)
+    db.connect("localhost", 19530)
+    db.attach_gallery(GalleryIndex(dim=DIM, max_staleness_s=300.0))
+    db.insert_embeddings(["alice"], [_unit(1)])
+    db.sync_gallery()
+    return db
+
+
+def _enroll_elsewhere(db: InMemoryMilvusDB, employee_id: str, embedding: np.ndarray) -> None:
+    # Another worker's enrollment reaches Milvus but not this process's mirror
+    gallery, db.gallery = db.gallery, None
+    db.insert_embeddings([employee_id], [embedding])
+    db.gallery = gallery
+
+
+def test_gallery_hit_is_served_from_the_mirror():
+    db = _synced_db()
+    result = db.search_similar(_unit(1), 0.5)
+    assert result["matched"] and result["employee_id"] == "alice"
+
+
+def test_gallery_miss_is_confirmed_in_milvus():
+    db = _synced_db()
+    _enroll_elsewhere(db, "bob", _unit(2))
+
+    assert db.gallery.search_batch([_unit(2)], 0.5)[0]["matched"] is False
+    result = db.search_similar(_unit(2), 0.5)
+    assert result["matched"] and result["employee_id"] == "bob"
+
+
+def test_gallery_miss_stands_when_milvus_is_unavailable():
+    db = _synced_db()
+    _enroll_elsewhere(db, "bob", _unit(2))
+    db.connected = False
+
+    result = db.search_similar(_unit(2), 0.5)
+    assert result["success"] and result["matched"] is False
+
+
+def test_use_gallery_false_skips_the_mirror():
+    db = _synced_db()
+    _enroll_elsewhere(db, "bob", _unit(2))
+    db.gallery.remove_employee("alice")
+
+    result = db.search_similar(_unit(1), 0.5, use_gallery=False)
+    assert result["matched"] and result["employee_id"] == "alice"
+
+
+def test_async_search_confirms_gallery_miss_in_milvus():
+    db = _synced_db()
+    _enroll_elsewhere(db, "bob", _unit(2))
+
+    async def scenario():
+        milvus = AsyncMilvusDB(
+            db, pool_size=1, max_inflight=2, coalesce_window_ms=1.0, max_coalesced=8, health_interval_s=60.0
+        )
+        try:
+            return await asyncio.gather(milvus.search_similar(_unit(1), 0.5), milvus.search_similar(_unit(2), 0.5))
+        finally:
+            await milvus.close()
+
+    alice, bob = asyncio.run(scenario())
+    assert alice["employee_id"] == "alice"
+    assert bob["matched"] and bob["employee_id"] == "bob"
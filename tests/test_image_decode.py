@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from services.image_decode import decode_image, jpeg_size  # noqa: E402
+
+
+def _encode(width: int, height: int, ext: str = ".jpg", params=()) -> bytes:
+    img = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    ok, buf = cv2.imencode(ext, img, list(params))
+    assert ok
+    return buf.tobytes()
+
+
+def test_jpeg_size_reads_baseline_header():
+    assert jpeg_size(_encode(640, 480)) == (640, 480)
+
+
+def test_jpeg_size_reads_progressive_header():
+    data = _encode(123, 77, params=(cv2.IMWRITE_JPEG_PROGRESSIVE, 1))
+    assert jpeg_size(data) == (123, 77)
+
+
+def test_jpeg_size_skips_app_segments_and_fill_bytes():
+    data = _encode(32, 16)
+    # An extra APP1 segment and padding 0xFF bytes before it, as some cameras write
+    app1 = b"\xff\xe1" + (8).to_bytes(2, "big") + b"Exif\x00\x00"
+    assert jpeg_size(data[:2] + b"\xff\xff" + app1 + data[2:]) == (32, 16)
+
+
+def test_jpeg_size_rejects_non_jpeg_and_truncated_data():
+    assert jpeg_size(_encode(32, 16, ".png")) is None
+    assert jpeg_size(b"") is None
+    assert jpeg_size(b"\xff\xd8") is None
+
+    data = _encode(32, 16)
+    sof = data.index(b"\xff\xc0")
+    assert jpeg_size(data[: sof + 6]) is None
+    assert jpeg_size(bytearray(data[: sof + 9])) == (32, 16)
+
+
+def test_decode_image_reduces_large_jpegs_and_reports_the_scale():
+    img, scale = decode_image(_encode(1600, 800), min_long_side=400)
+    assert img.shape[:2] == (200, 400)
+    assert scale == 4.0
+
+
+def test_decode_image_keeps_full_size_below_the_threshold():
+    img, scale = decode_image(_encode(300, 200), min_long_side=400)
+    assert img.shape[:2] == (200, 300)
+    assert scale == 1.0
@@ -0,0 +1,128 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from services.image_loader import ImageFetcher
+
+IMAGE = b"\xff\xd8\xff" + b"x" * 32
+
+
+def _image(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, content=IMAGE, headers={"Content-Type": "image/jpeg"})
+
+
+def test_redirect_target_gets_its_own_pool_and_is_remembered():
+    seen = []
+
+    def handler(request):
+        seen.append(str(request.url))
+        if request.url.host == "short.example":
+            return httpx.Response(302, headers={"Location": "https://cdn.example/face.jpg"})
+        return _image(request)
+
+    async def run():
+        fetcher = ImageFetcher(transport=httpx.MockTransport(handler))
+        first = await fetcher.fetch("https://short.example/abc", 1024)
+        second = await fetcher.fetch("https://short.example/abc", 1024)
+        hosts = list(fetcher._clients)
+        await fetcher.close()
+        return first, second, hosts, fetcher
+
+    first, second, hosts, fetcher = asyncio.run(run())
+
+    assert bytes(first.data) == IMAGE and bytes(second.data) == IMAGE
+    assert hosts == ["short.example", "cdn.example"]
+    # The second download goes straight to the cached target
+    assert seen == ["https://short.example/abc", "https://cdn.example/face.jpg", "https://cdn.example/face.jpg"]
+    assert fetcher.redirect_hits == 1
+
+
+def test_redirect_loop_is_rejected():
+    def handler(request):
+        return httpx.Response(302, headers={"Location": "/again"})
+
+    async def run():
+        fetcher = ImageFetcher(transport=httpx.MockTransport(handler))
+        try:
+            await fetcher.fetch("https://loop.example/start", 1024)
+        finally:
+            await fetcher.close()
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 400
+
+
+def test_unsupported_protocol_is_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        raise httpx.UnsupportedProtocol("Request URL has an unsupported protocol", request=request)
+
+    async def run():
+        fetcher = ImageFetcher(transport=httpx.MockTransport(handler), max_retries=2)
+        try:
+            await fetcher.fetch("https://a.example/face.jpg", 1024)
+        finally:
+            await fetcher.close()
+        return fetcher
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 400
+    assert len(calls) == 1
+
+
+def test_connect_error_is_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        if len(calls) == 1:
+            raise httpx.ConnectError("Connection refused", request=request)
+        return _image(request)
+
+    async def run():
+        fetcher = ImageFetcher(transport=httpx.MockTransport(handler), max_retries=2)
+        downloaded = await fetcher.fetch("https://a.example/face.jpg", 1024)
+        await fetcher.close()
+        return downloaded, fetcher
+
+    downloaded, fetcher = asyncio.run(run())
+
+    assert bytes(downloaded.data) == IMAGE
+    assert len(calls) == 2
+    assert fetcher.retries == 1
+
+
+def test_evicted_client_stays_open_until_its_download_finishes():
+    async def run():
+        release = asyncio.Event()
+
+        async def handler(request):
+            if request.url.host == "slow.example":
+                await release.wait()
+            return _image(request)
+
+        fetcher = ImageFetcher(transport=httpx.MockTransport(handler), max_hosts=1)
+        slow = asyncio.create_task(fetcher.fetch("https://slow.example/face.jpg", 1024))
+        await asyncio.sleep(0.01)
+        slow_client = fetcher._clients["slow.example"]
+
+        await fetcher.fetch("https://fast.example/face.jpg", 1024)
+        assert "slow.example" not in fetcher._clients
+        assert not slow_client.is_closed
+
+        release.set()
+        downloaded = await slow
+        closed_after = slow_client.is_closed
+        await fetcher.close()
+        return downloaded, closed_after
+
+    downloaded, closed_after = asyncio.run(run())
+
+    assert bytes(downloaded.data) == IMAGE
+    assert closed_after
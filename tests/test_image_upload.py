@@ -0,0 +1,72 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from services.image_loader import read_image_upload
+
+MAX_BYTES = 1024
+
+app = FastAPI()
+
+
+@app.post("/upload")
+async def upload(request: Request):
+    data, fields = await read_image_upload(request, MAX_BYTES)
+    return {"size": len(data), "fields": fields}
+
+
+client = TestClient(app)
+
+
+def test_multipart_image_and_fields_are_read():
+    response = client.post(
+        "/upload?tenant=acme", files={"image": ("face.jpg", b"x" * 100)}, data={"threshold": "0.5"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"size": 100, "fields": {"tenant": "acme", "threshold": "0.5"}}
+
+
+def test_multipart_without_image_is_rejected():
+    response = client.post("/upload", data={"threshold": "0.5"}, files={"other": ("a.txt", b"x")})
+    assert response.status_code == 422
+
+
+def test_oversized_multipart_is_rejected_by_content_length():
+    response = client.post("/upload", files={"image": ("face.jpg", b"x" * (MAX_BYTES + 70 * 1024))})
+    assert response.status_code == 413
+
+
+def test_oversized_chunked_multipart_stops_at_the_cap():
+    boundary = "cap"
+    head = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="face.jpg"\r\n\r\n'
+    ).encode()
+
+    def body():
+        yield head
+        for _ in range(1000):
+            yield b"x" * 1024
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post(
+        "/upload", content=body(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    assert response.status_code == 413
+
+
+def test_image_just_over_the_limit_is_rejected():
+    response = client.post("/upload", files={"image": ("face.jpg", b"x" * (MAX_BYTES + 1))})
+    assert response.status_code == 413
+
+
+def test_malformed_multipart_is_a_bad_request():
+    response = client.post(
+        "/upload", content=b"not multipart", headers={"Content-Type": "multipart/form-data"}
+    )
+    assert response.status_code == 400
+
+
+def test_raw_body_over_the_limit_is_rejected():
+    response = client.post(
+        "/upload", content=b"x" * (MAX_BYTES + 1), headers={"Content-Type": "application/octet-stream"}
+    )
+    assert response.status_code == 413
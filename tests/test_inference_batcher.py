@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from services.inference_batcher import InferenceBatcher
+
+
+def _batcher(run_batch, **kwargs):
+    options = {"max_batch_size": 8, "max_wait_ms": 20.0, "max_concurrent_batches": 1}
+    options.update(kwargs)
+    return InferenceBatcher(run_batch, **options)
+
+
+def test_item_failure_only_fails_its_own_request():
+    def run_batch(items):
+        return [ValueError(f"bad {item}") if item == "bad" else {"item": item} for item in items]
+
+    async def scenario():
+        batcher = _batcher(run_batch)
+        return await asyncio.gather(
+            batcher.submit("a"), batcher.submit("bad"), batcher.submit("b"), return_exceptions=True
+        )
+
+    good_a, bad, good_b = asyncio.run(scenario())
+    assert good_a == {"item": "a"}
+    assert good_b == {"item": "b"}
+    assert isinstance(bad, ValueError)
+
+
+def test_batch_failure_fails_every_request_in_it():
+    def run_batch(items):
+        raise RuntimeError("session crashed")
+
+    async def scenario():
+        batcher = _batcher(run_batch)
+        return await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    for result in asyncio.run(scenario()):
+        with pytest.raises(RuntimeError):
+            raise result
+
+
+def test_staggered_requests_share_one_batch_with_idle_executors():
+    sizes = []
+
+    def run_batch(items):
+        sizes.append(len(items))
+        return list(items)
+
+    async def submit_later(batcher, idx):
+        await asyncio.sleep(0.002 * idx)
+        return await batcher.submit(idx)
+
+    async def scenario():
+        batcher = _batcher(run_batch, max_wait_ms=50.0, max_concurrent_batches=4)
+        return await asyncio.gather(*(submit_later(batcher, idx) for idx in range(4)))
+
+    assert asyncio.run(scenario()) == list(range(4))
+    assert sizes == [4]
+
+
+def test_items_queued_behind_busy_executors_form_the_next_batch():
+    sizes = []
+
+    def run_batch(items):
+        sizes.append(len(items))
+        time.sleep(0.05)
+        return list(items)
+
+    async def scenario():
+        batcher = _batcher(run_batch, max_batch_size=4, max_wait_ms=0.0)
+        first = asyncio.ensure_future(batcher.submit("first"))
+        await asyncio.sleep(0.01)
+        # The only executor is busy, so these wait together rather than trickling out one by one
+        rest = await asyncio.gather(*(batcher.submit(idx) for idx in range(4)))
+        return await first, rest
+
+    assert asyncio.run(scenario()) == ("first", [0, 1, 2, 3])
+    assert sizes == [1, 4]
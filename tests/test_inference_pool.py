@@ -0,0 +1,72 @@
+import threading
+from multiprocessing.connection import Listener
+
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("insightface")
+
+from core.timing import add_stage_observer, remove_stage_observer  # noqa: E402
+from services.inference_pool import RemoteFaceService, _write_authkey  # noqa: E402
+
+
+def _serve(address: str, authkey: bytes, reply) -> Listener:
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+
+    def run():
+        conn = listener.accept()
+        while True:
+            try:
+                request_id, frames = conn.recv()
+            except (OSError, EOFError):
+                return
+            response = reply(frames)
+            if response is not None:
+                conn.send((request_id, *response))
+
+    threading.Thread(target=run, daemon=True).start()
+    return listener
+
+
+def test_reply_reads_the_per_launch_key_and_replays_worker_stages(tmp_path):
+    address = str(tmp_path / "pool.sock")
+    listener = _serve(address, _write_authkey(f"{address}.key"), lambda frames: (True, ["ok"], [("embed", 0.25)]))
+    stages = []
+    observer = lambda name, seconds: stages.append((name, seconds))  # noqa: E731
+    add_stage_observer(observer)
+    try:
+        assert RemoteFaceService(address, b"", timeout_s=1.0)._request([None]) == ["ok"]
+    finally:
+        remove_stage_observer(observer)
+        listener.close()
+    assert ("embed", 0.25) in stages
+    assert (tmp_path / "pool.sock.key").stat().st_mode & 0o777 == 0o600
+
+
+def test_missing_reply_times_out_with_503(tmp_path):
+    address = str(tmp_path / "pool.sock")
+    listener = _serve(address, b"secret", lambda frames: None)
+    try:
+        with pytest.raises(HTTPException) as exc_info:
+            RemoteFaceService(address, b"secret", timeout_s=0.2)._request([None])
+    finally:
+        listener.close()
+    assert exc_info.value.status_code == 503
+
+
+def test_lost_worker_is_reported_as_503(tmp_path):
+    address = str(tmp_path / "pool.sock")
+    listener = _serve(address, b"secret", lambda frames: (False, "Inference worker crashed", None))
+    try:
+        with pytest.raises(HTTPException) as exc_info:
+            RemoteFaceService(address, b"secret", timeout_s=1.0)._request([None])
+    finally:
+        listener.close()
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.detail == "Inference worker crashed"
+
+
+def test_unreachable_pool_is_reported_as_503(tmp_path):
+    with pytest.raises(HTTPException) as exc_info:
+        RemoteFaceService(str(tmp_path / "missing.sock"), b"secret", timeout_s=0.2)._request([None])
+    assert exc_info.value.status_code == 503
@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+
+from api.responses import failure_status_code
+from benchmarks.fake_milvus import InMemoryMilvusDB
+from services.employee_vectors import EmployeeVectorCache
+from services.gallery_index import GalleryIndex
+from services.milvus_db import MilvusDB, employee_page, parse_cursor
+
+
+def _pages(rows: list[tuple[int, str]], limit: int, batch_size: int):
+    # Drives employee_page the way list_employee_ids does, counting the rows each page reads
+    cursor = None
+    while True:
+        after = parse_cursor(cursor)
+        remaining = [row for row in rows if after is None or row[0] > after]
+        read = []
+
+        def batches():
+            for idx in range(0, len(remaining), batch_size):
+                batch = remaining[idx:idx + batch_size]
+                read.extend(batch)
+                yield batch
+
+        def seen_before(employee_ids):
+            return {emp for pk, emp in rows if after is not None and pk <= after and emp in employee_ids}
+
+        page, next_pk = employee_page(batches(), limit, seen_before)
+        yield page, len(read)
+        if next_pk is None:
+            return
+        cursor = str(next_pk)
+
+
+def test_pages_list_each_employee_once_in_first_enrollment_order():
+    rows = list(enumerate(["b", "a", "b", "c", "a", "d", "c", "e"], start=1))
+    pages = [page for page, _ in _pages(rows, limit=2, batch_size=3)]
+    assert pages == [["b", "a"], ["c", "d"], ["e"]]
+
+
+def test_each_page_reads_only_from_its_cursor():
+    # 1000 employees with 3 photos each, enrolled in rounds so every employee recurs across the collection
+    rows = [(pk, f"emp{(pk - 1) % 1000:04d}") for pk in range(1, 3001)]
+    batch_size, limit = 100, 50
+
+    pages = list(_pages(rows, limit=limit, batch_size=batch_size))
+    listed = [employee_id for page, _ in pages for employee_id in page]
+    assert listed == [f"emp{idx:04d}" for idx in range(1000)]
+
+    # Every page stops one batch past its last employee, instead of rescanning everything after the cursor
+    assert all(read <= limit + batch_size for _, read in pages[:-1])
+    assert sum(read for _, read in pages) <= len(rows) + len(pages) * batch_size
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        parse_cursor("EMP001")
+    assert parse_cursor(None) is None
+    assert parse_cursor("42") == 42
+
+
+def test_fake_listing_resumes_by_primary_key_with_counts():
+    db = InMemoryMilvusDB(dim=4)
+    vector = np.ones(4, dtype=np.float32) / 2
+    db.insert_embeddings(["b", "a", "b", "c", "a"], [vector] * 5)
+
+    first = db.list_employee_ids(limit=2, with_counts=True)
+    assert first["employee_ids"] == ["b", "a"]
+    assert first["vector_counts"] == {"b": 2, "a": 2}
+
+    second = db.list_employee_ids(first["next_cursor"], limit=2)
+    assert second == {"success": True, "employee_ids": ["c"], "next_cursor": None}
+    assert db.list_employee_ids("nope")["error"] == "Invalid cursor"
+
+
+def test_verify_during_raw_rebuild_uses_cache_or_mirror_and_reports_the_rest():
+    db = MilvusDB()
+    db.dim = 4
+    db.rebuilding = True
+    cache = EmployeeVectorCache(max_entries=10, ttl_s=60)
+    db.attach_vector_cache(cache)
+    probe = np.array([1, 0, 0, 0], dtype=np.float32)
+    cache.put((None, "cached"), probe.reshape(1, 4), cache.generation)
+
+    assert db.verify_employee(probe, "cached", 0.5)["matched"]
+
+    # The raw collection is released, so an uncached employee cannot be read from Milvus
+    missing = db.verify_employee(probe, "uncached", 0.5)
+    assert not missing["success"]
+    assert failure_status_code(missing) == 503
+
+    gallery = GalleryIndex(dim=4, max_staleness_s=60)
+    gallery.begin_sync()
+    gallery.finish_sync([1], ["uncached"], probe.reshape(1, 4))
+    db.attach_gallery(gallery)
+    assert db.verify_employee(probe, "uncached", 0.5)["matched"]
+
+
+class _Index:
+    field_name = "embedding"
+
+    def __init__(self, index_type: str, params: dict):
+        self.params = {"index_type": index_type, "metric_type": "IP", "params": params}
+
+
+class _IndexedCollection:
+    # Just enough of a pymilvus Collection for index_status and rebuild_index
+    def __init__(self, num_entities: int, index: _Index, on_create=None):
+        self.num_entities = num_entities
+        self.indexes = [index]
+        self.loaded = True
+        self._on_create = on_create
+
+    def release(self):
+        self.loaded = False
+
+    def drop_index(self):
+        self.indexes = []
+
+    def create_index(self, field_name, index_params):
+        if self._on_create is not None:
+            self._on_create()
+        self.indexes = [_Index(index_params["index_type"], index_params["params"])]
+
+    def load(self):
+        self.loaded = True
+
+
+_TIERS = [
+    {"min_rows": 0, "index_type": "FLAT"},
+    {"min_rows": 1000, "index_type": "IVF_FLAT", "params": {"nlist": 256}, "search_params": {"nprobe": 16}},
+    {"min_rows": 100_000, "index_type": "HNSW"},
+]
+
+
+def _indexed_db(collection: _IndexedCollection) -> MilvusDB:
+    db = MilvusDB(index_tiers=_TIERS)
+    db.dim = 4
+    db.connected = True
+    db.get_collection = lambda name=None: collection
+    return db
+
+
+def test_index_status_picks_the_tier_for_the_collection_size():
+    small = _indexed_db(_IndexedCollection(500, _Index("FLAT", {}))).index_status()
+    assert small["target"]["index_type"] == "FLAT"
+    assert not small["rebuild_recommended"]
+
+    grown = _indexed_db(_IndexedCollection(5000, _Index("FLAT", {}))).index_status()
+    assert grown["target"] == {
+        "min_rows": 1000, "index_type": "IVF_FLAT", "params": {"nlist": 256}, "search_params": {"nprobe": 16}
+    }
+    assert grown["rebuild_recommended"]
+
+    # Flattened build parameters reported by older servers still match the configured tier
+    current = _indexed_db(_IndexedCollection(5000, _Index("IVF_FLAT", {"nlist": "256"})))
+    current.get_collection().indexes[0].params = {"index_type": "IVF_FLAT", "nlist": "256"}
+    assert not current.index_status()["rebuild_recommended"]
+
+
+def test_reads_during_rebuild_are_reported_and_recover_after_it():
+    probe = np.array([1, 0, 0, 0], dtype=np.float32)
+    seen = []
+    collection = _IndexedCollection(5000, _Index("FLAT", {}))
+    db = _indexed_db(collection)
+    collection._on_create = lambda: seen.append((db.rebuilding, db.verify_employee(probe, "emp", 0.5)))
+    assert not db.rebuild_keeps_reads()
+
+    result = db.rebuild_index()
+
+    assert result["success"] and result["active"]["index_type"] == "IVF_FLAT"
+    rebuilding, verify = seen[0]
+    assert rebuilding
+    assert failure_status_code(verify) == 503
+    assert not db.rebuilding and collection.loaded
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("insightface")
+
+from services import onnx_models  # noqa: E402
+
+
+def test_cache_path_is_keyed_by_cpu(monkeypatch):
+    model = "/models/buffalo_l/det_10g.onnx"
+    local = onnx_models._cache_path("/cache", model, "CPUExecutionProvider", "all")
+    assert onnx_models.cpu_fingerprint() in local
+
+    monkeypatch.setattr(onnx_models, "cpu_fingerprint", lambda: "x86_64-other")
+    other = onnx_models._cache_path("/cache", model, "CPUExecutionProvider", "all")
+    assert other != local
+    assert other.startswith("/cache/buffalo_l/det_10g.CPUExecutionProvider.all.")
+
+
+class _Model:
+    def __init__(self, model_file):
+        self.model_file = model_file
+        self.session = "routing"
+
+
+def test_kept_models_get_tuned_sessions(monkeypatch):
+    def face_analysis_init(self, name, root, allowed_modules=None, **kwargs):
+        assert allowed_modules == ["detection", "recognition"]
+        self.models = {"detection": _Model("det.onnx"), "recognition": _Model("rec.onnx")}
+
+    created = []
+
+    def create_session(model_file, providers, options, concurrent_sessions):
+        created.append((model_file, providers, options, concurrent_sessions))
+        return f"tuned:{model_file}"
+
+    monkeypatch.setattr(onnx_models.FaceAnalysis, "__init__", face_analysis_init)
+    monkeypatch.setattr(onnx_models, "create_session", create_session)
+
+    models = onnx_models.FaceModels(
+        "buffalo_l",
+        providers=["CPUExecutionProvider"],
+        modules=["detection", "recognition"],
+        session_options={"graph_optimization": "extended"},
+        concurrent_sessions=2,
+    )
+
+    assert {task: model.session for task, model in models.models.items()} == {
+        "detection": "tuned:det.onnx",
+        "recognition": "tuned:rec.onnx",
+    }
+    assert created[0] == ("det.onnx", ["CPUExecutionProvider"], {"graph_optimization": "extended"}, 2)
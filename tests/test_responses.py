@@ -0,0 +1,88 @@
+import base64
+
+import numpy as np
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from api import responses
+from core.metrics import MetricsRegistry
+from services.inference_batcher import AdmissionRejected
+
+
+def _failures(registry: MetricsRegistry) -> dict[str, int]:
+    counts = {}
+    for line in registry.render().splitlines():
+        if line.startswith("face_request_failures_total{"):
+            label, value = line.split(" ")
+            counts[label.split('"')[1]] = int(value)
+    return counts
+
+
+def test_http_failures_are_counted_by_status(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(responses, "metrics", registry)
+
+    for status in (408, 413, 413, 400, 503, 500, 418):
+        responses.record_http_failure(HTTPException(status_code=status, detail="x"))
+
+    assert _failures(registry) == {
+        "download_timeout": 1,
+        "payload_too_large": 2,
+        "bad_request": 1,
+        "unavailable": 1,
+        "server_error": 1,
+        "other": 1,
+    }
+
+
+def test_shed_requests_are_not_counted_twice(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(responses, "metrics", registry)
+
+    responses.record_http_failure(AdmissionRejected(status_code=503, detail="Inference queue is full"))
+    assert _failures(registry) == {}
+
+
+def test_failure_payloads_map_to_categories_and_statuses():
+    assert responses.failure_status_code({"error": "No face detected"}) == 422
+    assert responses.failure_status_code({"error": "Image payload too large"}) == 413
+    assert responses.failure_category({"error": "Employee 7 not found"}) == "not_found"
+    assert responses.failure_category({"message": "Collection not found"}) == "collection_not_found"
+    assert responses.failure_category({}) == "other"
+
+
+_RESULT = {
+    "success": True,
+    "embedding": np.linspace(-1.0, 1.0, 8, dtype=np.float32),
+    "det_score": np.float32(0.875),
+    "bbox": [1.0, 2.0, 30.0, 40.0],
+}
+
+
+@pytest.mark.parametrize("output_format, dtype, atol", [
+    ("json", None, 1e-6),
+    ("base64", "<f4", 0.0),
+    ("base64_f16", "<f2", 1e-3),
+])
+def test_json_embedding_formats_round_trip(output_format, dtype, atol):
+    response = responses.embedding_response(_RESULT, output_format)
+    body = orjson.loads(response.body)
+
+    assert response.media_type == "application/json"
+    if dtype is None:
+        decoded = np.asarray(body["embedding"], dtype=np.float32)
+    else:
+        decoded = np.frombuffer(base64.b64decode(body["embedding"]), dtype=dtype).astype(np.float32)
+        assert body["embedding_dim"] == _RESULT["embedding"].size
+    np.testing.assert_allclose(decoded, _RESULT["embedding"], atol=atol)
+    assert body["det_score"] == 0.875 and body["bbox"] == _RESULT["bbox"]
+
+
+def test_binary_embedding_round_trips():
+    response = responses.embedding_response(_RESULT, "binary")
+
+    assert response.media_type == "application/octet-stream"
+    assert response.headers["X-Embedding-Dim"] == "8"
+    assert response.headers["X-Bbox"] == "1.0,2.0,30.0,40.0"
+    np.testing.assert_array_equal(np.frombuffer(response.body, dtype="<f4"), _RESULT["embedding"])
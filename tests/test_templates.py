@@ -0,0 +1,135 @@
+import numpy as np
+
+from services.milvus_db import MilvusDB, quote_expr
+from services.templates import exemplar_slots, merge_centroid, template_key
+
+
+def _unit(*values) -> np.ndarray:
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_merge_centroid_matches_the_mean_of_all_photos():
+    photos = [_unit(1, 0, 0), _unit(0, 1, 0), _unit(1, 1, 0), _unit(0, 0, 1)]
+
+    centroid, sum_norm = merge_centroid(None, 0.0, photos[:1])
+    for photo in photos[1:]:
+        centroid, sum_norm = merge_centroid(centroid, sum_norm, [photo])
+
+    expected, expected_norm = merge_centroid(None, 0.0, photos)
+    np.testing.assert_allclose(centroid, expected, atol=1e-6)
+    assert abs(sum_norm - expected_norm) < 1e-5
+    assert abs(float(np.linalg.norm(centroid)) - 1.0) < 1e-6
+
+
+def test_merge_centroid_of_opposite_photos_stays_finite():
+    centroid, sum_norm = merge_centroid(None, 0.0, [_unit(1, 0), _unit(-1, 0)])
+    assert sum_norm == 0.0
+    assert np.all(np.isfinite(centroid))
+
+
+def test_exemplar_slots_form_a_ring_of_the_latest_photos():
+    assert exemplar_slots(0, 2, 3) == [(0, 0), (1, 1)]
+    assert exemplar_slots(2, 2, 3) == [(2, 0), (0, 1)]
+    # More new photos than slots: only the newest ones are kept
+    assert exemplar_slots(1, 5, 3) == [(0, 2), (1, 3), (2, 4)]
+    assert exemplar_slots(4, 1, 0) == []
+
+
+class _Collection:
+    # Just enough of a pymilvus Collection for the template read-modify-write
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def query(self, expr, output_fields, consistency_level=None):
+        if expr.startswith("key in"):
+            return [row for row in self.rows if quote_expr(row["key"]) in expr]
+        return [row for row in self.rows if quote_expr(row["employee_id"]) in expr]
+
+    def upsert(self, data):
+        for key, employee_id, count, sum_norm, embedding in zip(*data):
+            self.rows = [row for row in self.rows if row["key"] != key]
+            self.rows.append({
+                "key": key, "employee_id": employee_id, "enroll_count": count,
+                "sum_norm": sum_norm, "embedding": embedding,
+            })
+
+
+def _db(raw: _Collection, templates: _Collection, template_repair: bool = False) -> MilvusDB:
+    db = MilvusDB(template_mode=True, max_exemplars=2, template_repair=template_repair)
+    db.get_collection = lambda name=None: templates if name == db.templates_name else raw
+    return db
+
+
+def test_lost_template_update_is_recomputed_from_raw_rows():
+    photos = [_unit(1, 0, 0), _unit(0, 1, 0), _unit(0, 0, 1)]
+    raw = _Collection([
+        {"id": pk, "employee_id": "alice", "embedding": photo.tolist()} for pk, photo in enumerate(photos, start=1)
+    ])
+    # Two workers built on the same one-photo template, and the later upsert dropped the other's photo
+    stale, stale_norm = merge_centroid(None, 0.0, photos[:2])
+    templates = _Collection([{
+        "key": template_key("alice", None), "employee_id": "alice", "enroll_count": 2,
+        "sum_norm": stale_norm, "embedding": stale.tolist(),
+    }])
+
+    db = _db(raw, templates)
+    db._repair_templates(templates, [(None, "alice")], flush=False)
+
+    centroid = next(row for row in templates.rows if row["key"] == template_key("alice", None))
+    expected, _ = merge_centroid(None, 0.0, photos)
+    assert centroid["enroll_count"] == 3
+    np.testing.assert_allclose(centroid["embedding"], expected, atol=1e-6)
+    # Exemplar ring holds the two newest photos in enrollment order: slots 0 and 1 after three photos
+    exemplars = {row["key"]: row["embedding"] for row in templates.rows if row["enroll_count"] == 0}
+    np.testing.assert_allclose(exemplars[template_key("alice", None, 1)], photos[1], atol=1e-6)
+    np.testing.assert_allclose(exemplars[template_key("alice", None, 0)], photos[2], atol=1e-6)
+
+
+def test_consistent_template_is_left_alone():
+    photo = _unit(1, 0)
+    raw = _Collection([{"id": 1, "employee_id": "bob", "embedding": photo.tolist()}])
+    centroid, norm = merge_centroid(None, 0.0, [photo])
+    templates = _Collection([{
+        "key": template_key("bob", None), "employee_id": "bob", "enroll_count": 1,
+        "sum_norm": norm, "embedding": centroid.tolist(),
+    }])
+    upserts = []
+    templates.upsert = upserts.append
+
+    _db(raw, templates)._repair_templates(templates, [(None, "bob")], flush=False)
+    assert upserts == []
+
+
+def test_raw_rows_are_only_rechecked_when_repair_is_enabled():
+    raw = _Collection([{"id": 1, "employee_id": "carol", "embedding": _unit(1, 0).tolist()}])
+    raw_queries = []
+    query = raw.query
+
+    def counting_query(expr, output_fields, consistency_level=None):
+        raw_queries.append(expr)
+        return query(expr, output_fields)
+
+    raw.query = counting_query
+
+    _db(raw, _Collection([]))._update_templates(["carol"], [_unit(1, 0)], [None], flush=False)
+    assert raw_queries == []
+
+    _db(raw, _Collection([]), template_repair=True)._update_templates(["carol"], [_unit(1, 0)], [None], flush=False)
+    assert len(raw_queries) == 1
+
+
+def test_refresh_builds_a_template_missing_for_stored_raw_rows():
+    photos = [_unit(1, 0), _unit(0, 1)]
+    raw = _Collection([
+        {"id": pk, "employee_id": "dave", "embedding": photo.tolist()} for pk, photo in enumerate(photos, start=1)
+    ])
+    templates = _Collection([])
+    db = _db(raw, templates)
+
+    assert db.refresh_templates(["dave", "dave"]) == {"success": True}
+    assert db.refresh_templates(["dave"]) == {"success": True}
+
+    centroid = next(row for row in templates.rows if row["key"] == template_key("dave", None))
+    assert centroid["enroll_count"] == 2
+    np.testing.assert_allclose(centroid["embedding"], merge_centroid(None, 0.0, photos)[0], atol=1e-6)
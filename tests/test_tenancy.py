@@ -0,0 +1,156 @@
+import re
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from api.tenancy import resolve_tenant
+from benchmarks.fake_milvus import InMemoryMilvusDB
+from core.config import settings
+from services import tenant_migration
+from services.milvus_db import TENANT_FIELD, MilvusDB, quote_expr
+
+DIM = 4
+
+
+def _vector(idx: int) -> np.ndarray:
+    return np.eye(DIM, dtype=np.float32)[idx]
+
+
+class _Iterator:
+    def __init__(self, rows: list[dict], batch_size: int):
+        self._batches = [rows[idx:idx + batch_size] for idx in range(0, len(rows), batch_size)]
+
+    def next(self) -> list[dict]:
+        return self._batches.pop(0) if self._batches else []
+
+    def close(self) -> None:
+        pass
+
+
+class _TenantCollection:
+    # Evaluates the filter shapes MilvusDB builds, so a clause that drops the tenant lets other tenants' rows through
+    def __init__(self):
+        self.rows: list[dict] = []
+
+    def insert(self, data):
+        employee_ids, embeddings, tenants = data
+        pks = []
+        for employee_id, embedding, tenant in zip(employee_ids, embeddings, tenants):
+            pk = len(self.rows) + 1
+            self.rows.append({"id": pk, "employee_id": employee_id, "embedding": embedding, TENANT_FIELD: tenant})
+            pks.append(pk)
+        return SimpleNamespace(primary_keys=pks, insert_count=len(pks))
+
+    def flush(self):
+        pass
+
+    def _match(self, expr: str | None) -> list[dict]:
+        rows = self.rows
+        for tenant in re.findall(rf"{TENANT_FIELD} == '([^']*)'", expr or ""):
+            rows = [row for row in rows if row[TENANT_FIELD] == tenant]
+        for employee_id in re.findall(r"employee_id == '([^']*)'", expr or ""):
+            rows = [row for row in rows if row["employee_id"] == employee_id]
+        for excluded in re.findall(r"employee_id not in \[([^\]]*)\]", expr or ""):
+            rows = [row for row in rows if quote_expr(row["employee_id"]) not in excluded]
+        for ids in re.findall(r"^id in \[([^\]]*)\]", expr or ""):
+            rows = [row for row in rows if str(row["id"]) in ids.split(", ")]
+        return rows
+
+    def query(self, expr, output_fields, consistency_level=None):
+        return self._match(expr)
+
+    def query_iterator(self, batch_size, expr, output_fields):
+        return _Iterator(self._match(expr), batch_size)
+
+    def delete(self, expr):
+        gone = {row["id"] for row in self._match(expr)}
+        self.rows = [row for row in self.rows if row["id"] not in gone]
+
+    def search(self, data, anns_field, param, limit, expr, output_fields):
+        rows = self._match(expr)
+        results = []
+        for query in data:
+            scored = sorted(rows, key=lambda row: -float(np.dot(row["embedding"], query)))[:limit]
+            results.append([
+                SimpleNamespace(distance=float(np.dot(row["embedding"], query)), entity=row) for row in scored
+            ])
+        return results
+
+
+@pytest.fixture
+def db():
+    db = MilvusDB(multi_tenant=True)
+    db.dim = DIM
+    db.connected = True
+    collection = _TenantCollection()
+    db.get_collection = lambda name=None: collection
+    # The same employee ID exists in both tenants with different faces
+    db.insert_embeddings(["emp1", "emp2"], [_vector(0), _vector(1)], tenants=["acme", "acme"])
+    db.insert_embeddings(["emp1", "emp3"], [_vector(2), _vector(3)], tenants=["globex", "globex"])
+    return db
+
+
+def test_search_only_sees_the_callers_tenant(db):
+    assert db.search_similar(_vector(3), 0.5, tenant="acme")["matched"] is False
+    match = db.search_similar(_vector(3), 0.5, tenant="globex")
+    assert match["matched"] and match["employee_id"] == "emp3"
+
+
+def test_verify_compares_against_the_tenants_own_photos(db):
+    assert db.verify_employee(_vector(0), "emp1", 0.5, tenant="acme")["matched"]
+    assert not db.verify_employee(_vector(0), "emp1", 0.5, tenant="globex")["matched"]
+    assert not db.verify_employee(_vector(3), "emp3", 0.5, tenant="acme")["success"]
+
+
+def test_listing_and_delete_are_scoped(db):
+    assert db.list_employee_ids(tenant="acme")["employee_ids"] == ["emp1", "emp2"]
+    assert db.list_employee_ids(tenant="globex")["employee_ids"] == ["emp1", "emp3"]
+
+    assert db.delete_by_employee_id("emp1", tenant="acme")["success"]
+    assert db.list_employee_ids(tenant="acme")["employee_ids"] == ["emp2"]
+    assert db.verify_employee(_vector(2), "emp1", 0.5, tenant="globex")["matched"]
+
+
+def test_insert_without_a_tenant_is_refused(db):
+    assert db.insert_embeddings(["emp9"], [_vector(0)], tenants=[None]) == {
+        "success": False, "error": "Tenant is required"
+    }
+
+
+def test_missing_tenant_is_rejected_with_400(monkeypatch):
+    monkeypatch.setattr(settings, "MULTI_TENANT", True)
+    with pytest.raises(HTTPException) as exc:
+        resolve_tenant(None)
+    assert exc.value.status_code == 400
+    assert resolve_tenant("acme") == "acme"
+
+    monkeypatch.setattr(settings, "MULTI_TENANT", False)
+    assert resolve_tenant(None) is None
+    with pytest.raises(HTTPException):
+        resolve_tenant("acme")
+
+
+def test_migration_copies_rows_with_their_tenant(monkeypatch):
+    source_rows = [
+        {"employee_id": "emp1", "embedding": _vector(0)},
+        {"employee_id": "emp2", "embedding": _vector(1)},
+        {"employee_id": "emp3", "embedding": _vector(2)},
+    ]
+    source = SimpleNamespace(
+        load=lambda: None,
+        query_iterator=lambda batch_size, output_fields: _Iterator(source_rows, batch_size),
+    )
+    monkeypatch.setattr(tenant_migration, "Collection", lambda name, using: source)
+    monkeypatch.setattr(
+        tenant_migration, "utility", SimpleNamespace(has_collection=lambda name, using: name == "legacy")
+    )
+    target = InMemoryMilvusDB(dim=DIM, multi_tenant=True)
+    target.collection_name = "faces_mt"
+
+    result = tenant_migration.migrate("legacy", target, {"emp1": "acme", "emp2": "globex"}, None, batch_size=2)
+
+    assert result["success"] and result["copied"] == 2
+    assert result["unmapped_employees"] == ["emp3"]
+    assert sorted((row[0], row[2]) for _, row in target._visible(None)) == [("emp1", "acme"), ("emp2", "globex")]
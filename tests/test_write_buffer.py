@@ -0,0 +1,148 @@
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks.fake_milvus import InMemoryMilvusDB
+from services.milvus_db import MilvusDB
+from services.write_buffer import PendingWrite, WriteBehindBuffer
+
+
+def _vector(idx: int, dim: int = 4) -> np.ndarray:
+    return np.eye(dim, dtype=np.float32)[idx]
+
+
+def _insert(employee_id: str, idx: int = 0) -> PendingWrite:
+    return PendingWrite("insert", employee_id, embedding=_vector(idx))
+
+
+def _buffer(**kwargs) -> WriteBehindBuffer:
+    options = {"max_batch": 100, "max_delay_ms": 1, "max_pending": 1000, "visibility_grace_s": 60}
+    return WriteBehindBuffer(**{**options, **kwargs})
+
+
+def test_writes_arriving_during_a_commit_form_the_next_group():
+    groups = []
+
+    async def run():
+        buffer = _buffer(max_batch=2)
+
+        async def commit(writes):
+            groups.append([write.employee_id for write in writes])
+            if len(groups) == 1:
+                # Arrives while the first group is being applied
+                buffer.add(_insert("c"))
+                buffer.add(_insert("d"))
+                buffer.add(_insert("e"))
+            await asyncio.sleep(0)
+            return {"success": True, "applied": len(writes)}
+
+        buffer.bind(commit)
+        buffer.add(_insert("a"))
+        buffer.add(_insert("b"))
+        await buffer.drain()
+        return buffer
+
+    buffer = asyncio.run(run())
+
+    assert groups == [["a", "b"], ["c", "d"], ["e"]]
+    assert buffer.stats()["committed"] == 5
+    assert len(buffer) == 0
+
+
+def test_delete_masks_earlier_inserts_but_not_later_ones():
+    async def run():
+        buffer = _buffer(max_delay_ms=60_000)
+        buffer.bind(None)
+        buffer.add(_insert("a", 0))
+        buffer.add(_insert("b", 1))
+        buffer.add(PendingWrite("delete", "a"))
+        buffer.add(_insert("a", 2))
+        view = buffer.view(None)
+        buffer._flush_handle.cancel()
+        return view
+
+    view = asyncio.run(run())
+
+    assert view.employee_ids == ["b", "a"]
+    assert view.masked == {"a"}
+    np.testing.assert_array_equal(view.vectors_for("a"), _vector(2).reshape(1, 4))
+
+
+def test_overlay_is_scoped_by_tenant():
+    async def run():
+        buffer = _buffer(max_delay_ms=60_000)
+        buffer.bind(None)
+        buffer.add(PendingWrite("insert", "a", "acme", _vector(0)))
+        buffer.add(PendingWrite("insert", "b", "other", _vector(1)))
+        view = buffer.view("acme")
+        buffer._flush_handle.cancel()
+        return view
+
+    assert asyncio.run(run()).employee_ids == ["a"]
+
+
+def test_committed_writes_leave_the_overlay_after_the_grace_period():
+    async def commit(writes):
+        return {"success": True, "applied": len(writes)}
+
+    async def run(grace_s):
+        buffer = _buffer(visibility_grace_s=grace_s)
+        buffer.bind(commit)
+        buffer.add(_insert("a"))
+        await buffer.drain()
+        time.sleep(0.02)
+        return buffer.view(None)
+
+    assert asyncio.run(run(60)).employee_ids == ["a"]
+    assert asyncio.run(run(0.01)) is None
+
+
+def test_retry_after_a_template_failure_does_not_reinsert_raw_rows():
+    calls = []
+
+    async def run():
+        buffer = _buffer()
+
+        async def commit(writes):
+            calls.append([(write.kind, write.employee_id) for write in writes])
+            if len(calls) == 1:
+                return {"success": False, "error": "templates down", "applied": 1, "raw_applied": 1}
+            return {"success": True, "applied": len(writes)}
+
+        buffer.bind(commit)
+        buffer.add(PendingWrite("delete", "x"))
+        buffer.add(_insert("a"))
+        buffer.add(_insert("b"))
+        # Still scored while its template is pending
+        view = buffer.view(None)
+        await buffer.drain()
+        return buffer, view
+
+    buffer, view = asyncio.run(run())
+
+    assert calls == [
+        [("delete", "x"), ("insert", "a"), ("insert", "b")],
+        [("template", "a"), ("insert", "b")],
+    ]
+    assert view.employee_ids == ["a", "b"]
+    assert buffer.view(None).employee_ids == ["a", "b"]
+
+
+def test_apply_writes_reports_raw_rows_stored_before_a_template_failure():
+    db = InMemoryMilvusDB(dim=4)
+    db.connect("localhost", 19530)
+    templated = []
+
+    def insert_embeddings(employee_ids, embeddings, flush=True, tenants=None):
+        return {"success": False, "error": "templates down", "raw_inserted": True, "insert_count": len(employee_ids)}
+
+    db.insert_embeddings = insert_embeddings
+    db._update_templates = lambda employee_ids, embeddings, tenants, flush: templated.extend(employee_ids)
+
+    result = MilvusDB.apply_writes(db, [_insert("a"), _insert("b")])
+    assert result == {"success": False, "error": "templates down", "applied": 0, "raw_applied": 2}
+
+    result = MilvusDB.apply_writes(db, [PendingWrite("template", "a", embedding=_vector(0))])
+    assert result["success"] and result["applied"] == 1
+    assert templated == ["a"]